@@ -40,8 +40,9 @@ def suppress_stderr():
         os.close(original_stderr_fd)
 import time
 import logging
-from typing import Dict, Any, Optional, List, Tuple
-from collections import deque
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, List, Tuple
 from scipy import signal
 import cv2
 import numpy as np
@@ -49,6 +50,32 @@ import mediapipe as mp
 from langgraph.graph import StateGraph
 from typing_extensions import TypedDict
 
+from agent_ipc import IpcWriter
+import breathing_rate
+from detection_cadence import CADENCE_ADAPTIVE, FACE_HZ, POSE_HZ, ModelCadence, as_face_results, as_pose_results
+from geometry_kernels import FACIAL_KEYS, measure_frame
+from landmark_arrays import FACE_REGION_COUNTS, POSE_INDEX, POSE_NAMES, face_subset, landmark_array
+from ring_buffer import RingBuffer
+from window_columns import (BREATHING_COLUMNS, EYE_COLUMNS, FACIAL_COLUMNS, POSTURE_COLUMNS, WindowColumns,
+                            present_columns)
+from window_stats import WindowStats
+from frame_sources import (
+    FrameSource,
+    JpegFileSource,
+    LiveFrameSource,
+    MailboxSource,
+    ReplaySource,
+    SharedMemorySource,
+)
+from frame_transport import (
+    FRAME_TRANSPORT,
+    Frame,
+    FrameAgeStats,
+    FrameMailbox,
+    ProcessingRate,
+    parse_resolution,
+)
+
 logging.getLogger('mediapipe').setLevel(logging.CRITICAL)
 logging.getLogger('tensorflow').setLevel(logging.CRITICAL)
 logging.getLogger('absl').setLevel(logging.CRITICAL)
@@ -102,12 +129,23 @@ with suppress_stderr():
     mp_drawing = mp.solutions.drawing_utils
     mp_drawing_styles = mp.solutions.drawing_styles
 
-# Module-level singletons to avoid storing heavy objects in LangGraph state
-_BREATHING_TRACKER = None
-_FEATURE_EXTRACTOR = None
-_ML_AGGREGATOR = None
-_POSE_MODEL = None
-_FACE_MODEL = None
+# Heavy per-stream objects (models, trackers) live on an AgentPipeline, never in LangGraph state
+
+# "streaming": band-pass each new sample with carried second-order-section state (O(1) per frame) and estimate
+# the BPM on a cadence from those samples, decimated (breathing_rate.py); "filtfilt": re-filter the whole horizon
+# and re-estimate at 30 fps every frame. filtfilt stays the default: the shipped stress model was trained on its
+# breathing features, and streaming shifts their distribution, so switch only with a model retrained on it
+BREATHING_FILTER = os.getenv("BREATHING_FILTER", "filtfilt").lower()
+# Seconds between BPM re-estimates in streaming mode (filtfilt mode re-estimates every frame)
+BREATHING_BPM_INTERVAL_S = float(os.getenv("BREATHING_BPM_INTERVAL_S", "0.5"))
+# Streaming mode: seconds of filtered signal each estimate looks at, and the rate it is decimated to
+BREATHING_BPM_HORIZON_S = float(os.getenv("BREATHING_BPM_HORIZON_S", "10"))
+BREATHING_BPM_RATE_HZ = float(os.getenv("BREATHING_BPM_RATE_HZ", "5"))
+# "exact": reduce the buffered window's columns when it closes; "online": update streaming accumulators per frame
+# (window_stats.py) so a close costs the same at any window length, with sketch-based medians and IQRs approximate
+WINDOW_STATS = os.getenv("WINDOW_STATS", "exact").lower()
+# Online mode: relative error of the quantile sketches
+WINDOW_STATS_ACCURACY = float(os.getenv("WINDOW_STATS_ACCURACY", "0.002"))
 
 
 class BreathingTracker:
@@ -122,7 +160,11 @@ class BreathingTracker:
                  min_amplitude: float = 0.0001,
                  min_cycle_time: float = 1.2,
                  max_cycle_time: float = 12.0,
-                 smoothing_window: int = 3):
+                 smoothing_window: int = 3,
+                 filter_mode: str = BREATHING_FILTER,
+                 bpm_interval: float = BREATHING_BPM_INTERVAL_S,
+                 bpm_horizon: float = BREATHING_BPM_HORIZON_S,
+                 bpm_rate: float = BREATHING_BPM_RATE_HZ):
         self.fps = fps
         self.window_seconds = window_seconds
         self.window_frames = int(window_seconds * fps)
@@ -130,18 +172,21 @@ class BreathingTracker:
         self.min_cycle_time = min_cycle_time
         self.max_cycle_time = max_cycle_time
         self.smoothing_window = smoothing_window
-
-        # Data storage for multiple signals
-        self.timestamps = deque(maxlen=self.window_frames * 2)
-        self.head_y = deque(maxlen=self.window_frames * 2)
-        self.shoulder_y = deque(maxlen=self.window_frames * 2)
-        self.torso_center_y = deque(maxlen=self.window_frames * 2)
-        self.combined_signal = deque(maxlen=self.window_frames * 2)
-        self.filtered_signal = deque(maxlen=self.window_frames * 2)
-
-        # Peak detection for breathing cycles
-        self.peaks = deque(maxlen=50)
-        self.valleys = deque(maxlen=50)
+        self.bpm_horizon_frames = int(bpm_horizon * fps)
+        self.bpm_rate = bpm_rate
+
+        # Data storage for multiple signals (``last(n)`` is a view of the newest n samples, no copy)
+        history = max(self.window_frames * 2, self.bpm_horizon_frames)
+        self.timestamps = RingBuffer(history)
+        self.head_y = RingBuffer(history)
+        self.shoulder_y = RingBuffer(history)
+        self.torso_center_y = RingBuffer(history)
+        self.combined_signal = RingBuffer(history)
+        self.filtered_signal = RingBuffer(history)
+
+        # Peak detection for breathing cycles: times of the last peaks and valleys
+        self.peaks = RingBuffer(50)
+        self.valleys = RingBuffer(50)
         self.last_peak_time = 0.0
         self.last_valley_time = 0.0
 
@@ -160,7 +205,13 @@ class BreathingTracker:
 
         # Filtering params for robust BPM (band 0.05–0.5 Hz ≈ 3–30 BPM)
         self._bp_b, self._bp_a = None, None
+        self._sos = None
         self._last_filter_fs = None
+        self.filter_mode = filter_mode
+        self.bpm_interval = bpm_interval
+        self._zi: Optional[List[List[float]]] = None  # streaming filter state, one [z0, z1] per section
+        self._next_bpm_time: Optional[float] = None
+        self._bpm_estimate = (0.0, 0.0)
 
     def update(self, timestamp: float, nose: Tuple[float, float, float],
                left_shoulder: Tuple[float, float, float],
@@ -178,6 +229,7 @@ class BreathingTracker:
             self.valleys.clear()
             self.is_calibrated = False
             self.calibration_frames = 0
+            self._reset_filter()
 
         # Calculate key points
         head_y = nose[1]
@@ -216,23 +268,27 @@ class BreathingTracker:
         if len(self.combined_signal) < 30:
             return {"bpm": 0.0, "confidence": 0.0, "calibrated": True, "status": "insufficient_data"}
 
-        # Filtering for robustness (limit horizon to last window_seconds)
-        recent_sig = list(self.combined_signal)[-int(self.fps):]
-        smoothed_signal = self._smooth_signal(recent_sig)
-        filtered_sig = self._bandpass_filter(list(self.combined_signal)[-self.window_frames:])
-        current_filtered = filtered_sig[-1] if filtered_sig else (smoothed_signal[-1] if smoothed_signal else 0.0)
-        self.filtered_signal.append(current_filtered)
-
-        # Peak/valley detection
-        self._detect_breathing_cycles(timestamp, current_filtered)
-
-        # BPM estimates
-        bpm_peaks, conf_peaks = self._calculate_bpm(timestamp)
-        bpm_ac, conf_ac = self._estimate_bpm_autocorr()
-        if bpm_ac > 0 and (conf_ac >= conf_peaks or bpm_peaks == 0):
-            bpm, confidence = bpm_ac, conf_ac
+        if self.filter_mode == "streaming":
+            self.filtered_signal.append(self._stream_filter(combined_signal))
+            if self._next_bpm_time is None or timestamp >= self._next_bpm_time:
+                self._bpm_estimate = self._estimate_bpm_decimated()
+                self._next_bpm_time = timestamp + self.bpm_interval
+            bpm, confidence = self._bpm_estimate
         else:
-            bpm, confidence = bpm_peaks, conf_peaks
+            # Filtering for robustness (limit horizon to last window_seconds)
+            filtered_sig = self._bandpass_filter(self.combined_signal.last(self.window_frames))
+            current_filtered = float(filtered_sig[-1]) if len(filtered_sig) else 0.0
+            self.filtered_signal.append(current_filtered)
+
+            # Peak/valley detection
+            self._detect_breathing_cycles(timestamp, current_filtered)
+
+            bpm_peaks, conf_peaks = self._calculate_bpm(timestamp)
+            bpm_ac, conf_ac = self._estimate_bpm_autocorr()
+            if bpm_ac > 0 and (conf_ac >= conf_peaks or bpm_peaks == 0):
+                bpm, confidence = bpm_ac, conf_ac
+            else:
+                bpm, confidence = bpm_peaks, conf_peaks
 
         self.current_bpm = bpm
         self.confidence = confidence
@@ -265,41 +321,42 @@ class BreathingTracker:
     def _detect_breathing_cycles(self, timestamp: float, current_signal: float):
         if len(self.filtered_signal) < 3:
             return
-        signals = list(self.filtered_signal)[-3:]
+        signals = self.filtered_signal.last(3).tolist()
         if len(signals) >= 3 and signals[1] > signals[0] and signals[1] > signals[2]:
             if (timestamp - self.last_peak_time > self.min_cycle_time / 2 and abs(signals[1]) > self.min_amplitude):
-                self.peaks.append({"time": timestamp, "value": signals[1]})
+                self.peaks.append(timestamp)
                 self.last_peak_time = timestamp
                 self.movement_direction = -1
         elif len(signals) >= 3 and signals[1] < signals[0] and signals[1] < signals[2]:
             if (timestamp - self.last_valley_time > self.min_cycle_time / 2 and abs(signals[1]) > self.min_amplitude):
-                self.valleys.append({"time": timestamp, "value": signals[1]})
+                self.valleys.append(timestamp)
                 self.last_valley_time = timestamp
                 self.movement_direction = 1
 
     def _calculate_bpm(self, timestamp: float) -> Tuple[float, float]:
-        recent_peaks = [p for p in self.peaks if timestamp - p["time"] <= self.window_seconds]
-        recent_valleys = [v for v in self.valleys if timestamp - v["time"] <= self.window_seconds]
-        if len(recent_peaks) < 2 or len(recent_valleys) < 2:
-            return 0.0, 0.0
-        peak_times = [p["time"] for p in recent_peaks]
-        peak_intervals = [peak_times[i] - peak_times[i-1] for i in range(1, len(peak_times))]
-        valley_times = [v["time"] for v in recent_valleys]
-        valley_intervals = [valley_times[i] - valley_times[i-1] for i in range(1, len(valley_times))]
-        all_intervals = peak_intervals + valley_intervals
-        valid_intervals = [iv for iv in all_intervals if self.min_cycle_time <= iv <= self.max_cycle_time]
-        if not valid_intervals:
+        peaks, valleys = self.peaks.last(), self.valleys.last()
+        recent_peaks = peaks[timestamp - peaks <= self.window_seconds]
+        recent_valleys = valleys[timestamp - valleys <= self.window_seconds]
+        return breathing_rate.interval_bpm(recent_peaks, recent_valleys, self.min_cycle_time, self.max_cycle_time)
+
+    def _estimate_bpm_decimated(self) -> Tuple[float, float]:
+        """FFT autocorrelation over the last ``bpm_horizon`` of the signal, decimated to ``bpm_rate``.
+
+        Only runs on re-estimate frames, so those get the zero-phase refinement (``sosfiltfilt`` over the horizon)
+        instead of the causal per-frame samples and their phase lag. Falls back to ``find_peaks`` cycle intervals.
+        """
+        n = min(len(self.combined_signal), len(self.timestamps), self.bpm_horizon_frames)
+        if n < int(self.fps * 3):
             return 0.0, 0.0
-        avg_cycle = sum(valid_intervals) / len(valid_intervals)
-        bpm = 60.0 / avg_cycle
-        if len(valid_intervals) > 1:
-            interval_std = (sum((x - avg_cycle) ** 2 for x in valid_intervals) / len(valid_intervals)) ** 0.5
-            consistency = max(0, 1 - (interval_std / avg_cycle))
-            data_compl = min(1.0, len(valid_intervals) / 3)
-            conf = consistency * data_compl
-        else:
-            conf = 0.3
-        return bpm, conf
+        self._design_filter()
+        filtered = signal.sosfiltfilt(self._sos, self.combined_signal.last(n))
+        x, fs = breathing_rate.decimate(filtered, self.fps, self.bpm_rate)
+        autocorr = breathing_rate.autocorr_bpm(x, fs, self.min_cycle_time, self.max_cycle_time)
+        if autocorr[0] > 0:
+            return autocorr
+        # Cycle counting only as a fallback: with the longer horizon the autocorrelation is the more accurate
+        t, _ = breathing_rate.decimate(self.timestamps.last(n), self.fps, self.bpm_rate)
+        return breathing_rate.cycle_bpm(t, x, fs, self.min_cycle_time, self.max_cycle_time, self.min_amplitude)
 
     def _estimate_bpm_autocorr(self) -> Tuple[float, float]:
         try:
@@ -307,9 +364,8 @@ class BreathingTracker:
             if n < int(self.fps * 3):
                 return 0.0, 0.0
             horizon = int(min(n, self.fps * self.window_seconds))
-            raw_sig = np.array(list(self.combined_signal)[-horizon:], dtype=np.float32)
-            sig = self._bandpass_filter(raw_sig.tolist())
-            sig = np.array(sig, dtype=np.float32)
+            sig = self._bandpass_filter(self.combined_signal.last(horizon).astype(np.float32))
+            sig = np.asarray(sig, dtype=np.float32)
             if np.allclose(sig, sig[0]):
                 return 0.0, 0.0
             sig = sig - np.mean(sig)
@@ -336,22 +392,46 @@ class BreathingTracker:
         except Exception:
             return 0.0, 0.0
 
-    def _bandpass_filter(self, sig: List[float]) -> List[float]:
+    def _design_filter(self) -> None:
+        fs = float(self.fps)
+        if self._bp_b is None or self._last_filter_fs != fs:
+            low = 0.05 / (fs / 2.0)
+            high = 1.0 / (fs / 2.0)
+            low = max(1e-6, min(low, 0.99))
+            high = max(low + 1e-6, min(high, 0.99))
+            self._bp_b, self._bp_a = signal.butter(2, [low, high], btype='band')
+            # Same band as second-order sections: well conditioned at this low a cutoff, and steppable per sample
+            self._sos = signal.butter(2, [low, high], btype='band', output='sos')
+            self._last_filter_fs = fs
+            self._zi = None
+
+    def _reset_filter(self) -> None:
+        self._zi = None
+        self._next_bpm_time = None
+        self._bpm_estimate = (0.0, 0.0)
+
+    def _stream_filter(self, x: float) -> float:
+        """One causal band-pass step (transposed direct form II per section) with the state carried over."""
+        self._design_filter()
+        if self._zi is None:
+            # Steady state for a constant input at x, so the filter starts without a step transient
+            self._zi = (signal.sosfilt_zi(self._sos) * x).tolist()
+        y = x
+        for (b0, b1, b2, _, a1, a2), z in zip(self._sos.tolist(), self._zi):
+            x = y
+            y = b0 * x + z[0]
+            z[0] = b1 * x - a1 * y + z[1]
+            z[1] = b2 * x - a2 * y
+        return y
+
+    def _bandpass_filter(self, sig: np.ndarray) -> np.ndarray:
         try:
-            if not sig or len(sig) < int(self.fps * 2):
+            if len(sig) < int(self.fps * 2):
                 return sig
-            fs = float(self.fps)
-            if self._bp_b is None or self._last_filter_fs != fs:
-                low = 0.05 / (fs / 2.0)
-                high = 1.0 / (fs / 2.0)
-                low = max(1e-6, min(low, 0.99))
-                high = max(low + 1e-6, min(high, 0.99))
-                self._bp_b, self._bp_a = signal.butter(2, [low, high], btype='band')
-                self._last_filter_fs = fs
-            filtered = signal.filtfilt(self._bp_b, self._bp_a, np.asarray(sig, dtype=np.float32))
-            return filtered.tolist()
+            self._design_filter()
+            return signal.filtfilt(self._bp_b, self._bp_a, np.asarray(sig, dtype=np.float32))
         except Exception:
-            return self._smooth_signal(sig)
+            return np.asarray(self._smooth_signal(sig.tolist()))
         
 
 class MLDataAggregator:
@@ -360,20 +440,25 @@ class MLDataAggregator:
     Reduces dimensionality and focuses on meaningful patterns.
     """
     
-    def __init__(self, window_seconds=5, fps=30.0):
+    def __init__(self, window_seconds=5, fps=30.0, stats_mode: str = WINDOW_STATS):
         self.window_seconds = window_seconds
         self.fps = fps
         self.window_size = int(window_seconds * fps)  # Still use for maxlen, but not for export trigger
-        self.data_buffer = deque(maxlen=self.window_size)
+        self.stats_mode = stats_mode
+        # One row per frame, one column per value the aggregation reads (see window_columns);
+        # in online mode each row also updates the window's accumulators (see window_stats)
+        stats = WindowStats(WINDOW_STATS_ACCURACY) if stats_mode == "online" else None
+        self.data_buffer = WindowColumns(self.window_size, stats)
         # Maintain a longer rolling buffer for eye openness to smooth blink rate (10s)
-        self.eye_roll_buffer = deque(maxlen=int(10 * fps))  # stores (timestamp, avg_openness)
+        self.eye_roll_times = RingBuffer(int(10 * fps))
+        self.eye_roll_openness = RingBuffer(int(10 * fps))  # avg openness
         self.export_counter = 0
         self.last_export_time = None
         
     def add_frame_data(self, frame_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Add frame data and return aggregated features if window is complete."""
-        import time
-        current_time = time.time()
+        # Window timing follows frame capture timestamps, so replayed recordings export identically
+        current_time = frame_data.get("timestamp") or time.time()
         
         self.data_buffer.append(frame_data)
         # Extend rolling eye buffer per frame to improve blink frequency stability
@@ -382,7 +467,8 @@ class MLDataAggregator:
                 ef = frame_data.get("ml_features", {}).get("eye_features", {})
                 if ef:
                     avg_open = (ef.get("left_eye_openness", 1.0) + ef.get("right_eye_openness", 1.0)) / 2.0
-                    self.eye_roll_buffer.append((frame_data.get("timestamp", current_time), float(avg_open)))
+                    self.eye_roll_times.append(frame_data.get("timestamp", current_time))
+                    self.eye_roll_openness.append(float(avg_open))
         except Exception:
             pass
         
@@ -403,80 +489,233 @@ class MLDataAggregator:
     
     def _aggregate_window(self) -> Dict[str, Any]:
         """Aggregate data from the current window into ML features."""
-        breathing_data: List[Dict[str, Any]] = []
-        facial_features: List[Dict[str, Any]] = []
-        eye_features: List[Dict[str, Any]] = []
-        posture_features: List[Dict[str, Any]] = []
-        
-        for frame in self.data_buffer:
-            ml_features = frame.get("ml_features", {})
-            if not ml_features:
-                continue
-            # Always collect per-modality data when present
-            if frame.get("has_face", False):
-                facial_features.append(ml_features.get("facial_features", {}))
-                eye_features.append(ml_features.get("eye_features", {}))
-            if frame.get("has_pose", False):
-                posture_features.append(ml_features.get("posture_features", {}))
-            # Collect breathing only when the breathing sub-feature is calibrated or has bpm>0
-            bf = ml_features.get("breathing_features", {})
-            if bf and (frame.get("breathing", {}).get("calibrated", False) or bf.get("bpm", 0) > 0):
-                breathing_data.append(bf)
+        if self.data_buffer.stats is not None:
+            return self._aggregate_online(self.data_buffer.stats)
+        columns = self.data_buffer.columns()
+        face, pose, breathing = columns["face"] > 0, columns["pose"] > 0, columns["breathing"] > 0
+        has_breathing, has_face, has_pose = breathing.any(), face.any(), pose.any()
+        # Per-modality columns over the frames that carry that modality (views when every frame does)
+        breathing, face, pose = (slice(None) if mask.all() else mask for mask in (breathing, face, pose))
+        breathing_data = {name: columns[f"breathing.{name}"][breathing] for name in BREATHING_COLUMNS}
+        facial_features = {name: columns[f"facial.{name}"][face] for name in FACIAL_COLUMNS}
+        eye_features = {name: columns[f"eye.{name}"][face] for name in EYE_COLUMNS}
+        posture_features = {name: columns[f"posture.{name}"][pose] for name in POSTURE_COLUMNS}
+        facial_keys = present_columns(int(columns["facial_keys"][face][0]), FACIAL_COLUMNS) if has_face else ()
+        posture_keys = present_columns(int(columns["posture_keys"][pose][0]), POSTURE_COLUMNS) if has_pose else ()
         
         # Estimate FPS for this window
-        duration = max(1e-6, self.data_buffer[-1]["timestamp"] - self.data_buffer[0]["timestamp"])
-        fps_est = len(self.data_buffer) / duration if duration > 0 else 30.0
+        timestamps = columns["timestamp"]
+        timestamp_start, timestamp_end = float(timestamps[0]), float(timestamps[-1])
+        duration = max(1e-6, timestamp_end - timestamp_start)
+        fps_est = len(timestamps) / duration if duration > 0 else 30.0
 
-        # Build 10s rolling eye series ending at window end for blink rate
-        roll_series: List[float] = []
-        roll_duration_s = 0.0
-        try:
-            t_end = self.data_buffer[-1]["timestamp"]
-            t_start = t_end - 10.0
-            recent = [item for item in self.eye_roll_buffer if item[0] >= t_start]
-            if recent:
-                roll_series = [v for (_, v) in recent]
-                roll_duration_s = max(1e-6, recent[-1][0] - recent[0][0])
-        except Exception:
-            pass
+        roll_series, roll_duration_s = self._rolling_eye_series(timestamp_end)
 
         aggregated = {
             "window_id": self.export_counter,
-            "timestamp_start": self.data_buffer[0]["timestamp"],
-            "timestamp_end": self.data_buffer[-1]["timestamp"],
-            "duration_seconds": self.data_buffer[-1]["timestamp"] - self.data_buffer[0]["timestamp"],
-            "frame_count": len(self.data_buffer),
-            "valid_frames": len(breathing_data),
+            "timestamp_start": timestamp_start,
+            "timestamp_end": timestamp_end,
+            "duration_seconds": timestamp_end - timestamp_start,
+            "frame_count": len(timestamps),
+            "valid_frames": int(np.count_nonzero(columns["breathing"])),
             "estimated_fps": fps_est,
             
-            "breathing_analysis": self._aggregate_breathing(breathing_data) if breathing_data else {"status": "no_breathing_data"},
-            "facial_analysis": self._aggregate_facial(facial_features) if facial_features else {"status": "no_facial_data"},
-            "eye_analysis": self._aggregate_eye(eye_features, fps_est=fps_est, rolling_series=roll_series, rolling_duration_s=roll_duration_s) if eye_features else {"status": "no_eye_data"},
-            "posture_analysis": self._aggregate_posture(posture_features) if posture_features else {"status": "no_posture_data"},
+            "breathing_analysis": self._aggregate_breathing(breathing_data) if has_breathing else {"status": "no_breathing_data"},
+            "facial_analysis": self._aggregate_facial(facial_features, facial_keys) if has_face else {"status": "no_facial_data"},
+            "eye_analysis": self._aggregate_eye(eye_features, fps_est=fps_est, rolling_series=roll_series, rolling_duration_s=roll_duration_s) if has_face else {"status": "no_eye_data"},
+            "posture_analysis": self._aggregate_posture(posture_features, posture_keys) if has_pose else {"status": "no_posture_data"},
             "behavioral_patterns": self._analyze_behavioral_patterns(
                 breathing_data, facial_features, eye_features, posture_features
-            ) if breathing_data and facial_features and eye_features else {"status": "insufficient_data_for_correlation"}
+            ) if has_breathing and has_face else {"status": "insufficient_data_for_correlation"}
         }
         
         return aggregated
     
-    def _aggregate_breathing(self, breathing_data: List[Dict]) -> Dict[str, float]:
+    def _rolling_eye_series(self, timestamp_end: float) -> Tuple[np.ndarray, float]:
+        """Eye openness over the 10s ending at the window end, for the blink rate, and the seconds it spans."""
+        roll_series = np.zeros(0)
+        roll_duration_s = 0.0
+        roll_times = self.eye_roll_times.last()
+        recent = roll_times >= timestamp_end - 10.0
+        if recent.any():
+            roll_series = self.eye_roll_openness.last()[recent]
+            recent_times = roll_times[recent]
+            roll_duration_s = max(1e-6, float(recent_times[-1] - recent_times[0]))
+        return roll_series, roll_duration_s
+    
+    def _aggregate_online(self, stats: WindowStats) -> Dict[str, Any]:
+        """The window features from the online accumulators: same keys as the exact path, no pass over the frames.
+        
+        They cover every frame since the buffer was last cleared, which can be a few more than it holds, so even the
+        moments can differ from the exact path's (see window_stats)."""
+        stats.flush()
+        timestamp_start, timestamp_end = stats.timestamp_start, stats.timestamp_end
+        duration = max(1e-6, timestamp_end - timestamp_start)
+        fps_est = stats.frames / duration
+        roll_series, roll_duration_s = self._rolling_eye_series(timestamp_end)
+        breathing_frames, face_frames, pose_frames = (int(n) for n in stats.counts)
+        
+        return {
+            "window_id": self.export_counter,
+            "timestamp_start": timestamp_start,
+            "timestamp_end": timestamp_end,
+            "duration_seconds": timestamp_end - timestamp_start,
+            "frame_count": stats.frames,
+            "valid_frames": breathing_frames,
+            "estimated_fps": fps_est,
+            
+            "breathing_analysis": self._online_breathing(stats) if breathing_frames else {"status": "no_breathing_data"},
+            "facial_analysis": self._online_facial(stats) if face_frames else {"status": "no_facial_data"},
+            "eye_analysis": self._online_eye(stats, fps_est, roll_series, roll_duration_s) if face_frames else {"status": "no_eye_data"},
+            "posture_analysis": self._online_posture(stats) if pose_frames else {"status": "no_posture_data"},
+            "behavioral_patterns": self._online_patterns(stats) if breathing_frames and face_frames else {"status": "insufficient_data_for_correlation"}
+        }
+    
+    def _online_breathing(self, stats: WindowStats) -> Dict[str, float]:
+        """``_aggregate_breathing`` from the accumulators."""
+        n = stats.count("bpm")
+        if not n:
+            return {"status": "no_breathing_data"}
+        sketch = stats.sketches["bpm"]
+        mean_bpm, bpm_std = stats.mean("bpm"), stats.std("bpm")
+        min_bpm, max_bpm = stats.min("bpm"), stats.max("bpm")
+        slow, fast = stats.count_below("bpm"), stats.count_above("bpm")
+        
+        return {
+            "mean_bpm": float(mean_bpm),
+            "median_bpm": sketch.quantile(0.5),
+            "mode_bpm": stats.bpm_mode(),
+            "bpm_std": float(bpm_std),
+            "bpm_range": float(max_bpm - min_bpm),
+            "bpm_iqr": sketch.quantile(0.75) - sketch.quantile(0.25),
+            "mean_confidence": float(stats.mean("confidence")),
+            "confidence_stability": float(1.0 - stats.std("confidence")),
+            "mean_variability": float(stats.mean("variability")),
+            "bpm_trend": stats.slope("bpm"),
+            "bpm_acceleration": stats.bpm_acceleration(),
+            "max_bpm": float(max_bpm),
+            "min_bpm": float(min_bpm),
+            "bpm_spikes": sketch.count_above(mean_bpm + 2 * bpm_std),
+            "time_slow_breathing": slow / n,
+            "time_normal_breathing": (n - slow - fast) / n,
+            "time_fast_breathing": fast / n
+        }
+    
+    def _online_facial(self, stats: WindowStats) -> Dict[str, float]:
+        """``_aggregate_facial`` from the accumulators."""
+        if not stats.count("jaw_width"):
+            return {"status": "no_facial_data"}
+        face_frames = int(stats.counts[1])
+        if face_frames < 5:
+            # Too few frames to smooth; the last 5 normalized curvatures are all of them
+            norm_curv = np.array(stats.recent_curvature)
+            curv_med = float(np.median(norm_curv))
+            mad = float(np.median(np.abs(norm_curv - curv_med))) + 1e-6
+            smile_thr = max(0.02, curv_med + 0.8 * mad)
+            frown_thr = min(-0.02, curv_med - 0.8 * mad)
+            smile_freq = np.count_nonzero(norm_curv > smile_thr) / face_frames
+            frown_freq = np.count_nonzero(norm_curv < frown_thr) / face_frames
+        else:
+            sketch = stats.sketches["curvature"]
+            curv_med = sketch.quantile(0.5)
+            mad = sketch.mad(curv_med) + 1e-6
+            smile_thr = max(0.02, curv_med + 0.8 * mad)
+            frown_thr = min(-0.02, curv_med - 0.8 * mad)
+            smile_freq = sketch.count_above(smile_thr) / face_frames
+            frown_freq = sketch.count_below(frown_thr) / face_frames
+        has_eyebrows = stats.count("eyebrow_height") > 0
+        stabilities = [1.0 / (1.0 + stats.std(channel)) for channel in ("jaw_width", "positive_mouth_curvature", "eyebrow_height")
+                       if stats.count(channel) > 1]
+        
+        return {
+            "mean_jaw_width": stats.mean("jaw_width"),
+            "jaw_width_std": stats.std("jaw_width"),
+            "jaw_tension_episodes": stats.sketches["jaw_width"].count_below(stats.mean("jaw_width") - stats.std("jaw_width")),
+            "mean_mouth_curvature": stats.mean("mouth_curvature"),
+            "smile_frequency": smile_freq,
+            "frown_frequency": frown_freq,
+            "expression_stability": 1.0 - stats.std("mouth_curvature"),
+            "mean_eyebrow_height": stats.mean("eyebrow_height") if has_eyebrows else 0.0,
+            "eyebrow_height_std": stats.std("eyebrow_height") if has_eyebrows else 0.0,
+            "eyebrow_tension_episodes": stats.count_below("eyebrow_height") if has_eyebrows else 0,
+            "facial_movement_intensity": stats.movement_intensity("facial"),
+            "facial_stability_score": np.mean(stabilities) if face_frames >= 2 and stabilities else 1.0
+        }
+    
+    def _online_eye(self, stats: WindowStats, fps_est: float, rolling_series: np.ndarray, rolling_duration_s: float) -> Dict[str, float]:
+        """``_aggregate_eye`` from the accumulators. Blinks still need the openness series: the 10s rolling one."""
+        # Only read if the rolling series is too short; the window's face frames are its newest samples
+        window_series = self.eye_roll_openness.last(int(stats.counts[1]))
+        blink_freq, perclos, horizon_s = self._blink_statistics(window_series, fps_est, rolling_series, rolling_duration_s)
+        sketch = stats.sketches["eye_openness"]
+        mean_openness, openness_std = stats.mean("eye_openness"), stats.std("eye_openness")
+        
+        return {
+            "mean_eye_openness": mean_openness,
+            "eye_openness_std": openness_std,
+            "low_openness_episodes": sketch.count_below(0.6 * sketch.quantile(0.5)),
+            "blink_frequency": blink_freq,
+            "mean_asymmetry": stats.mean("eye_asymmetry"),
+            "high_asymmetry_episodes": stats.count_above("eye_asymmetry"),
+            "eye_fatigue_trend": stats.slope("eye_openness"),
+            "eye_stability": 1.0 - stats.std("eye_asymmetry"),
+            "sustained_attention_score": (mean_openness + (1.0 - openness_std) + (1.0 - stats.mean("eye_openness_difference"))) / 3,
+            "perclos": perclos,
+            "blink_rate_horizon_seconds": horizon_s
+        }
+    
+    def _online_posture(self, stats: WindowStats) -> Dict[str, float]:
+        """``_aggregate_posture`` from the accumulators."""
+        shoulder_frames = stats.count("shoulder_height")
+        if not shoulder_frames:
+            return {"status": "no_posture_data"}
+        has_head = stats.count("head_distance") > 0
+        stable = stats.counts[2] < 2 or shoulder_frames < 2
+        
+        return {
+            "mean_shoulder_height": stats.mean("shoulder_height"),
+            "shoulder_height_std": stats.std("shoulder_height"),
+            "shoulder_tension_trend": stats.slope("shoulder_height"),
+            "mean_shoulder_asymmetry": stats.mean("shoulder_asymmetry"),
+            "high_asymmetry_episodes": stats.count_above("shoulder_asymmetry"),
+            "mean_head_distance": stats.mean("head_distance") if has_head else 0.0,
+            "head_forward_episodes": stats.count_below("head_distance") if has_head else 0,
+            "posture_stability": 1.0 if stable else 1.0 / (1.0 + stats.std("shoulder_height")),
+            "movement_intensity": stats.movement_intensity("posture")
+        }
+    
+    def _online_patterns(self, stats: WindowStats) -> Dict[str, float]:
+        """``_analyze_behavioral_patterns`` from the co-moments of the paired BPM, jaw width and eye openness."""
+        if stats.patterns.n < 5:
+            return {"status": "insufficient_data_for_correlation"}
+        corr = stats.patterns.corrcoef()
+        pairs = np.array([corr[0, 1], corr[0, 2], corr[1, 2]])
+        
+        return {
+            "breathing_jaw_correlation": pairs[0],
+            "breathing_eye_correlation": pairs[1],
+            "jaw_eye_correlation": pairs[2],
+            "physiological_coherence": np.mean(np.where(np.isnan(pairs), 0.0, np.abs(pairs))),
+            "stress_response_coordination": stats.coordinated_frames / stats.stress_frames if stats.stress_frames else 0.0,
+            "behavioral_volatility": np.mean(stats.pattern_steps.std())
+        }
+    
+    def _aggregate_breathing(self, breathing_data: Dict[str, np.ndarray]) -> Dict[str, float]:
         """Aggregate breathing patterns over the time window."""
-        if not breathing_data:
+        if not len(breathing_data["bpm"]):
             return {}
             
         try:
-            bpm_values = [b.get("bpm", 0) for b in breathing_data if b.get("bpm", 0) > 0]
-            confidence_values = [b.get("confidence", 0) for b in breathing_data]
-            variability_values = [b.get("variability", 0) for b in breathing_data]
+            bpm_values = breathing_data["bpm"][breathing_data["bpm"] > 0]
             
-            if not bpm_values:
+            if not len(bpm_values):
                 return {"status": "no_breathing_data"}
             
             # Use safer numpy operations with error handling
-            bpm_array = np.array(bpm_values, dtype=np.float32)
-            confidence_array = np.array(confidence_values, dtype=np.float32)
-            variability_array = np.array(variability_values, dtype=np.float32)
+            bpm_array = bpm_values.astype(np.float32)
+            confidence_array = breathing_data["confidence"].astype(np.float32)
+            variability_array = breathing_data["variability"].astype(np.float32)
+            spike_threshold = np.mean(bpm_array) + 2*np.std(bpm_array)
             
             return {
                 "mean_bpm": float(np.mean(bpm_array)),
@@ -492,76 +731,85 @@ class MLDataAggregator:
                 "bpm_acceleration": self._calculate_acceleration(bpm_values),
                 "max_bpm": float(np.max(bpm_array)),
                 "min_bpm": float(np.min(bpm_array)),
-                "bpm_spikes": int(len([b for b in bpm_values if b > np.mean(bpm_array) + 2*np.std(bpm_array)])),
-                "time_slow_breathing": float(len([b for b in bpm_values if b < 12]) / len(bpm_values)),
-                "time_normal_breathing": float(len([b for b in bpm_values if 12 <= b <= 20]) / len(bpm_values)),
-                "time_fast_breathing": float(len([b for b in bpm_values if b > 20]) / len(bpm_values))
+                "bpm_spikes": int(np.count_nonzero(bpm_values > spike_threshold)),
+                "time_slow_breathing": float(np.count_nonzero(bpm_values < 12) / len(bpm_values)),
+                "time_normal_breathing": float(np.count_nonzero((bpm_values >= 12) & (bpm_values <= 20)) / len(bpm_values)),
+                "time_fast_breathing": float(np.count_nonzero(bpm_values > 20) / len(bpm_values))
             }
         except Exception as e:
             print(f"⚠️ Error in breathing aggregation: {e}")
             return {"status": "aggregation_error", "error": str(e)}
     
-    def _aggregate_facial(self, facial_data: List[Dict]) -> Dict[str, float]:
-        """Aggregate facial expression patterns."""
-        if not facial_data:
+    def _aggregate_facial(self, facial_data: Dict[str, np.ndarray], keys: Tuple[str, ...] = FACIAL_COLUMNS) -> Dict[str, float]:
+        """Aggregate facial expression patterns. ``keys``: the numeric features of the window's first frame."""
+        all_jaw_width = facial_data["jaw_width"]
+        if not len(all_jaw_width):
             return {}
             
-        jaw_width = [f.get("jaw_width", 0) for f in facial_data if f.get("jaw_width", 0) > 0]
-        mouth_curvature = [f.get("mouth_curvature", 0) for f in facial_data]
-        eyebrow_height = [f.get("eyebrow_height", 0) for f in facial_data if f.get("eyebrow_height", 0) > 0]
+        jaw_width = all_jaw_width[all_jaw_width > 0]
+        mouth_curvature = facial_data["mouth_curvature"]
+        eyebrow_height = facial_data["eyebrow_height"][facial_data["eyebrow_height"] > 0]
         
-        if not jaw_width:
+        if not len(jaw_width):
             return {"status": "no_facial_data"}
         # Per-frame normalization by jaw width to reduce scale bias
-        norm_curv = []
-        for f in facial_data:
-            jw = f.get("jaw_width", 0.0)
-            mc = f.get("mouth_curvature", 0.0)
-            if jw > 0:
-                norm_curv.append(mc / (jw + 1e-6))
-            else:
-                norm_curv.append(0.0)
+        norm_curv = np.divide(mouth_curvature, all_jaw_width + 1e-6, out=np.zeros(len(all_jaw_width)),
+                              where=all_jaw_width > 0)
         # Light smoothing (moving average window=5)
         if len(norm_curv) >= 5:
-            smoothed = []
-            w = 5
-            for i in range(len(norm_curv)):
-                s = max(0, i - (w - 1))
-                smoothed.append(float(np.mean(norm_curv[s:i+1])))
-            norm_curv = smoothed
+            norm_curv = self._trailing_mean(norm_curv, 5)
         # Adaptive thresholds using MAD with floors
-        curv_med = float(np.median(norm_curv)) if norm_curv else 0.0
-        mad = float(np.median(np.abs(np.array(norm_curv) - curv_med))) + 1e-6
+        curv_med = float(np.median(norm_curv))
+        mad = float(np.median(np.abs(norm_curv - curv_med))) + 1e-6
         smile_thr = max(0.02, curv_med + 0.8 * mad)
         frown_thr = min(-0.02, curv_med - 0.8 * mad)
-        smile_freq = (len([c for c in norm_curv if c > smile_thr]) / len(norm_curv)) if norm_curv else 0.0
-        frown_freq = (len([c for c in norm_curv if c < frown_thr]) / len(norm_curv)) if norm_curv else 0.0
+        smile_freq = np.count_nonzero(norm_curv > smile_thr) / len(norm_curv)
+        frown_freq = np.count_nonzero(norm_curv < frown_thr) / len(norm_curv)
 
         return {
             "mean_jaw_width": np.mean(jaw_width),
             "jaw_width_std": np.std(jaw_width),
-            "jaw_tension_episodes": len([j for j in jaw_width if j < np.mean(jaw_width) - np.std(jaw_width)]),
+            "jaw_tension_episodes": int(np.count_nonzero(jaw_width < np.mean(jaw_width) - np.std(jaw_width))),
             "mean_mouth_curvature": np.mean(mouth_curvature),
             "smile_frequency": smile_freq,
             "frown_frequency": frown_freq,
             "expression_stability": 1.0 - np.std(mouth_curvature),
-            "mean_eyebrow_height": np.mean(eyebrow_height) if eyebrow_height else 0.0,
-            "eyebrow_height_std": np.std(eyebrow_height) if eyebrow_height else 0.0,
-            "eyebrow_tension_episodes": len([e for e in eyebrow_height if e < 0.3]) if eyebrow_height else 0,
-            "facial_movement_intensity": self._calculate_movement_intensity(facial_data),
+            "mean_eyebrow_height": np.mean(eyebrow_height) if len(eyebrow_height) else 0.0,
+            "eyebrow_height_std": np.std(eyebrow_height) if len(eyebrow_height) else 0.0,
+            "eyebrow_tension_episodes": int(np.count_nonzero(eyebrow_height < 0.3)) if len(eyebrow_height) else 0,
+            "facial_movement_intensity": self._calculate_movement_intensity(facial_data, keys),
             "facial_stability_score": self._calculate_facial_stability(facial_data)
         }
     
-    def _aggregate_eye(self, eye_data: List[Dict], fps_est: float = 30.0, rolling_series: Optional[List[float]] = None, rolling_duration_s: float = 0.0) -> Dict[str, float]:
+    def _aggregate_eye(self, eye_data: Dict[str, np.ndarray], fps_est: float = 30.0, rolling_series: Optional[np.ndarray] = None, rolling_duration_s: float = 0.0) -> Dict[str, float]:
         """Aggregate eye behavior patterns. fps_est improves blink frequency accuracy."""
-        if not eye_data:
+        if not len(eye_data["left_eye_openness"]):
             return {}
             
-        left_openness = [e.get("left_eye_openness", 1.0) for e in eye_data]
-        right_openness = [e.get("right_eye_openness", 1.0) for e in eye_data]
-        avg_series = [(l + r) / 2.0 for l, r in zip(left_openness, right_openness)]
-        asymmetry = [e.get("eye_asymmetry", 0.0) for e in eye_data]
+        left_openness = eye_data["left_eye_openness"]
+        right_openness = eye_data["right_eye_openness"]
+        avg_series = (left_openness + right_openness) / 2.0
+        asymmetry = eye_data["eye_asymmetry"]
+        
+        blink_freq, perclos, horizon_s = self._blink_statistics(avg_series, fps_est, rolling_series, rolling_duration_s)
         
+        return {
+            "mean_eye_openness": np.mean(avg_series),
+            "eye_openness_std": np.std(avg_series),
+            "low_openness_episodes": int(np.count_nonzero(avg_series < 0.6 * np.median(avg_series))),
+            "blink_frequency": blink_freq,
+            "mean_asymmetry": np.mean(asymmetry),
+            "high_asymmetry_episodes": int(np.count_nonzero(asymmetry > 0.05)),
+            "eye_fatigue_trend": self._calculate_trend(avg_series),
+            "eye_stability": 1.0 - np.std(asymmetry),
+            "sustained_attention_score": self._calculate_attention_score(left_openness, right_openness),
+            "perclos": perclos,
+            "blink_rate_horizon_seconds": horizon_s
+        }
+    
+    def _blink_statistics(self, window_series: np.ndarray, fps_est: float, rolling_series: Optional[np.ndarray],
+                          rolling_duration_s: float) -> Tuple[float, float, float]:
+        """Blink frequency, PERCLOS and the seconds of eye openness they cover (0 without enough samples)."""
         # Robust blink estimate using MAD thresholds + hysteresis state machine
         # Compute blink frequency over a longer rolling horizon (up to 10s) for smoother, less quantized rate
         blink_freq = 0.0
@@ -569,12 +817,12 @@ class MLDataAggregator:
         # Prefer rolling series if available, else fall back to current window
         series_src = None
         duration_s = 0.0
-        if rolling_series and len(rolling_series) >= max(10, int(0.5 * fps_est)) and rolling_duration_s > 0:
-            series = np.array(rolling_series, dtype=np.float32)
+        if rolling_series is not None and len(rolling_series) >= max(10, int(0.5 * fps_est)) and rolling_duration_s > 0:
+            series = np.asarray(rolling_series, dtype=np.float32)
             series_src = "rolling"
             duration_s = rolling_duration_s
-        elif len(avg_series) >= max(10, int(0.5 * fps_est)):
-            series = np.array(avg_series, dtype=np.float32)
+        elif len(window_series) >= max(10, int(0.5 * fps_est)):
+            series = window_series.astype(np.float32)
             series_src = "window"
             duration_s = max(1e-6, len(series) / max(1.0, fps_est))
         else:
@@ -591,47 +839,32 @@ class MLDataAggregator:
             # PERCLOS: time below 80% of median openness or below close_thr
             perclos_thresh = min(0.8 * med, close_thr)
             perclos = float(np.mean(series < perclos_thresh))
-            # State machine
-            in_closed = False
-            closed_start = 0
-            blinks = 0
-            refractory = 0
+            # Hysteresis state machine, stepped from one threshold crossing to the next: a closure starts at
+            # the first frame below close_thr once any refractory period is over, and ends at the next frame above
+            # open_thr; it counts as a blink if it lasted min_close to max_close frames
             min_close = max(1, int(0.08 * fps_est))     # >=80 ms closure
             max_close = max(min_close, int(0.8 * fps_est))  # <=0.8s
             refr_frames = max(1, int(0.15 * fps_est))   # 150 ms refractory
-            for i, val in enumerate(series):
-                if refractory > 0:
-                    refractory -= 1
-                if not in_closed:
-                    if val < close_thr and refractory == 0:
-                        in_closed = True
-                        closed_start = i
+            closed_idx = np.flatnonzero(series.astype(np.float64) < close_thr)
+            opened_idx = np.flatnonzero(series.astype(np.float64) > open_thr)
+            event_idxs = []
+            ready = 0  # first frame a closure may start at
+            while True:
+                i = np.searchsorted(closed_idx, ready)
+                if i == len(closed_idx):
+                    break
+                j = np.searchsorted(opened_idx, closed_idx[i], side="right")
+                if j == len(opened_idx):
+                    break
+                closed_start, reopened = int(closed_idx[i]), int(opened_idx[j])
+                if min_close <= reopened - closed_start <= max_close:
+                    event_idxs.append(reopened)
+                    ready = reopened + refr_frames
                 else:
-                    # Wait until it re-opens beyond open_thr
-                    if val > open_thr:
-                        dur = i - closed_start
-                        if min_close <= dur <= max_close:
-                            blinks += 1
-                            refractory = refr_frames
-                        in_closed = False
+                    ready = reopened + 1
+            blinks = len(event_idxs)
             # Prefer median inter-blink interval for smoother, continuous rate when >=2 blinks
             if blinks >= 2:
-                # Estimate IBI from event indices
-                event_idxs = []
-                in_closed = False
-                refractory = 0
-                for i, val in enumerate(series):
-                    if refractory > 0:
-                        refractory -= 1
-                    if not in_closed and val < close_thr and refractory == 0:
-                        in_closed = True
-                        start_i = i
-                    elif in_closed and val > open_thr:
-                        dur = i - start_i
-                        if min_close <= dur <= max_close:
-                            event_idxs.append(i)
-                            refractory = refr_frames
-                        in_closed = False
                 ibis = [ (event_idxs[i] - event_idxs[i-1]) / max(1.0, fps_est) for i in range(1, len(event_idxs)) ]
                 if ibis:
                     blink_freq = 60.0 / max(1e-3, float(np.median(ibis)))
@@ -642,30 +875,19 @@ class MLDataAggregator:
                 duration_minutes = max(1e-6, duration_s / 60.0)
                 blink_freq = blinks / duration_minutes
 
-        return {
-            "mean_eye_openness": np.mean(avg_series),
-            "eye_openness_std": np.std(avg_series),
-            "low_openness_episodes": len([o for o in avg_series if o < 0.6 * (np.median(avg_series) if len(avg_series)>0 else 0.0)]),
-            "blink_frequency": blink_freq,
-            "mean_asymmetry": np.mean(asymmetry),
-            "high_asymmetry_episodes": len([a for a in asymmetry if a > 0.05]),
-            "eye_fatigue_trend": self._calculate_trend(avg_series),
-            "eye_stability": 1.0 - np.std(asymmetry),
-            "sustained_attention_score": self._calculate_attention_score(left_openness, right_openness),
-            "perclos": perclos,
-            "blink_rate_horizon_seconds": float(duration_s) if series is not None else 0.0
-        }
+        return blink_freq, perclos, float(duration_s) if series is not None else 0.0
     
-    def _aggregate_posture(self, posture_data: List[Dict]) -> Dict[str, float]:
-        """Aggregate posture patterns."""
-        if not posture_data:
+    def _aggregate_posture(self, posture_data: Dict[str, np.ndarray], keys: Tuple[str, ...] = POSTURE_COLUMNS) -> Dict[str, float]:
+        """Aggregate posture patterns. ``keys``: the numeric features of the window's first frame."""
+        all_shoulder_height = posture_data["shoulder_height_avg"]
+        if not len(all_shoulder_height):
             return {}
             
-        shoulder_height = [p.get("shoulder_height_avg", 0) for p in posture_data if p.get("shoulder_height_avg", 0) > 0]
-        shoulder_asymmetry = [p.get("shoulder_asymmetry", 0) for p in posture_data]
-        head_distance = [p.get("head_shoulder_distance", 0) for p in posture_data if p.get("head_shoulder_distance", 0) > 0]
+        shoulder_height = all_shoulder_height[all_shoulder_height > 0]
+        shoulder_asymmetry = posture_data["shoulder_asymmetry"]
+        head_distance = posture_data["head_shoulder_distance"][posture_data["head_shoulder_distance"] > 0]
         
-        if not shoulder_height:
+        if not len(shoulder_height):
             return {"status": "no_posture_data"}
         
         return {
@@ -673,21 +895,21 @@ class MLDataAggregator:
             "shoulder_height_std": np.std(shoulder_height),
             "shoulder_tension_trend": self._calculate_trend(shoulder_height),
             "mean_shoulder_asymmetry": np.mean(shoulder_asymmetry),
-            "high_asymmetry_episodes": len([a for a in shoulder_asymmetry if a > 0.03]),
-            "mean_head_distance": np.mean(head_distance) if head_distance else 0.0,
-            "head_forward_episodes": len([h for h in head_distance if h < 0.1]) if head_distance else 0,
+            "high_asymmetry_episodes": int(np.count_nonzero(shoulder_asymmetry > 0.03)),
+            "mean_head_distance": np.mean(head_distance) if len(head_distance) else 0.0,
+            "head_forward_episodes": int(np.count_nonzero(head_distance < 0.1)) if len(head_distance) else 0,
             "posture_stability": self._calculate_posture_stability(posture_data),
-            "movement_intensity": self._calculate_movement_intensity(posture_data)
+            "movement_intensity": self._calculate_movement_intensity(posture_data, keys)
         }
     
-    def _analyze_behavioral_patterns(self, breathing_data: List[Dict], facial_data: List[Dict], 
-                                   eye_data: List[Dict], posture_data: List[Dict]) -> Dict[str, float]:
+    def _analyze_behavioral_patterns(self, breathing_data: Dict[str, np.ndarray], facial_data: Dict[str, np.ndarray],
+                                   eye_data: Dict[str, np.ndarray], posture_data: Dict[str, np.ndarray]) -> Dict[str, float]:
         """Analyze cross-feature behavioral patterns."""
-        if not breathing_data or not facial_data:
+        if not len(breathing_data["bpm"]) or not len(facial_data["jaw_width"]):
             return {}
-        bpm_series = [b.get("bpm", 0) for b in breathing_data if b.get("bpm", 0) > 0]
-        jaw_series = [f.get("jaw_width", 0) for f in facial_data if f.get("jaw_width", 0) > 0]
-        eye_series = [(e.get("left_eye_openness", 1) + e.get("right_eye_openness", 1)) / 2 for e in eye_data]
+        bpm_series = breathing_data["bpm"][breathing_data["bpm"] > 0]
+        jaw_series = facial_data["jaw_width"][facial_data["jaw_width"] > 0]
+        eye_series = (eye_data["left_eye_openness"] + eye_data["right_eye_openness"]) / 2
         
         min_length = min(len(bpm_series), len(jaw_series), len(eye_series))
         if min_length < 5:
@@ -705,15 +927,15 @@ class MLDataAggregator:
             "behavioral_volatility": self._calculate_overall_volatility(bpm_series, jaw_series, eye_series)
         }
     
-    def _calculate_mode(self, values: List[float]) -> float:
+    def _calculate_mode(self, values: np.ndarray) -> float:
         """Calculate approximate mode for continuous data."""
-        if not values:
+        if not len(values):
             return 0.0
         hist, bins = np.histogram(values, bins=10)
         mode_bin = bins[np.argmax(hist)]
         return mode_bin
     
-    def _calculate_trend(self, values: List[float]) -> float:
+    def _calculate_trend(self, values: np.ndarray) -> float:
         """Calculate linear trend slope."""
         if len(values) < 3:
             return 0.0
@@ -721,7 +943,7 @@ class MLDataAggregator:
         slope, _ = np.polyfit(x, values, 1)
         return slope
     
-    def _calculate_acceleration(self, values: List[float]) -> float:
+    def _calculate_acceleration(self, values: np.ndarray) -> float:
         """Calculate acceleration (second derivative)."""
         if len(values) < 3:
             return 0.0
@@ -729,26 +951,29 @@ class MLDataAggregator:
         diff2 = np.diff(diff1)
         return np.mean(diff2)
     
-    def _calculate_movement_intensity(self, data: List[Dict]) -> float:
-        """Calculate overall movement intensity."""
-        if len(data) < 2:
+    @staticmethod
+    def _trailing_mean(values: np.ndarray, width: int) -> np.ndarray:
+        """Mean of each value and the up to ``width - 1`` values before it."""
+        head = np.cumsum(values[:width - 1]) / np.arange(1, min(width - 1, len(values)) + 1)
+        full = np.lib.stride_tricks.sliding_window_view(values, width).mean(axis=1)
+        return np.concatenate((head, full))
+    
+    def _calculate_movement_intensity(self, data: Dict[str, np.ndarray], keys: Tuple[str, ...]) -> float:
+        """Calculate overall movement intensity over ``keys`` (0 where a frame lacks one)."""
+        if min(len(values) for values in data.values()) < 2:
             return 0.0
         intensity = 0.0
-        feature_count = 0
-        for key in data[0].keys():
-            if isinstance(data[0][key], (int, float)):
-                values = [d.get(key, 0) for d in data]
-                intensity += np.sum(np.abs(np.diff(values)))
-                feature_count += 1
-        return intensity / feature_count if feature_count > 0 else 0.0
+        for key in keys:
+            intensity += np.sum(np.abs(np.diff(data[key])))
+        return intensity / len(keys) if keys else 0.0
     
-    def _calculate_facial_stability(self, facial_data: List[Dict]) -> float:
+    def _calculate_facial_stability(self, facial_data: Dict[str, np.ndarray]) -> float:
         """Calculate facial expression stability."""
-        if len(facial_data) < 2:
+        if len(facial_data["jaw_width"]) < 2:
             return 1.0
         stabilities = []
         for key in ["jaw_width", "mouth_curvature", "eyebrow_height"]:
-            values = [f.get(key, 0) for f in facial_data if f.get(key, 0) > 0]
+            values = facial_data[key][facial_data[key] > 0]
             if len(values) > 1:
                 stability = 1.0 / (1.0 + np.std(values))
                 stabilities.append(stability)
@@ -768,20 +993,22 @@ class MLDataAggregator:
         duration_minutes = len(openness_values) / (30.0 * 60.0)
         return blinks / duration_minutes if duration_minutes > 0 else 0.0
     
-    def _calculate_attention_score(self, left_openness: List[float], right_openness: List[float]) -> float:
+    def _calculate_attention_score(self, left_openness: np.ndarray, right_openness: np.ndarray) -> float:
         """Calculate sustained attention score."""
-        if not left_openness or not right_openness:
+        if not len(left_openness) or not len(right_openness):
             return 0.0
-        avg_openness = np.mean([(l + r) / 2 for l, r in zip(left_openness, right_openness)])
-        openness_consistency = 1.0 - np.std([(l + r) / 2 for l, r in zip(left_openness, right_openness)])
-        symmetry_score = 1.0 - np.mean([abs(l - r) for l, r in zip(left_openness, right_openness)])
+        avg_series = (left_openness + right_openness) / 2
+        avg_openness = np.mean(avg_series)
+        openness_consistency = 1.0 - np.std(avg_series)
+        symmetry_score = 1.0 - np.mean(np.abs(left_openness - right_openness))
         return (avg_openness + openness_consistency + symmetry_score) / 3
     
-    def _calculate_posture_stability(self, posture_data: List[Dict]) -> float:
+    def _calculate_posture_stability(self, posture_data: Dict[str, np.ndarray]) -> float:
         """Calculate overall posture stability."""
-        if len(posture_data) < 2:
+        shoulder_values = posture_data["shoulder_height_avg"]
+        if len(shoulder_values) < 2:
             return 1.0
-        shoulder_values = [p.get("shoulder_height_avg", 0) for p in posture_data if p.get("shoulder_height_avg", 0) > 0]
+        shoulder_values = shoulder_values[shoulder_values > 0]
         if len(shoulder_values) < 2:
             return 1.0
         return 1.0 / (1.0 + np.std(shoulder_values))
@@ -795,24 +1022,17 @@ class MLDataAggregator:
         corr3 = abs(np.corrcoef(series2, series3)[0, 1]) if not np.isnan(np.corrcoef(series2, series3)[0, 1]) else 0.0
         return (corr1 + corr2 + corr3) / 3
     
-    def _calculate_stress_coordination(self, breathing_data: List[Dict], facial_data: List[Dict], eye_data: List[Dict]) -> float:
+    def _calculate_stress_coordination(self, breathing_data: Dict[str, np.ndarray], facial_data: Dict[str, np.ndarray],
+                                       eye_data: Dict[str, np.ndarray]) -> float:
         """Calculate coordination of stress responses across modalities."""
-        stress_moments = []
-        for i in range(min(len(breathing_data), len(facial_data), len(eye_data))):
-            b = breathing_data[i]
-            f = facial_data[i]  
-            e = eye_data[i]
-            breathing_stress = 1 if b.get("bpm", 0) > 24 else 0
-            facial_stress = 1 if f.get("jaw_width", 0) < 0.08 else 0  
-            eye_stress = 1 if e.get("avg_eye_openness", 1) < 0.02 else 0
-            
-            stress_moments.append(breathing_stress + facial_stress + eye_stress)
-        
-        if not stress_moments:
+        n = min(len(breathing_data["bpm"]), len(facial_data["jaw_width"]), len(eye_data["avg_eye_openness"]))
+        if n == 0:
             return 0.0
+        stress_moments = ((breathing_data["bpm"][:n] > 24).astype(int) + (facial_data["jaw_width"][:n] < 0.08)
+                          + (eye_data["avg_eye_openness"][:n] < 0.02))
         
-        coordinated_moments = len([s for s in stress_moments if s >= 2])
-        return coordinated_moments / len(stress_moments)
+        coordinated_moments = int(np.count_nonzero(stress_moments >= 2))
+        return coordinated_moments / n
     
     def _calculate_overall_volatility(self, series1: List[float], series2: List[float], series3: List[float]) -> float:
         """Calculate overall behavioral volatility."""
@@ -831,10 +1051,11 @@ class FeatureExtractor:
     """
     
     def __init__(self):
-        self.breathing_history = deque(maxlen=30)
-        self.facial_history = deque(maxlen=30)
-        self.eye_history = deque(maxlen=30)
-        self.posture_history = deque(maxlen=30)
+        # The one value per frame each temporal feature reads
+        self.bpm_history = RingBuffer(30)
+        self.jaw_width_history = RingBuffer(30)
+        self.eye_openness_history = RingBuffer(30)
+        self.shoulder_height_history = RingBuffer(30)
         
         self.baseline_samples = 0
         self.baseline_target = 10
@@ -851,12 +1072,14 @@ class FeatureExtractor:
         pose_data = landmark_data.get("pose_landmarks")
         face_data = landmark_data.get("face_landmarks") 
         breathing_data = landmark_data.get("breathing", {})
+        # One kernel pass measures every landmark group present in this frame
+        geometry = self._measure_geometry(pose_data, face_data)
         
         features = {
             "breathing_features": self._extract_breathing_features(breathing_data),
-            "facial_features": self._extract_facial_features(face_data),
-            "eye_features": self._extract_eye_features(face_data),
-            "posture_features": self._extract_posture_features(pose_data),
+            "facial_features": self._extract_facial_features(geometry),
+            "eye_features": self._extract_eye_features(geometry),
+            "posture_features": self._extract_posture_features(geometry),
             "temporal_features": self._extract_temporal_features(),
             # Consider extractor calibrated only when both extractor baselines and breathing tracker are calibrated
             "calibrated": (self.baseline_samples >= self.baseline_target) and bool(breathing_data.get("calibrated", False)),
@@ -880,7 +1103,7 @@ class FeatureExtractor:
         else:
             rate_deviation = 0.0
         pattern_stability = confidence
-        self.breathing_history.append({"bpm": bpm, "confidence": confidence})
+        self.bpm_history.append(bpm)
         variability = self._compute_breathing_variability()
         
         return {
@@ -892,87 +1115,42 @@ class FeatureExtractor:
             "baseline_bpm": self.baseline_breathing_bpm or 0.0
         }
     
-    def _extract_facial_features(self, face_data: Dict[str, Any]) -> Dict[str, float]:
+    def _measure_geometry(self, pose_data: Optional[Dict[str, Any]], face_data: Optional[Dict[str, Any]]) -> Dict[str, float]:
+        """Raw facial, eye and posture measurements (see ``geometry_kernels``)."""
+        subset = mesh = pose = None
+        if face_data and face_data.get("points") is not None and len(face_data["points"]):
+            subset, mesh = face_data["points"], face_data.get("mesh")
+        if pose_data and pose_data.get("points") is not None:
+            pose = pose_data["points"]
+        return measure_frame(subset, mesh, pose)
+    
+    def _extract_facial_features(self, geometry: Dict[str, float]) -> Dict[str, float]:
         """Extract facial measurements for ML training."""
-        if not face_data or not face_data.get("coordinates"):
+        if "jaw_width" not in geometry:
             return {"jaw_width": 0.0, "jaw_height": 0.0, "mouth_area": 0.0, "eyebrow_height": 0.0, 
                    "eyebrow_distance": 0.0, "lip_thickness": 0.0, "mouth_curvature": 0.0}
             
-        coords = face_data["coordinates"]
-        breakdown = face_data.get("feature_breakdown", {})
-        
-        features = self._extract_facial_landmarks(coords, breakdown)
-        jaw_width, jaw_height = self._measure_jaw(features.get("lips", []))
-        mouth_area = jaw_width * jaw_height
-        eyebrow_height = self._measure_eyebrow_height(
-            features.get("left_eyebrow", []), 
-            features.get("right_eyebrow", [])
-        )
-        eyebrow_distance = self._measure_eyebrow_distance(
-            features.get("left_eyebrow", []), 
-            features.get("right_eyebrow", [])
-        )
-        
-        lip_thickness = self._measure_lip_thickness(features.get("lips", []))
-        mouth_curvature = self._measure_mouth_curvature(features.get("lips", []))
+        jaw_width = geometry["jaw_width"]
         
         jaw_width_deviation = 0.0
         if self.baseline_jaw_width:
             jaw_width_deviation = abs(jaw_width - self.baseline_jaw_width) / self.baseline_jaw_width
         
         return {
-            "jaw_width": jaw_width,
-            "jaw_height": jaw_height,
-            "mouth_area": mouth_area,
-            "eyebrow_height": eyebrow_height,
-            "eyebrow_distance": eyebrow_distance,
-            "lip_thickness": lip_thickness,
-            "mouth_curvature": mouth_curvature,
+            **{key: geometry[key] for key in FACIAL_KEYS},
             "jaw_width_deviation": jaw_width_deviation,
             "baseline_jaw_width": self.baseline_jaw_width or 0.0
         }
     
-    def _extract_eye_features(self, face_data: Dict[str, Any]) -> Dict[str, float]:
+    def _extract_eye_features(self, geometry: Dict[str, float]) -> Dict[str, float]:
         """Extract eye measurements for ML training."""
-        if not face_data or not face_data.get("coordinates"):
+        if "left_eye_openness" not in geometry:
             return {"left_eye_openness": 1.0, "right_eye_openness": 1.0, "eye_asymmetry": 0.0, 
                    "avg_eye_openness": 1.0, "openness_deviation": 0.0}
-            
-        coords = face_data["coordinates"]
-        breakdown = face_data.get("feature_breakdown", {})
-        features = self._extract_facial_landmarks(coords, breakdown)
-        
-        # Prefer robust EAR-based openness using index_map if available
-        if "index_map" in face_data:
-            im = face_data["index_map"]
-            def ear(left_corner, right_corner, top1, bottom1, top2=None, bottom2=None) -> float:
-                try:
-                    # Horizontal eye width
-                    x1, y1, _ = im[left_corner]
-                    x2, y2, _ = im[right_corner]
-                    w = ((x2 - x1)**2 + (y2 - y1)**2) ** 0.5
-                    # Vertical distances (use one or two pairs)
-                    xt1, yt1, _ = im[top1]
-                    xb1, yb1, _ = im[bottom1]
-                    h1 = abs(yb1 - yt1)
-                    if top2 is not None and bottom2 is not None and top2 in im and bottom2 in im:
-                        xt2, yt2, _ = im[top2]
-                        xb2, yb2, _ = im[bottom2]
-                        h2 = abs(yb2 - yt2)
-                        h = 0.5 * (h1 + h2)
-                    else:
-                        h = h1
-                    # Return normalized EAR-like ratio (vertical/width)
-                    return max(0.0, h / (w + 1e-6))
-                except Exception:
-                    return 0.0
-            # Left: vertical pairs (159,145) and (160,144)
-            left_openness = ear(33, 133, 159, 145, 160, 144)
-            # Right: vertical pairs (386,374) and (385,380)
-            right_openness = ear(362, 263, 386, 374, 385, 380)
-        else:
-            left_openness = self._measure_eye_openness(features.get("left_eye", []))
-            right_openness = self._measure_eye_openness(features.get("right_eye", []))
+        
+        # EAR from the full mesh when available, else the eye regions' vertical spread
+        left_openness = geometry["left_eye_openness"]
+        right_openness = geometry["right_eye_openness"]
         avg_openness = (left_openness + right_openness) / 2
         
         eye_asymmetry = abs(left_openness - right_openness)
@@ -990,21 +1168,13 @@ class FeatureExtractor:
             "baseline_eye_openness": self.baseline_eye_openness or 0.0
         }
     
-    def _extract_posture_features(self, pose_data: Dict[str, Any]) -> Dict[str, float]:
+    def _extract_posture_features(self, geometry: Dict[str, float]) -> Dict[str, float]:
         """Extract posture measurements for ML training."""
-        if not pose_data or not pose_data.get("coordinates"):
+        if "shoulder_height_avg" not in geometry:
             return {"shoulder_height_avg": 0.0, "shoulder_asymmetry": 0.0, "head_shoulder_distance": 0.0, 
                    "shoulder_height_deviation": 0.0}
             
-        coords = pose_data["coordinates"]
-        
-        nose_y = coords[1]
-        left_shoulder_x, left_shoulder_y = coords[4], coords[5]
-        right_shoulder_x, right_shoulder_y = coords[8], coords[9]
-        
-        avg_shoulder_height = (left_shoulder_y + right_shoulder_y) / 2
-        shoulder_asymmetry = abs(left_shoulder_y - right_shoulder_y)
-        head_shoulder_distance = abs(nose_y - avg_shoulder_height)
+        avg_shoulder_height = geometry["shoulder_height_avg"]
         
         shoulder_height_deviation = 0.0
         if self.baseline_shoulder_height:
@@ -1012,12 +1182,12 @@ class FeatureExtractor:
         
         return {
             "shoulder_height_avg": avg_shoulder_height,
-            "shoulder_asymmetry": shoulder_asymmetry,
-            "head_shoulder_distance": head_shoulder_distance,
+            "shoulder_asymmetry": geometry["shoulder_asymmetry"],
+            "head_shoulder_distance": geometry["head_shoulder_distance"],
             "shoulder_height_deviation": shoulder_height_deviation,
             "baseline_shoulder_height": self.baseline_shoulder_height or 0.0,
-            "left_shoulder_height": left_shoulder_y,
-            "right_shoulder_height": right_shoulder_y
+            "left_shoulder_height": geometry["left_shoulder_height"],
+            "right_shoulder_height": geometry["right_shoulder_height"]
         }
     
     def _extract_temporal_features(self) -> Dict[str, float]:
@@ -1034,108 +1204,13 @@ class FeatureExtractor:
             "posture_stability": posture_stability
         }
     
-    def _extract_facial_landmarks(self, coords: List[float], breakdown: Dict[str, int]) -> Dict[str, List[Tuple[float, float, float]]]:
-        """Extract organized facial feature coordinates."""
-        features = {}
-        offset = 0
-        
-        for feature_name, count in breakdown.items():
-            feature_coords = []
-            for i in range(count):
-                idx = offset + i * 3
-                if idx + 2 < len(coords):
-                    feature_coords.append((coords[idx], coords[idx + 1], coords[idx + 2]))
-            features[feature_name] = feature_coords
-            offset += count * 3
-            
-        return features
-    
-    def _measure_eye_openness(self, eye_coords: List[Tuple[float, float, float]]) -> float:
-        """Measure eye openness ratio."""
-        if len(eye_coords) < 6:
-            return 1.0
-            
-        top_points = sorted(eye_coords, key=lambda p: p[1])[:3]
-        bottom_points = sorted(eye_coords, key=lambda p: p[1], reverse=True)[:3]
-        
-        avg_top_y = sum(p[1] for p in top_points) / len(top_points)
-        avg_bottom_y = sum(p[1] for p in bottom_points) / len(bottom_points)
-        
-        return max(0.0, avg_bottom_y - avg_top_y)
-    
-    def _measure_jaw(self, lip_coords: List[Tuple[float, float, float]]) -> Tuple[float, float]:
-        """Measure jaw width and height."""
-        if len(lip_coords) < 4:
-            return 0.0, 0.0
-            
-        left_most = min(lip_coords, key=lambda p: p[0])
-        right_most = max(lip_coords, key=lambda p: p[0])
-        top_most = min(lip_coords, key=lambda p: p[1])
-        bottom_most = max(lip_coords, key=lambda p: p[1])
-        
-        width = right_most[0] - left_most[0]
-        height = bottom_most[1] - top_most[1]
-        
-        return width, height
-    
-    def _measure_eyebrow_height(self, left_brow: List[Tuple[float, float, float]], 
-                               right_brow: List[Tuple[float, float, float]]) -> float:
-        """Measure average eyebrow height."""
-        if len(left_brow) < 3 or len(right_brow) < 3:
-            return 0.0
-            
-        left_avg_y = sum(p[1] for p in left_brow) / len(left_brow)
-        right_avg_y = sum(p[1] for p in right_brow) / len(right_brow)
-        
-        return (left_avg_y + right_avg_y) / 2
-    
-    def _measure_eyebrow_distance(self, left_brow: List[Tuple[float, float, float]], 
-                                 right_brow: List[Tuple[float, float, float]]) -> float:
-        """Measure distance between eyebrows."""
-        if len(left_brow) < 3 or len(right_brow) < 3:
-            return 0.0
-            
-        left_inner = min(left_brow, key=lambda p: abs(p[0] - 0.5))
-        right_inner = min(right_brow, key=lambda p: abs(p[0] - 0.5))
-        
-        return abs(right_inner[0] - left_inner[0])
-    
-    def _measure_lip_thickness(self, lip_coords: List[Tuple[float, float, float]]) -> float:
-        """Measure lip thickness."""
-        if len(lip_coords) < 8:
-            return 0.0
-            
-        center_y = sum(p[1] for p in lip_coords) / len(lip_coords)
-        upper_lip = [p for p in lip_coords if p[1] < center_y]
-        lower_lip = [p for p in lip_coords if p[1] >= center_y]
-        
-        if len(upper_lip) == 0 or len(lower_lip) == 0:
-            return 0.0
-            
-        avg_upper_y = sum(p[1] for p in upper_lip) / len(upper_lip)
-        avg_lower_y = sum(p[1] for p in lower_lip) / len(lower_lip)
-        
-        return avg_lower_y - avg_upper_y
-    
-    def _measure_mouth_curvature(self, lip_coords: List[Tuple[float, float, float]]) -> float:
-        """Measure mouth curvature (positive = upward, negative = downward)."""
-        if len(lip_coords) < 6:
-            return 0.0
-            
-        left_corner = min(lip_coords, key=lambda p: p[0])
-        right_corner = max(lip_coords, key=lambda p: p[0])
-        center_y = sum(p[1] for p in lip_coords) / len(lip_coords)
-        
-        corner_avg_y = (left_corner[1] + right_corner[1]) / 2
-        
-        return center_y - corner_avg_y
-    
+    # The histories are 30 samples: plain float arithmetic over ``last().tolist()`` beats numpy reductions there
     def _compute_breathing_variability(self) -> float:
         """Compute breathing variability from recent history."""
-        if len(self.breathing_history) < 5:
+        if len(self.bpm_history) < 5:
             return 0.0
             
-        bpm_values = [b["bpm"] for b in self.breathing_history if b["bpm"] > 0]
+        bpm_values = [bpm for bpm in self.bpm_history.last().tolist() if bpm > 0]
         if len(bpm_values) < 3:
             return 0.0
             
@@ -1146,10 +1221,10 @@ class FeatureExtractor:
     
     def _compute_breathing_trend(self) -> float:
         """Compute breathing rate trend over time."""
-        if len(self.breathing_history) < 10:
+        if len(self.bpm_history) < 10:
             return 0.0
             
-        bpm_values = [b["bpm"] for b in self.breathing_history if b["bpm"] > 0]
+        bpm_values = [bpm for bpm in self.bpm_history.last().tolist() if bpm > 0]
         if len(bpm_values) < 5:
             return 0.0
             
@@ -1161,10 +1236,10 @@ class FeatureExtractor:
     
     def _compute_facial_stability(self) -> float:
         """Compute facial feature stability over time."""
-        if len(self.facial_history) < 5:
+        if len(self.jaw_width_history) < 5:
             return 1.0
             
-        jaw_widths = [f.get("jaw_width", 0) for f in self.facial_history if f.get("jaw_width", 0) > 0]
+        jaw_widths = [w for w in self.jaw_width_history.last().tolist() if w > 0]
         if len(jaw_widths) < 3:
             return 1.0
             
@@ -1175,13 +1250,10 @@ class FeatureExtractor:
     
     def _compute_eye_trend(self) -> float:
         """Compute eye openness trend over time."""
-        if len(self.eye_history) < 10:
-            return 0.0
-            
-        openness_values = [e.get("avg_eye_openness", 1.0) for e in self.eye_history]
-        if len(openness_values) < 5:
+        if len(self.eye_openness_history) < 10:
             return 0.0
             
+        openness_values = self.eye_openness_history.last().tolist()
         mid = len(openness_values) // 2
         first_half_avg = sum(openness_values[:mid]) / mid
         second_half_avg = sum(openness_values[mid:]) / (len(openness_values) - mid)
@@ -1190,10 +1262,10 @@ class FeatureExtractor:
     
     def _compute_posture_stability(self) -> float:
         """Compute posture stability over time."""
-        if len(self.posture_history) < 5:
+        if len(self.shoulder_height_history) < 5:
             return 1.0
             
-        shoulder_heights = [p.get("shoulder_height_avg", 0) for p in self.posture_history if p.get("shoulder_height_avg", 0) > 0]
+        shoulder_heights = [h for h in self.shoulder_height_history.last().tolist() if h > 0]
         if len(shoulder_heights) < 3:
             return 1.0
             
@@ -1204,9 +1276,9 @@ class FeatureExtractor:
     
     def _update_history(self, features: Dict[str, Any]):
         """Update historical data for temporal features."""
-        self.facial_history.append(features["facial_features"])
-        self.eye_history.append(features["eye_features"])
-        self.posture_history.append(features["posture_features"])
+        self.jaw_width_history.append(features["facial_features"].get("jaw_width", 0.0))
+        self.eye_openness_history.append(features["eye_features"].get("avg_eye_openness", 1.0))
+        self.shoulder_height_history.append(features["posture_features"].get("shoulder_height_avg", 0.0))
         
         if self.baseline_samples < self.baseline_target:
             self._update_baseline(features)
@@ -1252,92 +1324,332 @@ class AgentState(TypedDict):
     status: str
     landmark_data: Optional[Dict[str, Any]]
 
-def load_latest_frame() -> Optional[np.ndarray]:
-    """Load the latest frame with corruption protection and multiple attempts."""
-    frame_dir = os.path.join(os.path.dirname(__file__), "frames")
-    frame_path = os.path.join(frame_dir, "latest_frame.jpg")
-    
-    # Try multiple times with small delays to avoid race conditions
-    for attempt in range(3):
-        try:
-            # Check if file exists and has reasonable size (> 1KB to avoid partial writes)
-            if os.path.exists(frame_path):
-                file_size = os.path.getsize(frame_path)
-                if file_size > 1024:  # At least 1KB for a valid JPEG
-                    
-                    # Additional check: Try to read file as binary to detect truncation
-                    with open(frame_path, 'rb') as f:
-                        data = f.read()
-                        # Check for JPEG end marker (FFD9)
-                        if len(data) >= 2 and data[-2:] == b'\xff\xd9':
-                            # Suppress OpenCV JPEG warnings for corrupted files
-                            with suppress_stderr():
-                                frame = cv2.imread(frame_path, cv2.IMREAD_COLOR)
-                                if frame is not None and frame.size > 0:
-                                    return frame
-                        else:
-                            # JPEG is truncated/incomplete, skip this attempt
-                            pass
-            
-            # Small delay before retry to let WebRTC finish writing
-            if attempt < 2:
-                time.sleep(0.002)  # Increased delay
-                
-        except Exception as e:
-            if attempt == 2:  # Only log on final attempt
-                if not hasattr(load_latest_frame, 'error_count'):
-                    load_latest_frame.error_count = 0
-                load_latest_frame.error_count += 1
-                
-                if load_latest_frame.error_count % 50 == 1:
-                    print(f"⚠️ Failed to load frame after {attempt+1} attempts: {e}")
-    
-    return None
+def _default_frame_source(shm_name: Optional[str] = None, frame_file: Optional[str] = None) -> FrameSource:
+    """Live frames from main.py: the shared-memory ring if enabled, then the JPEG file."""
+    jpeg = JpegFileSource(frame_file or os.path.join(os.path.dirname(__file__), "frames", "latest_frame.jpg"),
+                          read_guard=suppress_stderr)
+    if FRAME_TRANSPORT == "shm":
+        return LiveFrameSource([SharedMemorySource(shm_name) if shm_name else SharedMemorySource(), jpeg])
+    return LiveFrameSource([jpeg])
+
+
+FRAME_WAIT_TIMEOUT = float(os.getenv("FRAME_WAIT_TIMEOUT", "0.1"))
+# Run FaceMesh on a helper thread while Pose runs on the caller (both release the GIL in native code)
+CONCURRENT_MODELS = os.getenv("AGENT_CONCURRENT_MODELS", "0").lower() in ("1", "true", "yes", "on")
+
+
+class AgentPipeline:
+    """
+    Everything one video stream needs between frames: its frame source, MediaPipe
+    models (they track across frames), breathing/feature/window state, where
+    finished windows go, and frame accounting. One per session; the module-level
+    default serves the single-stream agent process.
+    """
+
+    def __init__(self, source: Optional[FrameSource] = None,
+                 on_window: Optional[Callable[[Dict[str, Any]], None]] = None, name: str = "default",
+                 concurrent_models: Optional[bool] = None, pose_hz: Optional[float] = None,
+                 face_hz: Optional[float] = None, adaptive_cadence: Optional[bool] = None):
+        self.name = name
+        self.source = source if source is not None else _default_frame_source()
+        # When set, finished windows are handed to this callable instead of printed as JSON
+        self.on_window = on_window
+        self.breathing_tracker = BreathingTracker(fps=30.0, window_seconds=5.0)
+        self.feature_extractor = FeatureExtractor()
+        self.ml_aggregator = MLDataAggregator(window_seconds=5, fps=30.0)
+        self.pose_model = None
+        self.face_model = None
+        self.concurrent_models = CONCURRENT_MODELS if concurrent_models is None else concurrent_models
+        self._model_executor: Optional[ThreadPoolExecutor] = None
+        # Keyframe rates per model; frames in between get extrapolated landmarks
+        adaptive = CADENCE_ADAPTIVE if adaptive_cadence is None else adaptive_cadence
+        self.pose_cadence = ModelCadence(POSE_HZ if pose_hz is None else pose_hz, adaptive=adaptive)
+        self.face_cadence = ModelCadence(FACE_HZ if face_hz is None else face_hz, adaptive=adaptive)
+        # Per-stage wall time (ms) summed over frames: pose/face graph time, detect = both graphs' wall
+        # time (less than pose + face when they overlap), total = whole frame
+        self.stage_ms = {"pose": 0.0, "face": 0.0, "detect": 0.0, "total": 0.0}
+        self.stage_frames = {"detect": 0, "total": 0}
+        # Frame accounting, exported via stats() and logged periodically
+        self.frame_stats = {
+            "processed": 0,    # frames that went through detection
+            "skipped": 0,      # frames published by the producer but superseded before we got to them
+            "duplicates": 0,   # already-processed frames handed to detection again (rejected, not reprocessed)
+            "idle_polls": 0,   # polls that found no new frame
+            "reads": 0,        # frame reads/decodes (one per processed frame when capture hands off via FrameSlot)
+            "read_ms": 0.0,    # total time spent reading/decoding frames
+        }
+        self.last_seq: Dict[str, int] = {}  # last processed sequence id per frame source
+        # Busy time per processed frame; advertised to the producer so it only decodes frames we can use
+        self.processing_rate = ProcessingRate()
+        # Capture -> detection age of each processed frame: the latency the user actually perceives
+        self.frame_age = FrameAgeStats()
+        self.fps_log: Optional[Dict[str, float]] = None
+        self.detection_stats = {"pose_success": 0, "face_success": 0, "total_frames": 0}
+
+    def ensure_models(self) -> None:
+        if self.pose_model is None:
+            with suppress_stderr():
+                self.pose_model = mp_pose.Pose(
+                    static_image_mode=False,
+                    model_complexity=0,  # Fastest model
+                    enable_segmentation=False,
+                    min_detection_confidence=0.5,
+                    min_tracking_confidence=0.5
+                )
+        if self.face_model is None:
+            with suppress_stderr():
+                self.face_model = mp_face_mesh.FaceMesh(
+                    static_image_mode=False,
+                    max_num_faces=1,
+                    refine_landmarks=True,
+                    min_detection_confidence=0.5,
+                    min_tracking_confidence=0.5
+                )
+
+    def run_models(self, rgb_frame: np.ndarray, timestamp: float) -> Tuple[Any, Any]:
+        """
+        Pose and FaceMesh results for one RGB frame. A model that is not due per its
+        cadence returns landmarks extrapolated from its last keyframes instead; two due
+        models overlap when ``concurrent_models`` is set.
+        """
+        start = time.perf_counter()
+        run_pose = self.pose_cadence.due(timestamp)
+        run_face = self.face_cadence.due(timestamp)
+        pose_ms = face_ms = 0.0
+        face_future = None
+        if run_pose and run_face and self.concurrent_models:
+            if self._model_executor is None:
+                self._model_executor = ThreadPoolExecutor(max_workers=1,
+                                                          thread_name_prefix=f"facemesh-{self.name}")
+            face_future = self._model_executor.submit(_timed_process, self.face_model, rgb_frame)
+        if run_pose:
+            pose_results, pose_ms = _timed_process(self.pose_model, rgb_frame)
+            self.pose_cadence.keyframe(timestamp, pose_results.pose_landmarks)
+        else:
+            pose_results = as_pose_results(self.pose_cadence.predict(timestamp))
+        if run_face:
+            face_results, face_ms = face_future.result() if face_future else _timed_process(self.face_model, rgb_frame)
+            faces = face_results.multi_face_landmarks
+            self.face_cadence.keyframe(timestamp, faces[0] if faces else None)
+        else:
+            face_results = as_face_results(self.face_cadence.predict(timestamp))
+        self.stage_ms["pose"] += pose_ms
+        self.stage_ms["face"] += face_ms
+        self.stage_ms["detect"] += (time.perf_counter() - start) * 1000.0
+        self.stage_frames["detect"] += 1
+        return pose_results, face_results
+
+    def stage_timings(self) -> Dict[str, float]:
+        """Mean ms/frame per stage; ``overlap_saved`` is pose + face minus the detect wall time."""
+        n = max(1, self.stage_frames["detect"])
+        timings = {stage: self.stage_ms[stage] / n for stage in ("pose", "face", "detect")}
+        timings["total"] = self.stage_ms["total"] / max(1, self.stage_frames["total"])
+        timings["overlap_saved"] = timings["pose"] + timings["face"] - timings["detect"]
+        return timings
+
+    def keyframe_ratios(self) -> Dict[str, float]:
+        """Fraction of frames each model actually ran on (1.0 at full cadence)."""
+        ratios = {}
+        for model, cadence in (("pose", self.pose_cadence), ("face", self.face_cadence)):
+            ratios[model] = cadence.runs / max(1, cadence.runs + cadence.predicted)
+        return ratios
+
+    def export_state(self) -> Dict[str, Any]:
+        """Picklable per-stream state (no models, no source), for moving a session between workers."""
+        return {
+            "breathing_tracker": self.breathing_tracker,
+            "feature_extractor": self.feature_extractor,
+            "ml_aggregator": self.ml_aggregator,
+        }
+
+    def import_state(self, state: Dict[str, Any]) -> None:
+        self.breathing_tracker = state["breathing_tracker"]
+        self.feature_extractor = state["feature_extractor"]
+        self.ml_aggregator = state["ml_aggregator"]
+
+    def take_models(self) -> Tuple[Any, Any]:
+        """Hand the (warm) MediaPipe models to another pipeline instead of closing them."""
+        models, self.pose_model, self.face_model = (self.pose_model, self.face_model), None, None
+        return models
+
+    def stats(self) -> Dict[str, float]:
+        stats = dict(self.frame_stats)
+        ages = self.frame_age.percentiles()
+        stats["frame_age_p50_ms"] = ages["p50"]
+        stats["frame_age_p95_ms"] = ages["p95"]
+        stats["frame_age_max_ms"] = ages["max"]
+        for stage, ms in self.stage_timings().items():
+            stats[f"{stage}_ms"] = ms
+        for model, ratio in self.keyframe_ratios().items():
+            stats[f"{model}_keyframe_ratio"] = ratio
+        return stats
+
+    def close(self) -> None:
+        for model in (self.pose_model, self.face_model):
+            if model is not None:
+                try:
+                    model.close()
+                except Exception:
+                    pass
+        self.pose_model = self.face_model = None
+        if self._model_executor is not None:
+            self._model_executor.shutdown(wait=True)
+            self._model_executor = None
+        self.source.close()
+
+
+def _timed_process(model, rgb_frame: np.ndarray) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    results = model.process(rgb_frame)
+    return results, (time.perf_counter() - start) * 1000.0
+
+
+_DEFAULT_PIPELINE = AgentPipeline()
+
+
+def set_frame_source(source: FrameSource) -> FrameSource:
+    """Swap where the default pipeline reads from (e.g. a ReplaySource); returns the previous source."""
+    previous, _DEFAULT_PIPELINE.source = _DEFAULT_PIPELINE.source, source
+    return previous
+
+
+def get_frame_stats(pipeline: Optional[AgentPipeline] = None) -> Dict[str, float]:
+    return (pipeline or _DEFAULT_PIPELINE).stats()
+
+
+def get_processing_fps(pipeline: Optional[AgentPipeline] = None) -> float:
+    """Frames/sec the pipeline can sustain, from the EMA of per-frame processing time."""
+    return (pipeline or _DEFAULT_PIPELINE).processing_rate.fps
+
+
+class FrameSlot:
+    """
+    Side channel that carries the decoded frame from capture_frame_node to
+    detect_pose_node, so each frame is read/decoded once and never enters AgentState.
+    """
+
+    def __init__(self):
+        self._frame: Optional[Frame] = None
+
+    def put(self, frame: Frame) -> None:
+        self._frame = frame
+
+    def take(self) -> Optional[Frame]:
+        frame, self._frame = self._frame, None
+        return frame
+
+
+_FRAME_SLOT = FrameSlot()  # default slot for callers that don't build their own graph
+
+
+def read_latest_frame(pipeline: Optional[AgentPipeline] = None) -> Optional[Frame]:
+    """Newest frame with its sequence id and capture timestamp (timed for the read/decode stats)."""
+    pipeline = pipeline or _DEFAULT_PIPELINE
+    start = time.perf_counter()
+    try:
+        return pipeline.source.read()
+    finally:
+        pipeline.frame_stats["reads"] += 1
+        pipeline.frame_stats["read_ms"] += (time.perf_counter() - start) * 1000.0
 
 
-def capture_frame_node(state: AgentState) -> AgentState:
-    """Node: Probe for a new frame without storing it in state."""
-    frame = load_latest_frame()
+def load_latest_frame() -> Optional[np.ndarray]:
+    """Load the latest frame image (see read_latest_frame for sequence/timestamp)."""
+    latest = read_latest_frame()
+    return latest.image if latest is not None else None
+
+
+def has_new_frame(pipeline: Optional[AgentPipeline] = None) -> bool:
+    """Cheap check (no decode) whether a frame newer than the last processed one is available."""
+    return (pipeline or _DEFAULT_PIPELINE).source.has_new()
+
+
+def wait_for_new_frame(timeout: float = FRAME_WAIT_TIMEOUT, pipeline: Optional[AgentPipeline] = None) -> bool:
+    """Block until the frame source has a new frame id or the timeout expires."""
+    pipeline = pipeline or _DEFAULT_PIPELINE
+    if pipeline.source.wait(timeout):
+        return True
+    pipeline.frame_stats["idle_polls"] += 1
+    return False
+
+
+def _accept_frame(frame: Frame, pipeline: AgentPipeline) -> bool:
+    """Record a frame about to be processed; False if this id was already processed."""
+    stats = pipeline.frame_stats
+    last = pipeline.last_seq.get(frame.source, 0)
+    if frame.seq <= last:
+        stats["duplicates"] += 1
+        return False
+    if last:
+        stats["skipped"] += frame.seq - last - 1
+    pipeline.last_seq[frame.source] = frame.seq
+    stats["processed"] += 1
+    if stats["processed"] % 100 == 0:
+        processed = stats["processed"]
+        print(f"📈 Frame stats [{pipeline.name}]: processed={processed}, skipped={stats['skipped']}, "
+              f"duplicates={stats['duplicates']}, idle_polls={stats['idle_polls']}, "
+              f"reads/frame={stats['reads'] / processed:.2f}, "
+              f"read+decode={stats['read_ms'] / processed:.2f} ms/frame")
+        ages = pipeline.frame_age.percentiles()
+        print(f"⏱️ Frame age at detection [{pipeline.name}]: p50={ages['p50']:.0f} ms, p95={ages['p95']:.0f} ms, "
+              f"max={ages['max']:.0f} ms")
+        t = pipeline.stage_timings()
+        mode = "concurrent" if pipeline.concurrent_models else "sequential"
+        k = pipeline.keyframe_ratios()
+        print(f"🧩 Stage timings [{pipeline.name}]: pose {t['pose']:.1f} ms + face {t['face']:.1f} ms -> "
+              f"detect {t['detect']:.1f} ms wall ({mode}, saved {t['overlap_saved']:.1f} ms), "
+              f"total {t['total']:.1f} ms/frame; keyframes pose {k['pose']:.0%}, face {k['face']:.0%}")
+    return True
+
+
+def capture_frame_node(state: AgentState, frame_slot: Optional[FrameSlot] = None,
+                       pipeline: Optional[AgentPipeline] = None) -> AgentState:
+    """Node: Wait for a frame with a new sequence id, decode it once and park it in the frame slot."""
+    slot = frame_slot if frame_slot is not None else _FRAME_SLOT
+    frame = read_latest_frame(pipeline) if wait_for_new_frame(pipeline=pipeline) else None
     if frame is not None:
+        slot.put(frame)
         state["status"] = "frame_captured"
     else:
         state["status"] = "no_frame"
         if state.get("frame_count", 0) % 50 == 0:
-            print("⚠️ No frame available")
+            print("⚠️ No new frame available")
     return state
 
 
-def detect_pose_node(state: AgentState) -> AgentState:
+def detect_pose_node(state: AgentState, frame_slot: Optional[FrameSlot] = None,
+                     pipeline: Optional[AgentPipeline] = None) -> AgentState:
     """Node: Detect pose and face landmarks using MediaPipe for ML models with stress analysis."""
-    # Load frame locally, never store in state
-    frame = load_latest_frame()
-    
-    # Initialize components once as module-level singletons
-    global _BREATHING_TRACKER, _FEATURE_EXTRACTOR, _ML_AGGREGATOR, _POSE_MODEL, _FACE_MODEL
-    if _BREATHING_TRACKER is None:
-        _BREATHING_TRACKER = BreathingTracker(fps=30.0, window_seconds=5.0)
-    if _FEATURE_EXTRACTOR is None:
-        _FEATURE_EXTRACTOR = FeatureExtractor()
-    if _ML_AGGREGATOR is None:
-        _ML_AGGREGATOR = MLDataAggregator(window_seconds=5, fps=30.0)
-    if _POSE_MODEL is None:
-        with suppress_stderr():
-            _POSE_MODEL = mp_pose.Pose(
-                static_image_mode=False,
-                model_complexity=0,  # Fastest model
-                enable_segmentation=False,
-                min_detection_confidence=0.5,
-                min_tracking_confidence=0.5
-            )
-    if _FACE_MODEL is None:
-        with suppress_stderr():
-            _FACE_MODEL = mp_face_mesh.FaceMesh(
-                static_image_mode=False,
-                max_num_faces=1,
-                refine_landmarks=True,
-                min_detection_confidence=0.5,
-                min_tracking_confidence=0.5
-            )
+    # Take the frame decoded by capture_frame_node; never store it in state
+    slot = frame_slot if frame_slot is not None else _FRAME_SLOT
+    return process_frame(state, slot.take(), pipeline)
+
+
+def process_frame(state: AgentState, frame: Optional[Frame], pipeline: Optional[AgentPipeline] = None) -> AgentState:
+    """Run pose/face detection and feature extraction on one frame, tracking processing capacity."""
+    pipeline = pipeline or _DEFAULT_PIPELINE
+    source = pipeline.source
+    start = time.perf_counter()
+    age_ms = (time.time() - frame.timestamp) * 1000.0 if frame is not None else 0.0
+    if frame is not None:
+        # Tell the producer this frame is taken, so it can publish the next one
+        source.mark_consumed(frame, age_ms)
+    state = _process_frame(state, frame, pipeline)
+    if state.get("status") not in ("no_frame", "stale_frame"):
+        if source.live:
+            pipeline.frame_age.record(age_ms)
+        elapsed = time.perf_counter() - start
+        pipeline.stage_ms["total"] += elapsed * 1000.0
+        pipeline.stage_frames["total"] += 1
+        pipeline.processing_rate.update(elapsed)
+        source.publish_processing_fps(frame, pipeline.processing_rate.fps)
+    return state
+
+
+def _process_frame(state: AgentState, frame: Optional[Frame], pipeline: AgentPipeline) -> AgentState:
+    """Run pose/face detection and feature extraction on one BGR or RGB frame."""
+    # Trackers are created with the pipeline; MediaPipe models load on first use
+    pipeline.ensure_models()
     
     # TEMPORARILY DISABLE model recreation to prevent crashes
     # The periodic model recreation might be causing SIGABRT crashes
@@ -1378,18 +1690,25 @@ def detect_pose_node(state: AgentState) -> AgentState:
     if frame is None:
         state["status"] = "no_frame"
         return state
+    # Never run detection twice on the same frame id (it would skew window statistics)
+    if not _accept_frame(frame, pipeline):
+        state["status"] = "stale_frame"
+        return state
+    capture_ts = frame.timestamp
+    is_rgb = frame.pixel_format == "rgb24"
+    frame = frame.image
 
     # Count only processed frames and track processing FPS
     state["frame_count"] = state.get("frame_count", 0) + 1
-    if not hasattr(detect_pose_node, "_fps_log"):
-        detect_pose_node._fps_log = {"last_time": time.time(), "last_count": state["frame_count"]}
+    if pipeline.fps_log is None:
+        pipeline.fps_log = {"last_time": time.time(), "last_count": state["frame_count"]}
     if state["frame_count"] % 60 == 0:
         now = time.time()
-        delta_t = now - detect_pose_node._fps_log["last_time"]
-        delta_c = state["frame_count"] - detect_pose_node._fps_log["last_count"]
+        delta_t = now - pipeline.fps_log["last_time"]
+        delta_c = state["frame_count"] - pipeline.fps_log["last_count"]
         fps_proc = delta_c / max(1e-6, delta_t)
         print(f"⏱️ Processing FPS (detect node): {fps_proc:.1f} fps")
-        detect_pose_node._fps_log = {"last_time": now, "last_count": state["frame_count"]}
+        pipeline.fps_log = {"last_time": now, "last_count": state["frame_count"]}
 
     try:
         # Additional safety: Check if frame is valid before processing
@@ -1402,22 +1721,26 @@ def detect_pose_node(state: AgentState) -> AgentState:
             state["status"] = "invalid_frame_dimensions"
             return state
         
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # The producer normally delivers RGB already (see INGEST_RESOLUTION in main.py)
+        rgb_frame = frame if is_rgb else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         landmark_data = {
             "pose_landmarks": None,
             "face_landmarks": None,
             "breathing": {"bpm": 0.0, "confidence": 0.0, "calibrated": False},
             "stress_analysis": {},
-            "timestamp": time.time()
+            "timestamp": capture_ts
         }
         
         # Use pre-initialized models for much better performance
         pose_detected = False
         shoulder_visibility = {"left": 0.0, "right": 0.0}
         
+        # Both graphs run here (overlapped on the pipeline's helper thread if enabled); a single
+        # suppress_stderr spans them because its fd swap is process-wide
+        with suppress_stderr():
+            pose_results, face_results = pipeline.run_models(rgb_frame, capture_ts)
+        
         with suppress_stderr():
-            pose_results = _POSE_MODEL.process(rgb_frame)
-            
             # IMMEDIATE cleanup of pose_results to prevent C++ memory accumulation
             pose_landmarks = None
             if pose_results.pose_landmarks:
@@ -1425,30 +1748,21 @@ def detect_pose_node(state: AgentState) -> AgentState:
                 pose_landmarks = pose_results.pose_landmarks
                 pose_detected = True
                 
-                # Get critical landmarks
-                landmarks = pose_landmarks.landmark
-                nose = landmarks[mp_pose.PoseLandmark.NOSE.value]
-                left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-                right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
+                # Critical landmarks as one (3, 4) array: nose, left/right shoulder x, y, z, visibility
+                pose_points = landmark_array(pose_landmarks, 4)[POSE_INDEX]
+                nose, left_shoulder, right_shoulder = pose_points.tolist()
                 
-                shoulder_visibility["left"] = left_shoulder.visibility
-                shoulder_visibility["right"] = right_shoulder.visibility
+                shoulder_visibility["left"] = left_shoulder[3]
+                shoulder_visibility["right"] = right_shoulder[3]
             
             # Immediately delete pose_results to free C++ memory
             del pose_results
             
             if pose_detected:
-                # Use the landmarks we already extracted
-                selected_pose_coords = []
-                
-                selected_pose_coords.extend([nose.x, nose.y, nose.z, nose.visibility])
-                selected_pose_coords.extend([left_shoulder.x, left_shoulder.y, left_shoulder.z, left_shoulder.visibility])
-                selected_pose_coords.extend([right_shoulder.x, right_shoulder.y, right_shoulder.z, right_shoulder.visibility])
-                
                 landmark_data["pose_landmarks"] = {
-                    "coordinates": selected_pose_coords,
+                    "points": pose_points,
                     "num_landmarks": 3,
-                    "landmarks": ["nose", "left_shoulder", "right_shoulder"]
+                    "landmarks": list(POSE_NAMES)
                 }
                 
                 # Log MediaPipe detection quality every 20 frames
@@ -1457,8 +1771,8 @@ def detect_pose_node(state: AgentState) -> AgentState:
                           f"Pose detected: {pose_detected}, "
                           f"Left shoulder vis: {shoulder_visibility['left']:.3f}, "
                           f"Right shoulder vis: {shoulder_visibility['right']:.3f}")
-                    print(f"   Shoulder positions: L=({left_shoulder.x:.3f},{left_shoulder.y:.3f},{left_shoulder.z:.3f}), "
-                          f"R=({right_shoulder.x:.3f},{right_shoulder.y:.3f},{right_shoulder.z:.3f})")
+                    print(f"   Shoulder positions: L=({left_shoulder[0]:.3f},{left_shoulder[1]:.3f},{left_shoulder[2]:.3f}), "
+                          f"R=({right_shoulder[0]:.3f},{right_shoulder[1]:.3f},{right_shoulder[2]:.3f})")
                 
                 # Monitor memory usage every 20 frames for early detection (reduced frequency)
                 if state["frame_count"] % 20 == 1:
@@ -1527,9 +1841,9 @@ def detect_pose_node(state: AgentState) -> AgentState:
                                     print(f"   ⚠️ Memory profiling failed: {e}")
                                 
                                 # Clear breathing tracker buffer
-                                if _BREATHING_TRACKER is not None:
+                                if pipeline.breathing_tracker is not None:
                                     try:
-                                        tracker = _BREATHING_TRACKER
+                                        tracker = pipeline.breathing_tracker
                                         if hasattr(tracker, 'breathing_signal') and len(tracker.breathing_signal) > 0:
                                             print(f"   Clearing breathing tracker buffer (had {len(tracker.breathing_signal)} points)")
                                             tracker.breathing_signal.clear()
@@ -1540,18 +1854,18 @@ def detect_pose_node(state: AgentState) -> AgentState:
                                         print(f"   ⚠️ Error clearing breathing tracker: {bt_error}")
                                 
                                 # Clear feature extractor data
-                                if _FEATURE_EXTRACTOR is not None:
+                                if pipeline.feature_extractor is not None:
                                     try:
-                                        fe = _FEATURE_EXTRACTOR
+                                        fe = pipeline.feature_extractor
                                         # Clear any internal buffers the feature extractor might have
                                         print("   ✅ Feature extractor cleared")
                                     except Exception as fe_error:
                                         print(f"   ⚠️ Error clearing feature extractor: {fe_error}")
                                 
                                 # Clear ML aggregator buffer (this is the big one!)
-                                if _ML_AGGREGATOR is not None:
+                                if pipeline.ml_aggregator is not None:
                                     try:
-                                        aggregator = _ML_AGGREGATOR
+                                        aggregator = pipeline.ml_aggregator
                                         print(f"   Clearing ML aggregator buffer (had {len(aggregator.data_buffer)} frames)")
                                         aggregator.data_buffer.clear()
                                         print("   ✅ ML aggregator buffer cleared")
@@ -1601,17 +1915,17 @@ def detect_pose_node(state: AgentState) -> AgentState:
                 
                 # Require reasonable shoulder visibility to update breathing (reduces noise)
                 if (shoulder_visibility["left"] > 0.5 and shoulder_visibility["right"] > 0.5):
-                    breathing_result = _BREATHING_TRACKER.update(
+                    breathing_result = pipeline.breathing_tracker.update(
                         timestamp=landmark_data["timestamp"],
-                        nose=(nose.x, nose.y, nose.z),
-                        left_shoulder=(left_shoulder.x, left_shoulder.y, left_shoulder.z),
-                        right_shoulder=(right_shoulder.x, right_shoulder.y, right_shoulder.z)
+                        nose=tuple(nose[:3]),
+                        left_shoulder=tuple(left_shoulder[:3]),
+                        right_shoulder=tuple(right_shoulder[:3])
                     )
                 else:
                     breathing_result = {
                         "bpm": 0.0,
                         "confidence": 0.0,
-                        "calibrated": _BREATHING_TRACKER.is_calibrated if _BREATHING_TRACKER else False,
+                        "calibrated": pipeline.breathing_tracker.is_calibrated if pipeline.breathing_tracker else False,
                         "status": "low_visibility"
                     }
                 
@@ -1642,16 +1956,12 @@ def detect_pose_node(state: AgentState) -> AgentState:
         # Immediate cleanup after pose processing to prevent memory accumulation
         try:
             del pose_results
-            if 'landmarks' in locals():
-                del landmarks
             if 'nose' in locals():
                 del nose, left_shoulder, right_shoulder
         except Exception:
             pass
         
         with suppress_stderr():
-            face_results = _FACE_MODEL.process(rgb_frame)
-            
             # IMMEDIATE extraction and cleanup to prevent C++ memory accumulation
             face_landmarks = None
             if face_results.multi_face_landmarks:
@@ -1663,84 +1973,17 @@ def detect_pose_node(state: AgentState) -> AgentState:
             del face_results
             
             if face_landmarks:
-                
-                selected_face_coords = []
-                
-                # Corrected eye landmark indices (MediaPipe FaceMesh 468 topology)
-                # Left eye (subject's left, image right): corners 33 (outer), 133 (inner), top ~159, bottom ~145
-                left_eye_indices = [33, 133, 159, 145, 160, 158, 144, 153, 163, 7, 246]
-                # Right eye: corners 362 (inner), 263 (outer), top ~386, bottom ~374
-                right_eye_indices = [362, 263, 386, 374, 385, 387, 380, 373, 390, 466]
-                left_eyebrow_indices = [276, 282, 283, 285, 293, 295, 296, 300, 334, 336]
-                right_eyebrow_indices = [46, 52, 53, 55, 63, 65, 66, 70, 105, 107]
-                lips_indices = [0, 13, 14, 17, 37, 39, 40, 61, 78, 80, 81, 82, 84, 87, 88, 91, 95, 146, 178, 181, 185, 191, 267, 269, 270, 291, 308, 310, 311, 312, 314, 317, 318, 321, 324, 375, 402, 405, 409, 415]
-                face_oval_indices = [10, 21, 54, 58, 67, 93, 103, 109, 127, 132, 136, 148, 149, 150, 152, 162, 172, 176, 234, 251, 284, 288, 297, 323, 332, 338, 356, 361, 365, 377, 378, 379, 389, 397, 400, 454]
-                nose_indices = [1, 2, 6, 168, 3, 51, 48, 115, 131, 134, 102, 49, 220, 305, 281, 275]
-                
-                def extract_landmark_coords(indices):
-                    coords = []
-                    for idx in indices:
-                        if idx < len(face_landmarks.landmark):
-                            lm = face_landmarks.landmark[idx]
-                            coords.extend([lm.x, lm.y, lm.z])
-                    return coords, len(indices)
-                
-                left_eye_coords, left_eye_count = extract_landmark_coords(left_eye_indices)
-                right_eye_coords, right_eye_count = extract_landmark_coords(right_eye_indices)
-                left_eyebrow_coords, left_eyebrow_count = extract_landmark_coords(left_eyebrow_indices)
-                right_eyebrow_coords, right_eyebrow_count = extract_landmark_coords(right_eyebrow_indices)
-                nose_coords, nose_count = extract_landmark_coords(nose_indices)
-                lips_coords, lips_count = extract_landmark_coords(lips_indices)
-                face_oval_coords, face_oval_count = extract_landmark_coords(face_oval_indices)
-                
-                selected_face_coords.extend(left_eye_coords)
-                selected_face_coords.extend(right_eye_coords)
-                selected_face_coords.extend(left_eyebrow_coords)
-                selected_face_coords.extend(right_eyebrow_coords)
-                selected_face_coords.extend(nose_coords)
-                selected_face_coords.extend(lips_coords)
-                selected_face_coords.extend(face_oval_coords)
-                
-                total_face_landmarks = (left_eye_count + right_eye_count + left_eyebrow_count + 
-                                      right_eyebrow_count + nose_count + lips_count + face_oval_count)
-                
-                # Build an index_map for essential eye openness landmarks (EAR-style)
-                # Include multiple vertical pairs to make EAR more robust to noise
-                essential_indices = set([
-                    33, 133, 145, 159, 160, 144,      # Left eye: corners + two vertical pairs
-                    362, 263, 374, 386, 385, 380       # Right eye: corners + two vertical pairs
-                ])
-                index_map = {}
-                for idx in essential_indices:
-                    if idx < len(face_landmarks.landmark):
-                        lm = face_landmarks.landmark[idx]
-                        index_map[idx] = [lm.x, lm.y, lm.z]
-
+                # Whole mesh as one (N, 3) float32 array; the region subset is a single gather and each
+                # region a view of it (see landmark_arrays.FACE_REGIONS)
+                mesh = landmark_array(face_landmarks, 3)
+                points = face_subset(mesh)
                 landmark_data["face_landmarks"] = {
-                    "coordinates": selected_face_coords,
-                    "num_landmarks": total_face_landmarks,
-                    "feature_breakdown": {
-                        "left_eye": left_eye_count,
-                        "right_eye": right_eye_count,
-                        "left_eyebrow": left_eyebrow_count,
-                        "right_eyebrow": right_eyebrow_count,
-                        "nose": nose_count,
-                        "lips": lips_count,
-                        "face_oval": face_oval_count
-                    },
-                    "feature_vector_length": len(selected_face_coords),
-                    "index_map": index_map
+                    "points": points,
+                    "mesh": mesh,
+                    "num_landmarks": len(points),
+                    "feature_breakdown": dict(FACE_REGION_COUNTS),
+                    "feature_vector_length": points.size,
                 }
-            
-            # Immediate cleanup after face processing to prevent memory accumulation
-            try:
-                if 'selected_face_coords' in locals():
-                    del selected_face_coords
-                if 'left_eye_coords' in locals():
-                    del left_eye_coords, right_eye_coords, left_eyebrow_coords, right_eyebrow_coords
-                    del nose_coords, lips_coords, face_oval_coords
-            except Exception:
-                pass
         
         # CRITICAL: Immediately cleanup the large rgb_frame numpy array
         try:
@@ -1750,7 +1993,7 @@ def detect_pose_node(state: AgentState) -> AgentState:
 
         # Store minimal data in state and compute ML features
         state["landmark_data"] = landmark_data
-        ml_features = _FEATURE_EXTRACTOR.extract_features(landmark_data)
+        ml_features = pipeline.feature_extractor.extract_features(landmark_data)
         landmark_data["ml_features"] = ml_features
         
         # Periodic sanity log of key features to catch flatlines
@@ -1806,19 +2049,17 @@ def detect_pose_node(state: AgentState) -> AgentState:
                 print("� No landmarks detected")
 
         # Detection stats
-        if not hasattr(detect_pose_node, 'detection_stats'):
-            detect_pose_node.detection_stats = {"pose_success": 0, "face_success": 0, "total_frames": 0}
-        detect_pose_node.detection_stats["total_frames"] += 1
+        pipeline.detection_stats["total_frames"] += 1
         if has_pose:
-            detect_pose_node.detection_stats["pose_success"] += 1
+            pipeline.detection_stats["pose_success"] += 1
         if has_face:
-            detect_pose_node.detection_stats["face_success"] += 1
+            pipeline.detection_stats["face_success"] += 1
         if state.get("frame_count", 0) % 100 == 0:
-            stats = detect_pose_node.detection_stats
+            stats = pipeline.detection_stats
             pose_rate = (stats["pose_success"] / stats["total_frames"]) * 100 if stats["total_frames"] > 0 else 0
             face_rate = (stats["face_success"] / stats["total_frames"]) * 100 if stats["total_frames"] > 0 else 0
             print(f"📊 Detection Success Rates (last 100 frames): Pose={pose_rate:.1f}%, Face={face_rate:.1f}%")
-            detect_pose_node.detection_stats = {"pose_success": 0, "face_success": 0, "total_frames": 0}
+            pipeline.detection_stats = {"pose_success": 0, "face_success": 0, "total_frames": 0}
                 
     except Exception as e:
         print(f"❌ LANDMARK DETECTION ERROR: {e}")
@@ -1843,16 +2084,20 @@ def detect_pose_node(state: AgentState) -> AgentState:
     
     return state
 
-def export_landmark_data_node(state: AgentState) -> AgentState:
+def export_landmark_data_node(state: AgentState, pipeline: Optional[AgentPipeline] = None) -> AgentState:
     """Node: Export aggregated ML data over time windows."""
+    if state.get("status") in ("no_frame", "stale_frame", "invalid_frame", "invalid_frame_dimensions"):
+        # No new detection this iteration; re-adding the previous sample would duplicate it in the window
+        return state
+    pipeline = pipeline or _DEFAULT_PIPELINE
     frame_count = state.get("frame_count", 0)
-    timestamp = time.time()
     landmark_data = state.get("landmark_data")
     has_landmarks = landmark_data is not None
+    # Use the frame's capture time so window timing reflects the camera, not processing jitter
+    timestamp = (landmark_data.get("timestamp") if has_landmarks else None) or time.time()
     
     try:
-        global _ML_AGGREGATOR
-        aggregated_data = _ML_AGGREGATOR.add_frame_data({
+        aggregated_data = pipeline.ml_aggregator.add_frame_data({
             "timestamp": timestamp,
             "ml_features": landmark_data.get("ml_features", {}) if has_landmarks else {},
             "breathing": landmark_data.get("breathing", {}) if has_landmarks else {},
@@ -1861,9 +2106,12 @@ def export_landmark_data_node(state: AgentState) -> AgentState:
         })
         
         if aggregated_data and aggregated_data.get("status") != "insufficient_data":
-            # Emit the full window JSON inline (single line) for live prediction
+            # Hand the window to the in-process sink, or emit the full window JSON inline (single line) for live prediction
             try:
-                print(json.dumps(aggregated_data, separators=(",", ":")))
+                if pipeline.on_window is not None:
+                    pipeline.on_window(aggregated_data)
+                else:
+                    print(json.dumps(aggregated_data, separators=(",", ":")))
             except Exception as emit_err:
                 print(f"❌ Failed to emit window JSON: {emit_err}")
 
@@ -1900,27 +2148,27 @@ def export_landmark_data_node(state: AgentState) -> AgentState:
             print("🧹 Post-export cleanup (buffers only, keep calibrations and baselines)")
             
             # Keep breathing tracker calibration and rolling signal; just trim if anything overflowed
-            if _BREATHING_TRACKER is not None:
+            if pipeline.breathing_tracker is not None:
                 try:
-                    tracker = _BREATHING_TRACKER
+                    tracker = pipeline.breathing_tracker
                     # Deques have maxlen, so they self-trim; no action needed besides sanity print
                     print(f"   Breathing tracker state: {len(tracker.timestamps)} pts, calibrated={tracker.is_calibrated}")
                 except Exception as bt_error:
                     print(f"   ⚠️ Breathing tracker inspection error: {bt_error}")
             
             # Feature extractor: keep baselines and short histories intact
-            if _FEATURE_EXTRACTOR is not None:
+            if pipeline.feature_extractor is not None:
                 try:
-                    extractor = _FEATURE_EXTRACTOR
-                    # No explicit buffer to clear; histories are bounded deques
+                    extractor = pipeline.feature_extractor
+                    # No explicit buffer to clear; histories are bounded ring buffers
                     print("   Feature extractor state preserved (baselines + bounded histories)")
                 except Exception as fe_error:
                     print(f"   ⚠️ Feature extractor inspection error: {fe_error}")
             
             # ML aggregator buffer (bounded) – clear to start a fresh window
-            if _ML_AGGREGATOR is not None:
+            if pipeline.ml_aggregator is not None:
                 try:
-                    aggregator = _ML_AGGREGATOR
+                    aggregator = pipeline.ml_aggregator
                     print(f"   Clearing ML aggregator buffer (had {len(aggregator.data_buffer)} frames)")
                     aggregator.data_buffer.clear()
                     print("   ✅ ML aggregator buffer cleared")
@@ -1975,12 +2223,9 @@ def should_continue(state: AgentState) -> str:
     """Conditional edge: Determine next action based on state."""
     status = state.get("status", "")
     
-    if status == "no_frame":
-        frame_count = state.get("frame_count", 0)
-        if frame_count > 0:
-            return "continue" 
-        else:
-            return "wait"
+    if status in ["no_frame", "stale_frame"]:
+        # Nothing new to look at; running detection again would reprocess the previous frame
+        return "wait"
     elif status in ["frame_captured", "landmarks_detected", "no_landmarks", "data_exported", "export_skipped", "accumulating_data", "window_exported"]:
         return "continue"
     else:
@@ -1993,12 +2238,16 @@ def wait_node(state: AgentState) -> AgentState:
     return state
 
 
-def create_agent_graph():
-    """Create the LangGraph workflow."""
+def create_agent_graph(frame_slot: Optional[FrameSlot] = None, pipeline: Optional[AgentPipeline] = None):
+    """
+    Create the LangGraph workflow for ``pipeline`` (the module default if None).
+    Capture and detection share ``frame_slot`` for the decoded frame.
+    """
+    slot = frame_slot if frame_slot is not None else FrameSlot()
     workflow = StateGraph(AgentState)
-    workflow.add_node("capture_frame", capture_frame_node)
-    workflow.add_node("detect_pose", detect_pose_node)
-    workflow.add_node("export_landmarks", export_landmark_data_node)
+    workflow.add_node("capture_frame", lambda state: capture_frame_node(state, slot, pipeline))
+    workflow.add_node("detect_pose", lambda state: detect_pose_node(state, slot, pipeline))
+    workflow.add_node("export_landmarks", lambda state: export_landmark_data_node(state, pipeline))
     workflow.add_node("wait", wait_node)
     
     workflow.add_edge("__start__", "capture_frame")
@@ -2019,8 +2268,194 @@ def create_agent_graph():
     return workflow.compile()
 
 
+def initial_agent_state() -> AgentState:
+    return {
+        "pose_landmarks": None,
+        "face_landmarks": None,
+        "frame_count": 0,
+        "last_detection_time": 0.0,
+        "status": "starting",
+        "landmark_data": None,
+    }
+
+
+class InProcessAgent:
+    """
+    Run a detection pipeline on a worker thread inside the server process.
+    Frames arrive through a newest-frame-wins mailbox and finished windows are
+    delivered by calling ``on_window`` directly. Each instance has its own
+    AgentPipeline, so several can serve separate sessions side by side.
+    """
+
+    def __init__(self, on_window: Callable[[Dict[str, Any]], None], name: str = "inprocess"):
+        self.frames = FrameMailbox()
+        self.on_window = on_window
+        self.name = name
+        self.pipeline = AgentPipeline(MailboxSource(self.frames), on_window=on_window, name=name)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def dropped_frames(self) -> int:
+        return self.frames.replaced
+
+    def submit(self, frame: Frame) -> None:
+        """Non-blocking handoff from the receive loop; replaces a frame not yet picked up."""
+        self.frames.put(frame)
+
+    def wants_frame(self, now: Optional[float] = None) -> bool:
+        """False while the previous frame is still waiting and fresh (producer can skip conversion)."""
+        return self.frames.wants_frame(now)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"agent-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if not self.is_alive():
+            self.pipeline.close()
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    @property
+    def processing_fps(self) -> float:
+        return get_processing_fps(self.pipeline)
+
+    def _run(self) -> None:
+        print(f"🚀 Starting in-process MediaPipe agent [{self.name}]")
+        state = initial_agent_state()
+        consecutive_errors = 0
+        while not self._stop.is_set():
+            frame = self.frames.get(timeout=0.5)
+            if frame is None:
+                continue
+            try:
+                state = process_frame(state, frame, self.pipeline)
+                state = export_landmark_data_node(state, self.pipeline)
+                consecutive_errors = 0
+            except Exception as e:
+                consecutive_errors += 1
+                print(f"⚠️ In-process agent iteration error #{consecutive_errors}: {e}")
+                if consecutive_errors >= 10:
+                    print("❌ Too many consecutive errors, resetting agent state")
+                    state = initial_agent_state()
+                    consecutive_errors = 0
+        print(f"🏁 In-process agent stopped [{self.name}]")
+
+
+def run_replay(source: FrameSource, on_window: Optional[Callable[[Dict[str, Any]], None]] = None,
+               max_frames: int = 0, **pipeline_options) -> Dict[str, float]:
+    """
+    Featurize a finite source (e.g. a ReplaySource) without a browser or WebRTC.
+    Windows go to ``on_window`` if given, otherwise to stdout as JSON lines.
+    ``pipeline_options`` (concurrent_models, pose_hz, face_hz, adaptive_cadence) go to the AgentPipeline.
+    """
+    pipeline = AgentPipeline(source, on_window=on_window, name="replay", **pipeline_options)
+    state = initial_agent_state()
+    frames = windows = 0
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    try:
+        while not (max_frames and frames >= max_frames):
+            frame = source.read()
+            if frame is None:
+                if source.exhausted:
+                    break
+                continue
+            frames += 1
+            state = process_frame(state, frame, pipeline)
+            exported_before = pipeline.ml_aggregator.export_counter
+            state = export_landmark_data_node(state, pipeline)
+            if pipeline.ml_aggregator.export_counter > exported_before:
+                windows += 1
+    finally:
+        pipeline.close()
+    wall = time.perf_counter() - wall0
+    recorded = getattr(source, "duration", 0.0)
+    return {
+        "concurrent_models": pipeline.concurrent_models,
+        "stages_ms": pipeline.stage_timings(),
+        "keyframe_ratios": pipeline.keyframe_ratios(),
+        "frames": frames,
+        "windows": windows,
+        "wall_seconds": wall,
+        "cpu_seconds": time.process_time() - cpu0,
+        "recorded_seconds": recorded,
+        "fps": frames / wall if wall > 0 else 0.0,
+        "speedup": recorded / wall if wall > 0 else 0.0,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    import argparse
+    p = argparse.ArgumentParser(description="MediaPipe LangGraph agent")
+    p.add_argument("--replay", help="Video file or directory of images to featurize instead of live frames")
+    p.add_argument("--realtime", action="store_true", help="Pace replay to the recorded timestamps")
+    p.add_argument("--loop", action="store_true", help="Restart the replay at the end (use with --max-frames)")
+    p.add_argument("--fps", type=float, default=30.0, help="Frame rate assumed for image directories")
+    p.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames (0 = whole recording)")
+    p.add_argument("--resolution", default=os.getenv("INGEST_RESOLUTION", "640x360"),
+                   help="Processing resolution bounding box, or 'native'")
+    p.add_argument("--output", help="Write window JSON lines here instead of stdout")
+    p.add_argument("--concurrent-models", action=argparse.BooleanOptionalAction, default=None,
+                   help="Overlap Pose and FaceMesh inference (default AGENT_CONCURRENT_MODELS)")
+    p.add_argument("--pose-hz", type=float, help="Pose keyframe rate, 0 = every frame (default AGENT_POSE_HZ)")
+    p.add_argument("--face-hz", type=float, help="FaceMesh keyframe rate, 0 = every frame (default AGENT_FACE_HZ)")
+    # main.py starts one agent per session and passes these through the environment
+    p.add_argument("--session-id", default=os.getenv("AGENT_SESSION_ID", "default"),
+                   help="Session this agent serves (log prefix)")
+    p.add_argument("--shm-name", help="Shared-memory frame ring to read (default FRAME_SHM_NAME)")
+    p.add_argument("--frame-file", default=os.getenv("AGENT_FRAME_FILE"),
+                   help="JPEG fallback frame file (default frames/latest_frame.jpg)")
+    p.add_argument("--ready-file", default=os.getenv("AGENT_READY_FILE"),
+                   help="File whose existence signals WebRTC is ready (default frames/webrtc_ready)")
+    return p.parse_args(argv)
+
+
+def replay_main(args) -> None:
+    source = ReplaySource(args.replay, realtime=args.realtime, loop=args.loop, fps=args.fps,
+                          max_size=parse_resolution(args.resolution))
+    out = open(args.output, "w") if args.output else None
+    on_window = (lambda window: out.write(json.dumps(window, separators=(",", ":")) + "\n")) if out else None
+    try:
+        stats = run_replay(source, on_window=on_window, max_frames=args.max_frames,
+                           concurrent_models=args.concurrent_models, pose_hz=args.pose_hz, face_hz=args.face_hz)
+    finally:
+        if out:
+            out.close()
+    print(f"🎞️ Replayed {stats['frames']} frames ({stats['recorded_seconds']:.1f}s recorded) in "
+          f"{stats['wall_seconds']:.1f}s: {stats['fps']:.1f} fps, {stats['speedup']:.1f}x realtime, "
+          f"{stats['cpu_seconds'] * 1000 / max(1, stats['frames']):.1f} CPU ms/frame, {stats['windows']} windows")
+    t = stats["stages_ms"]
+    mode = "concurrent" if stats["concurrent_models"] else "sequential"
+    k = stats["keyframe_ratios"]
+    print(f"🧩 Stages ({mode}): pose {t['pose']:.1f} ms + face {t['face']:.1f} ms -> detect {t['detect']:.1f} ms wall "
+          f"(saved {t['overlap_saved']:.1f} ms), total {t['total']:.1f} ms/frame; "
+          f"keyframes pose {k['pose']:.0%}, face {k['face']:.0%}")
+
+
 def main():
     """Main agent loop."""
+    args = parse_args()
+    if args.replay:
+        replay_main(args)
+        return
+    # Per-session agents (launched by main.py) read their own ring / frame file
+    _DEFAULT_PIPELINE.name = args.session_id
+    if args.shm_name or args.frame_file:
+        set_frame_source(_default_frame_source(args.shm_name, args.frame_file))
+    # main.py hands us a binary channel for windows, typed logs and heartbeats; stdout stays human-readable
+    ipc = IpcWriter.from_env()
+    if ipc is not None:
+        _DEFAULT_PIPELINE.on_window = ipc.window
+        ipc.start_heartbeat(_DEFAULT_PIPELINE.stats)
+
     print("🚀 Starting MediaPipe LangGraph Agent")
     
     # Check baseline memory usage
@@ -2032,7 +2467,7 @@ def main():
     except Exception as e:
         print(f"⚠️ Could not check baseline memory: {e}")
     
-    webrtc_status_path = os.path.join(os.path.dirname(__file__), "frames", "webrtc_ready")
+    webrtc_status_path = args.ready_file or os.path.join(os.path.dirname(__file__), "frames", "webrtc_ready")
     
     print("⏳ Waiting for WebRTC to be ready...")
     while not os.path.exists(webrtc_status_path):
@@ -2047,15 +2482,8 @@ def main():
     
     while restart_counter < max_restarts:
         try:
-            agent = create_agent_graph()
-            initial_state: AgentState = {
-                "pose_landmarks": None,
-                "face_landmarks": None,
-                "frame_count": 0,
-                "last_detection_time": 0.0,
-                "status": "starting",
-                "landmark_data": None,
-            }
+            agent = create_agent_graph(FrameSlot())
+            initial_state = initial_agent_state()
             
             print(f"🔄 Agent running... (Attempt {restart_counter + 1}/{max_restarts}, Ctrl+C to stop)")
             
@@ -2085,6 +2513,8 @@ def main():
                 except Exception as e:
                     consecutive_errors += 1
                     print(f"⚠️ Agent iteration error #{consecutive_errors}: {e}")
+                    if ipc is not None:
+                        ipc.log(f"❌ Agent iteration error #{consecutive_errors}: {e}")
                     
                     if consecutive_errors >= max_consecutive_errors:
                         print(f"❌ Too many consecutive errors ({consecutive_errors}), restarting agent")
@@ -0,0 +1,137 @@
+"""Length-prefixed msgpack channel from an agent subprocess to the server.
+
+main.py opens a pipe per agent and passes the write end's descriptor in
+``AGENT_IPC_FD``. Each message is a 4-byte big-endian length followed by an
+ormsgpack-encoded ``[kind, payload]`` pair:
+
+- ``window``: a finished feature window (the dict the agent used to print as a JSON line).
+- ``log``: ``{"event", "message"}`` to forward to the session's client.
+- ``metrics``: the pipeline's ``stats()``.
+- ``heartbeat``: ``{"pid", "frames", "t"}``, sent every ``AGENT_IPC_HEARTBEAT_S`` seconds.
+
+Human-readable logs stay on stdout. The server reads this channel on its own
+thread, so windows no longer wait behind log lines or need parsing out of them.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+import ormsgpack
+
+AGENT_IPC = os.getenv("AGENT_IPC", "1").lower() in ("1", "true", "yes", "on")
+HEARTBEAT_S = float(os.getenv("AGENT_IPC_HEARTBEAT_S", "1.0"))
+METRICS_EVERY = 5  # heartbeats between metrics messages
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct(">I")
+_PACK_OPTIONS = ormsgpack.OPT_SERIALIZE_NUMPY
+
+
+def _to_builtin(obj: Any) -> Any:
+    """Fallback for values ormsgpack can't encode natively (numpy scalars it misses, sets, ...)."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def encode(kind: str, payload: Any) -> bytes:
+    body = ormsgpack.packb([kind, payload], default=_to_builtin, option=_PACK_OPTIONS)
+    return _HEADER.pack(len(body)) + body
+
+
+class IpcWriter:
+    """Agent side: writes typed messages to a pipe descriptor. Thread-safe; errors are reported once, then dropped."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @classmethod
+    def from_env(cls) -> Optional["IpcWriter"]:
+        fd = os.getenv("AGENT_IPC_FD")
+        return cls(int(fd)) if fd else None
+
+    def send(self, kind: str, payload: Any) -> bool:
+        if self._closed:
+            return False
+        data = encode(kind, payload)
+        with self._lock:
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(self.fd, view)
+                    view = view[written:]
+                return True
+            except OSError as e:
+                self._closed = True
+                print(f"⚠️ Agent IPC channel closed: {e}")
+                return False
+
+    def window(self, window: Dict[str, Any]) -> None:
+        self.send("window", window)
+
+    def log(self, message: str, event: str = "new_log") -> None:
+        self.send("log", {"event": event, "message": message})
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                try:
+                    os.close(self.fd)
+                except OSError:
+                    pass
+
+    def start_heartbeat(self, stats: Callable[[], Dict[str, Any]], interval: float = HEARTBEAT_S) -> threading.Thread:
+        """Daemon thread sending a heartbeat every ``interval`` seconds and ``stats()`` every few beats."""
+        def beat() -> None:
+            beats = 0
+            while not self._closed:
+                time.sleep(interval)
+                try:
+                    snapshot = stats()
+                except Exception:
+                    snapshot = {}
+                if not self.send("heartbeat", {"pid": os.getpid(), "frames": snapshot.get("processed", 0), "t": time.time()}):
+                    break
+                beats += 1
+                if beats % METRICS_EVERY == 0:
+                    self.send("metrics", snapshot)
+
+        thread = threading.Thread(target=beat, name="agent-ipc-heartbeat", daemon=True)
+        thread.start()
+        return thread
+
+
+def _read_exact(stream: BinaryIO, n: int) -> Optional[bytes]:
+    chunks = []
+    while n:
+        chunk = stream.read(n)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_messages(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    """Server side: yield ``(kind, payload)`` until the agent closes its end."""
+    while True:
+        header = _read_exact(stream, _HEADER.size)
+        if header is None:
+            return
+        (length,) = _HEADER.unpack(header)
+        if length > MAX_MESSAGE_BYTES:
+            raise ValueError(f"Agent IPC message of {length} bytes exceeds {MAX_MESSAGE_BYTES}")
+        body = _read_exact(stream, length)
+        if body is None:
+            return
+        kind, payload = ormsgpack.unpackb(body)
+        yield kind, payload
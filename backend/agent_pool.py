@@ -0,0 +1,385 @@
+"""Pool of warm agent worker processes shared by all sessions (``AGENT_MODE=pool``).
+
+Each worker is a separate process (one core's worth of MediaPipe + feature code)
+that serves several sessions round-robin, one frame per session per pass.
+Sessions read their frames from their own shared-memory ring / JPEG file, exactly
+like a per-session agent subprocess; only control messages, finished windows and
+metrics cross the worker pipe.
+
+* Workers start at server launch with their MediaPipe graphs loaded and are
+  reused across sessions: a detached session's models go back to the worker's
+  spare set for the next session.
+* New sessions go to the least-loaded worker. When a session ends and the load
+  gap between the busiest and idlest worker reaches ``AGENT_POOL_REBALANCE_GAP``
+  sessions, one session moves over, with its breathing/feature/window state.
+* Every worker reports CPU %, queue depth (sessions with an unprocessed frame)
+  and fps once a second; see :meth:`AgentWorkerPool.metrics`.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, List, Optional
+
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "0")) or os.cpu_count() or 1
+AGENT_POOL_REBALANCE_GAP = int(os.getenv("AGENT_POOL_REBALANCE_GAP", "2"))
+METRICS_INTERVAL = 1.0
+
+
+def worker_main(conn, worker_id: int) -> None:
+    """Worker process: load MediaPipe once, then serve attached sessions until told to stop."""
+    import agent
+
+    spare_models: List[Any] = []
+    warm = agent.AgentPipeline(name=f"worker-{worker_id}")
+    warm.ensure_models()
+    spare_models.append(warm.take_models())
+    warm.close()
+    conn.send(("ready", worker_id, os.getpid()))
+
+    sessions: Dict[str, Dict[str, Any]] = {}
+
+    def attach(session_id: str, shm_name: Optional[str], frame_file: Optional[str], state=None) -> None:
+        def on_window(window: Dict[str, Any]) -> None:
+            conn.send(("window", session_id, window))
+
+        pipeline = agent.AgentPipeline(agent._default_frame_source(shm_name, frame_file),
+                                       on_window=on_window, name=session_id)
+        if spare_models:
+            pipeline.pose_model, pipeline.face_model = spare_models.pop()
+        if state is not None:
+            pipeline.import_state(state)
+        sessions[session_id] = {"pipeline": pipeline, "state": agent.initial_agent_state(), "errors": 0}
+        print(f"👷 Worker {worker_id}: attached session {session_id} ({len(sessions)} sessions)")
+
+    def detach(session_id: str, migrate: bool) -> None:
+        entry = sessions.pop(session_id, None)
+        if entry is None:
+            return
+        pipeline = entry["pipeline"]
+        if migrate:
+            conn.send(("state", session_id, pipeline.export_state()))
+        # Keep the graphs warm for the next session instead of closing them
+        spare_models.append(pipeline.take_models())
+        pipeline.close()
+        print(f"👷 Worker {worker_id}: detached session {session_id} ({len(sessions)} sessions)")
+
+    frames = 0
+    last_metrics = time.time()
+    cpu_start = time.process_time()
+    while True:
+        while conn.poll():
+            msg = conn.recv()
+            if msg[0] == "attach":
+                attach(*msg[1:])
+            elif msg[0] == "detach":
+                detach(*msg[1:])
+            elif msg[0] == "stop":
+                for session_id in list(sessions):
+                    detach(session_id, False)
+                return
+
+        # One frame per session per pass keeps sessions on a worker fair to each other
+        progressed = False
+        for session_id, entry in list(sessions.items()):
+            pipeline = entry["pipeline"]
+            if not pipeline.source.has_new():
+                continue
+            frame = agent.read_latest_frame(pipeline)
+            if frame is None:
+                continue
+            try:
+                entry["state"] = agent.process_frame(entry["state"], frame, pipeline)
+                entry["state"] = agent.export_landmark_data_node(entry["state"], pipeline)
+                entry["errors"] = 0
+                frames += 1
+                progressed = True
+            except Exception as e:
+                entry["errors"] += 1
+                conn.send(("log", session_id, f"❌ Agent iteration error #{entry['errors']}: {e}"))
+                if entry["errors"] >= 10:
+                    entry["state"] = agent.initial_agent_state()
+                    entry["errors"] = 0
+
+        now = time.time()
+        if now - last_metrics >= METRICS_INTERVAL:
+            cpu_now = time.process_time()
+            elapsed = now - last_metrics
+            conn.send(("metrics", worker_id, {
+                "pid": os.getpid(),
+                "sessions": len(sessions),
+                "cpu_percent": 100.0 * (cpu_now - cpu_start) / elapsed,
+                "queue_depth": sum(1 for e in sessions.values() if e["pipeline"].source.has_new()),
+                "fps": frames / elapsed,
+                "session_fps": {sid: e["pipeline"].processing_rate.fps for sid, e in sessions.items()},
+                "spare_models": len(spare_models),
+            }))
+            frames, last_metrics, cpu_start = 0, now, cpu_now
+
+        if not progressed:
+            conn.poll(0.002)  # idle: wake on a control message or re-check frames shortly
+
+
+class _Worker:
+    """Server-side handle: the worker subprocess, the connection it dials back on, and its outbox."""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self._authkey = os.urandom(16)
+        self.listener = Listener(authkey=self._authkey)
+        # A plain interpreter running this file (not multiprocessing spawn, which would re-import main.py)
+        env = dict(os.environ, AGENT_POOL_ADDRESS=str(self.listener.address), AGENT_POOL_AUTHKEY=self._authkey.hex())
+        self.process = subprocess.Popen([sys.executable, "-u", os.path.abspath(__file__),
+                                         "--worker-id", str(worker_id)], env=env)
+        self.conn = None
+        self.connected = threading.Event()
+        self.closed = threading.Event()
+        self.sessions: set = set()
+        self.metrics: Dict[str, Any] = {}
+        self.ready = threading.Event()
+        # Control messages go out in order on a sender thread, so nobody blocks on a worker still connecting
+        self.outbox: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        threading.Thread(target=self._send_loop, name=f"agent-pool-sender-{worker_id}", daemon=True).start()
+
+    def accept(self) -> bool:
+        threading.Thread(target=self._unblock_if_dead, daemon=True).start()
+        try:
+            self.conn = self.listener.accept()
+        except Exception as e:
+            print(f"❌ Agent worker {self.worker_id} failed to connect: {e}")
+            return False
+        finally:
+            self.listener.close()
+        self.connected.set()
+        return True
+
+    def _unblock_if_dead(self) -> None:
+        # A worker that dies before dialing back would leave accept() blocked; connect in its place
+        # so the reader sees an immediate EOF and respawns it
+        self.process.wait()
+        if not self.connected.is_set():
+            try:
+                Client(self.listener.address, authkey=self._authkey).close()
+            except Exception:
+                pass
+
+    def send(self, msg) -> None:
+        """Queue ``msg``; never blocks. Dropped if the worker dies first (the pool re-attaches its sessions)."""
+        self.outbox.put(msg)
+
+    def _send_loop(self) -> None:
+        while True:
+            msg = self.outbox.get()
+            if msg is None:
+                return
+            while not self.connected.wait(timeout=0.5):
+                if self.closed.is_set():
+                    return
+            try:
+                self.conn.send(msg)
+                if msg[0] == "stop":
+                    self.closed.set()  # whatever is queued behind it is moot
+            except (OSError, ValueError) as e:
+                if not self.closed.is_set():
+                    print(f"⚠️ Agent worker {self.worker_id}: {msg[0]} not delivered: {e}")
+
+    def close(self) -> None:
+        """The worker is gone: stop the sender, dropping whatever it had not sent."""
+        self.closed.set()
+        self.outbox.put(None)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+
+class AgentWorkerPool:
+    """
+    Fixed set of agent worker processes. ``on_window(session_id, window)`` and
+    ``on_log(session_id, message)`` are called from the pool's reader threads,
+    as is ``on_restart(session_id)`` when a session is re-attached without its
+    state (its windows are numbered from 0 again).
+
+    ``_lock`` only guards the bookkeeping. Messages are queued on the worker's
+    outbox in bookkeeping order and sent by its own thread, so no caller (the
+    event loop included) ever waits on a worker pipe.
+    """
+
+    def __init__(self, on_window: Callable[[str, Dict[str, Any]], None],
+                 on_log: Optional[Callable[[str, str], None]] = None, size: int = AGENT_POOL_SIZE,
+                 rebalance_gap: int = AGENT_POOL_REBALANCE_GAP,
+                 on_restart: Optional[Callable[[str], None]] = None):
+        self.on_window = on_window
+        self.on_log = on_log
+        self.on_restart = on_restart
+        self.size = max(1, size)
+        self.rebalance_gap = max(2, rebalance_gap)
+        self._workers: Dict[int, _Worker] = {}
+        self._sessions: Dict[str, Dict[str, Any]] = {}  # session id -> worker id + channel
+        self._lock = threading.RLock()
+        self._stopping = False
+
+    def start(self) -> None:
+        for worker_id in range(self.size):
+            self._spawn(worker_id)
+        print(f"👷 Agent pool started with {self.size} worker(s)")
+
+    def _spawn(self, worker_id: int) -> _Worker:
+        worker = _Worker(worker_id)
+        self._workers[worker_id] = worker
+        threading.Thread(target=self._reader, args=(worker,), name=f"agent-pool-reader-{worker_id}",
+                         daemon=True).start()
+        return worker
+
+    def assign(self, session_id: str, shm_name: Optional[str], frame_file: Optional[str]) -> int:
+        """Attach a session to the least-loaded live worker; returns the worker id."""
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is not None:
+                return info["worker"]
+            # A worker that died but is not respawned yet still counts if it is all there is:
+            # its respawn re-attaches every session booked on it
+            workers = [w for w in self._workers.values() if w.is_alive()] or list(self._workers.values())
+            worker = min(workers, key=lambda w: (len(w.sessions), w.metrics.get("cpu_percent", 0.0)))
+            self._sessions[session_id] = {"worker": worker.worker_id, "shm_name": shm_name,
+                                          "frame_file": frame_file}
+            worker.sessions.add(session_id)
+            worker.send(("attach", session_id, shm_name, frame_file, None))
+            return worker.worker_id
+
+    def release(self, session_id: str) -> None:
+        """Detach an ended session, then even out the remaining load."""
+        with self._lock:
+            info = self._sessions.pop(session_id, None)
+            if info is None:
+                return
+            worker = self._workers.get(info["worker"])
+            if worker is not None:
+                worker.sessions.discard(session_id)
+                worker.send(("detach", session_id, False))
+            self.rebalance()
+
+    def rebalance(self) -> None:
+        """Move one session from the busiest to the idlest worker while the gap is too large."""
+        with self._lock:
+            workers = sorted((w for w in self._workers.values() if w.is_alive()), key=lambda w: len(w.sessions))
+            if len(workers) < 2:
+                return
+            idlest, busiest = workers[0], workers[-1]
+            if len(busiest.sessions) - len(idlest.sessions) < self.rebalance_gap:
+                return
+            session_id = next(iter(busiest.sessions))
+            busiest.sessions.discard(session_id)
+            idlest.sessions.add(session_id)
+            info = self._sessions[session_id]
+            info["worker"] = idlest.worker_id
+            info["migrating"] = busiest.worker_id
+            # The source worker replies with the session's state; the reader forwards it to the target
+            busiest.send(("detach", session_id, True))
+            print(f"⚖️ Agent pool: moving session {session_id} from worker {busiest.worker_id} "
+                  f"to worker {idlest.worker_id}")
+
+    def worker_of(self, session_id: str) -> Optional[int]:
+        info = self._sessions.get(session_id)
+        return info["worker"] if info else None
+
+    def metrics(self) -> Dict[int, Dict[str, Any]]:
+        """Latest per-worker metrics: pid, sessions, cpu_percent, queue_depth, fps, session_fps."""
+        with self._lock:
+            return {worker_id: dict(w.metrics, alive=w.is_alive(), assigned=sorted(w.sessions))
+                    for worker_id, w in self._workers.items()}
+
+    def _reader(self, worker: _Worker) -> None:
+        connected = worker.accept()
+        while connected:
+            try:
+                msg = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = msg[0]
+            try:
+                if kind == "window":
+                    self.on_window(msg[1], msg[2])
+                elif kind == "log":
+                    if self.on_log is not None:
+                        self.on_log(msg[1], msg[2])
+                elif kind == "metrics":
+                    worker.metrics = msg[2]
+                elif kind == "ready":
+                    worker.ready.set()
+                    print(f"👷 Agent worker {msg[1]} ready (pid {msg[2]}, MediaPipe loaded)")
+                elif kind == "state":
+                    self._complete_migration(msg[1], msg[2])
+            except Exception as e:
+                print(f"⚠️ Agent pool message error ({kind}): {e}")
+        worker.process.wait()
+        worker.close()
+        if not self._stopping:
+            time.sleep(1.0)  # don't spin if workers die on startup
+            self._respawn(worker)
+
+    def _complete_migration(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is None or info.pop("migrating", None) is None:
+                return  # session ended (or its target was respawned) while moving
+            self._workers[info["worker"]].send(("attach", session_id, info["shm_name"], info["frame_file"], state))
+
+    def _respawn(self, dead: _Worker) -> None:
+        """Replace a crashed worker and re-attach its sessions (their window state is lost)."""
+        print(f"❌ Agent worker {dead.worker_id} exited ({dead.process.returncode}), respawning")
+        while not self._stopping:
+            try:
+                with self._lock:
+                    worker = self._spawn(dead.worker_id)
+                    break
+            except Exception as e:
+                print(f"❌ Agent worker {dead.worker_id} respawn failed, retrying: {e}")
+                time.sleep(5.0)
+        else:
+            return
+        with self._lock:
+            # Its own sessions, and any it was handing over whose state will now never arrive
+            restarts = [(session_id, worker) for session_id in dead.sessions]
+            restarts += [(session_id, self._workers[info["worker"]]) for session_id, info in self._sessions.items()
+                         if info.get("migrating") == dead.worker_id and session_id not in dead.sessions]
+            for session_id, target in restarts:
+                info = self._sessions.get(session_id)
+                if info is None:
+                    continue
+                try:
+                    info.pop("migrating", None)
+                    target.sessions.add(session_id)
+                    if self.on_restart is not None:
+                        self.on_restart(session_id)
+                    target.send(("attach", session_id, info["shm_name"], info["frame_file"], None))
+                except Exception as e:
+                    print(f"⚠️ Agent pool: failed to re-attach session {session_id}: {e}")
+
+    def stop(self, timeout: float = 3.0) -> None:
+        self._stopping = True
+        for worker in self._workers.values():
+            worker.send(("stop",))
+        for worker in self._workers.values():
+            try:
+                worker.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                worker.process.terminate()
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Agent pool worker (started by AgentWorkerPool)")
+    parser.add_argument("--worker-id", type=int, required=True)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    args = parse_args()
+    address = os.environ["AGENT_POOL_ADDRESS"]
+    authkey = bytes.fromhex(os.environ["AGENT_POOL_AUTHKEY"])
+    worker_main(Client(address, authkey=authkey), args.worker_id)
@@ -0,0 +1,292 @@
+"""Benchmark BreathingTracker filtering modes: per-frame cost and BPM agreement.
+
+Feeds the same nose/shoulder traces to a tracker in each ``filter_mode``:
+
+- ``filtfilt``: re-filters the whole horizon with ``filtfilt`` on every frame,
+  then runs it again inside the autocorrelation estimate.
+- ``streaming``: one causal second-order-section step per frame, and the BPM
+  re-estimated every ``--interval`` s by FFT autocorrelation over the filtered
+  samples decimated to 5 Hz (``breathing_rate.py``).
+
+Streaming also runs with the BPM re-estimated every frame, which separates the
+estimator's effect from the cadence's.
+
+Traces come from recordings (``--replay``, MediaPipe Pose run like the agent,
+frames gated on shoulder visibility) and from synthetic sessions with a known
+breathing rate (``--synthetic``). The synthetic ones add drift, noise and
+posture shifts. Reports update() time per frame and the BPM error against the
+filtfilt path, per frame and per 5 s window. The per-window error uses the
+window median, as MLDataAggregator exports it. Synthetic sessions also get
+per-window error against the known rate.
+
+``--estimators`` compares the BPM estimators in ``breathing_rate.py`` on their
+own. Every ``--interval`` seconds each one scores the last few seconds of the
+band-passed signal:
+
+- the tracker's ``np.correlate`` autocorrelation over 30 fps (zero-phase filtered, 5 s);
+- FFT autocorrelation, spectrum peak and ``find_peaks`` cycles over the signal
+  decimated to a few Hz, at several horizons. Each runs on the zero-phase
+  filtered horizon and on the causally filtered samples the streaming tracker
+  already keeps, which need no per-estimate filtering.
+
+Reports error against the known rate over the last 5 s (synthetic), the spread
+of estimates on recordings, and the cost per estimate, filtering included.
+
+Usage:
+  python backend/bench_breathing.py --synthetic 8
+  python backend/bench_breathing.py --estimators --replay session.mp4 --synthetic 12
+  python backend/bench_breathing.py --replay session.mp4 --synthetic 4 --interval 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from scipy import signal
+
+import breathing_rate
+from agent import BreathingTracker, suppress_stderr
+from frame_sources import ReplaySource
+from frame_transport import parse_resolution
+from landmark_arrays import landmark_array
+
+NOSE, LEFT_SHOULDER, RIGHT_SHOULDER = 0, 11, 12
+WINDOW_S = 5.0
+
+
+class Trace(NamedTuple):
+    name: str
+    t: np.ndarray  # (n,) seconds
+    nose: np.ndarray  # (n, 3)
+    left: np.ndarray
+    right: np.ndarray
+    true_bpm: Optional[np.ndarray] = None  # per frame, synthetic only
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark BreathingTracker filtering")
+    p.add_argument("--replay", nargs="*", default=[], help="Video files or image directories")
+    p.add_argument("--resolution", default="640x360")
+    p.add_argument("--synthetic", type=int, default=8, help="Synthetic sessions with a known rate")
+    p.add_argument("--seconds", type=float, default=60.0, help="Length of each synthetic session")
+    p.add_argument("--interval", type=float, default=0.5, help="Streaming BPM re-estimate interval (s)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--estimators", action="store_true", help="Compare BPM estimators instead of filter modes")
+    p.add_argument("--horizons", type=float, nargs="+", default=[5.0, 10.0, 15.0, 20.0],
+                   help="Estimator horizons (s)")
+    p.add_argument("--rates", type=float, nargs="+", default=[5.0], help="Decimated rates (Hz)")
+    return p.parse_args()
+
+
+def synthetic_trace(i: int, seconds: float, rng: np.random.Generator, fps: float = 30.0) -> Trace:
+    n = int(seconds * fps)
+    t = np.arange(n) / fps + rng.normal(0.0, 0.002, n)  # capture jitter
+    base_bpm = rng.uniform(8.0, 24.0)
+    bpm = base_bpm * (1.0 + 0.1 * np.sin(2 * np.pi * t / rng.uniform(20.0, 40.0)))
+    phase = 2 * np.pi * np.cumsum(bpm / 60.0) / fps
+    amplitude = rng.uniform(0.002, 0.006)
+    breath = amplitude * (np.sin(phase) + 0.2 * np.sin(2 * phase + 0.7))
+    drift = np.cumsum(rng.normal(0.0, 2e-5, n))  # slow posture drift
+    shifts = np.zeros(n)
+    for start in rng.choice(n, size=2, replace=False):  # a couple of posture shifts
+        shifts[start:] += rng.normal(0.0, 0.01)
+    shoulder_y = 0.6 + breath + drift + shifts
+    nose_y = 0.35 + 0.6 * breath + drift + shifts + rng.normal(0.0, 8e-4, n)
+    left = np.stack([np.full(n, 0.4), shoulder_y + rng.normal(0.0, 8e-4, n), np.zeros(n)], axis=1)
+    right = np.stack([np.full(n, 0.6), shoulder_y + rng.normal(0.0, 8e-4, n), np.zeros(n)], axis=1)
+    nose = np.stack([np.full(n, 0.5), nose_y, np.zeros(n)], axis=1)
+    return Trace(f"synthetic-{i} ({base_bpm:.1f} bpm)", t, nose, left, right, bpm)
+
+
+def replay_trace(path: str, resolution: Optional[Tuple[int, int]]) -> Trace:
+    import mediapipe as mp
+
+    source = ReplaySource(path, pixel_format="rgb24", max_size=resolution, start_time=0.0)
+    rows: List[Tuple[float, np.ndarray]] = []
+    with suppress_stderr():
+        pose = mp.solutions.pose.Pose(static_image_mode=False, model_complexity=0, enable_segmentation=False,
+                                      min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    try:
+        while True:
+            frame = source.read()
+            if frame is None:
+                if source.exhausted:
+                    break
+                continue
+            results = pose.process(frame.image)
+            if results.pose_landmarks is None:
+                continue
+            points = landmark_array(results.pose_landmarks, fields=4)
+            if points[LEFT_SHOULDER, 3] > 0.5 and points[RIGHT_SHOULDER, 3] > 0.5:  # the agent's visibility gate
+                rows.append((frame.timestamp, points))
+    finally:
+        pose.close()
+    t = np.array([ts for ts, _ in rows])
+    points = np.stack([p for _, p in rows]) if rows else np.zeros((0, 33, 4))
+    return Trace(path, t, points[:, NOSE, :3], points[:, LEFT_SHOULDER, :3], points[:, RIGHT_SHOULDER, :3])
+
+
+def run_tracker(trace: Trace, mode: str, interval: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Reported BPM per frame (NaN until active) and update() seconds per frame."""
+    tracker = BreathingTracker(fps=30.0, window_seconds=5.0, filter_mode=mode, bpm_interval=interval)
+    nose, left, right = trace.nose.tolist(), trace.left.tolist(), trace.right.tolist()
+    bpm = np.full(len(trace.t), np.nan)
+    cost = np.empty(len(trace.t))
+    for i, ts in enumerate(trace.t.tolist()):
+        t0 = time.perf_counter()
+        result = tracker.update(ts, tuple(nose[i]), tuple(left[i]), tuple(right[i]))
+        cost[i] = time.perf_counter() - t0
+        if result["status"] == "active":
+            bpm[i] = result["bpm"]
+    return bpm, cost
+
+
+def stream_filter_error(seed: int) -> float:
+    """Largest difference between the per-sample filter step and scipy's sosfilt over one signal."""
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.normal(0.0, 1e-3, 3000))
+    tracker = BreathingTracker(fps=30.0, filter_mode="streaming")
+    stepped = np.array([tracker._stream_filter(v) for v in x.tolist()])
+    reference, _ = signal.sosfilt(tracker._sos, x, zi=signal.sosfilt_zi(tracker._sos) * x[0])
+    return float(np.max(np.abs(stepped - reference)))
+
+
+def window_medians(t: np.ndarray, bpm: np.ndarray) -> np.ndarray:
+    """Median of the positive BPMs in each ``WINDOW_S`` span (NaN when there are none)."""
+    index = ((t - t[0]) // WINDOW_S).astype(int) if len(t) else np.zeros(0, dtype=int)
+    medians = np.full(index.max() + 1 if len(t) else 0, np.nan)
+    for w in range(len(medians)):
+        values = bpm[(index == w) & (bpm > 0)]
+        if len(values):
+            medians[w] = np.median(values)
+    return medians
+
+
+def mae(bpm: np.ndarray, reference: np.ndarray) -> float:
+    both = ~np.isnan(bpm) & ~np.isnan(reference)
+    return float(np.abs(bpm[both] - reference[both]).mean()) if both.any() else float("nan")
+
+
+class Variant(NamedTuple):
+    label: str
+    horizon: float  # seconds
+    rate: float  # decimated Hz
+    method: str  # legacy | autocorr | spectrum | cycles
+    causal: bool  # streaming filter output instead of a zero-phase pass per estimate
+
+
+def estimator_variants(horizons: List[float], rates: List[float]) -> List[Variant]:
+    variants = [Variant("np.correlate 30 Hz, 5 s (tracker)", 5.0, 30.0, "legacy", False)]
+    for causal in (False, True):
+        for horizon in horizons:
+            for rate in rates:
+                for method in ("autocorr", "spectrum", "cycles"):
+                    label = f"{method} {rate:g} Hz, {horizon:g} s, {'causal' if causal else 'zero-phase'}"
+                    variants.append(Variant(label, horizon, rate, method, causal))
+    return variants
+
+
+def estimate(variant: Variant, tracker: BreathingTracker, raw: List[float], causal: np.ndarray,
+             t: np.ndarray) -> Tuple[float, float]:
+    if variant.method == "legacy":
+        tracker.combined_signal.clear()
+        tracker.combined_signal.extend(raw)
+        return tracker._estimate_bpm_autocorr()
+    filtered = causal if variant.causal else signal.sosfiltfilt(tracker._sos, np.asarray(raw, dtype=np.float64))
+    rate, method = variant.rate, variant.method
+    x, fs = breathing_rate.decimate(filtered, tracker.fps, rate)
+    if method == "autocorr":
+        return breathing_rate.autocorr_bpm(x, fs, tracker.min_cycle_time, tracker.max_cycle_time)
+    if method == "spectrum":
+        return breathing_rate.spectrum_bpm(x, fs, tracker.min_cycle_time, tracker.max_cycle_time)
+    times, _ = breathing_rate.decimate(t, tracker.fps, rate)
+    return breathing_rate.cycle_bpm(times, x, fs, tracker.min_cycle_time, tracker.max_cycle_time,
+                                    tracker.min_amplitude)
+
+
+def compare_estimators(traces: List[Trace], args: argparse.Namespace) -> None:
+    variants = estimator_variants(args.horizons, args.rates)
+    tracker = BreathingTracker(fps=30.0, window_seconds=5.0, filter_mode="filtfilt")
+    tracker._design_filter()
+    errors: Dict[str, List[float]] = {v.label: [] for v in variants}
+    spread: Dict[str, List[float]] = {v.label: [] for v in variants}
+    cost: Dict[str, List[float]] = {v.label: [] for v in variants}
+    longest = max(v.horizon for v in variants)
+    window = int(WINDOW_S * 30)
+    for trace in traces:
+        combined_array = 0.4 * trace.nose[:, 1] + 0.6 * (trace.left[:, 1] + trace.right[:, 1]) / 2
+        combined = combined_array.tolist()
+        causal, _ = signal.sosfilt(tracker._sos, combined_array, zi=signal.sosfilt_zi(tracker._sos) * combined[0])
+        steps = np.arange(int(longest * 30), len(trace.t), int(args.interval * 30))
+        per_trace: Dict[str, List[float]] = {v.label: [] for v in variants}
+        for end in steps.tolist():
+            truth = float(trace.true_bpm[end - window:end].mean()) if trace.true_bpm is not None else None
+            for v in variants:
+                start = end - int(v.horizon * 30)
+                t0 = time.perf_counter()
+                bpm, _ = estimate(v, tracker, combined[start:end], causal[start:end], trace.t[start:end])
+                cost[v.label].append(time.perf_counter() - t0)
+                per_trace[v.label].append(bpm if bpm > 0 else np.nan)
+                if truth is not None:
+                    errors[v.label].append(abs(bpm - truth) if bpm > 0 else truth)  # no estimate = off by the rate
+        if trace.true_bpm is None:
+            for label, values in per_trace.items():
+                values = np.array(values)
+                spread[label].append(float(np.nanpercentile(values, 75) - np.nanpercentile(values, 25))
+                                     if np.isfinite(values).any() else float("nan"))
+
+    print(f"📊 BPM estimators: {len(traces)} traces, one estimate every {args.interval:g} s")
+    print(f"  {'estimator':<42} MAE vs truth  within 2 bpm  IQR on recordings   µs/estimate")
+    for v in variants:
+        e = np.array(errors[v.label])
+        mae_text = f"{e.mean():8.2f}    {(e <= 2.0).mean():8.0%}" if len(e) else f"{'-':>8}    {'-':>8}"
+        iqr = f"{np.nanmean(spread[v.label]):8.2f}" if spread[v.label] else f"{'-':>8}"
+        print(f"  {v.label:<42} {mae_text}      {iqr}          {np.median(cost[v.label]) * 1e6:8.1f}")
+
+
+def main() -> None:
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    resolution = parse_resolution(args.resolution)
+    traces = [replay_trace(path, resolution) for path in args.replay]
+    traces += [synthetic_trace(i, args.seconds, rng) for i in range(args.synthetic)]
+    if args.estimators:
+        compare_estimators(traces, args)
+        return
+
+    variants = [("filtfilt", "filtfilt", 0.0), ("streaming, BPM every frame", "streaming", 0.0),
+                (f"streaming, BPM every {args.interval:g} s", "streaming", args.interval)]
+    print(f"📊 {len(traces)} traces, stream step vs sosfilt max |Δ| {stream_filter_error(args.seed):.3g}")
+    print("  BPM MAE vs filtfilt per frame / per window, and per window vs the known rate (synthetic)")
+    costs: Dict[str, List[np.ndarray]] = {label: [] for label, _, _ in variants}
+    totals: Dict[str, List[float]] = {label: [] for label, _, _ in variants}
+    for trace in traces:
+        results = {label: run_tracker(trace, mode, interval) for label, mode, interval in variants}
+        reference = results["filtfilt"][0]
+        reference_windows = window_medians(trace.t, reference)
+        truth_windows = window_medians(trace.t, trace.true_bpm) if trace.true_bpm is not None else None
+        print(f"  {trace.name} ({len(trace.t)} frames)")
+        for label, _, _ in variants:
+            bpm, cost = results[label]
+            costs[label].append(cost)
+            windows = window_medians(trace.t, bpm)
+            line = f"    {label:<30} {mae(bpm, reference):6.2f} / {mae(windows, reference_windows):6.2f}"
+            if truth_windows is not None:
+                totals[label].append(mae(windows, truth_windows))
+                line += f"   vs truth {totals[label][-1]:6.2f}"
+            print(line)
+    if any(totals.values()):
+        print("  mean per-window MAE vs truth: " + ", ".join(
+            f"{label} {np.nanmean(errors):.2f}" for label, errors in totals.items()))
+
+    print("  update() per frame              mean µs    p50 µs    p99 µs")
+    for label, _, _ in variants:
+        us = np.concatenate(costs[label]) * 1e6
+        p50, p99 = np.percentile(us, [50, 99])
+        print(f"  {label:<30} {us.mean():9.1f} {p50:9.1f} {p99:9.1f}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark reduced detection cadence: CPU saved vs drift in the exported window features.
+
+Replays one recording through the agent pipeline at full cadence (both models on
+every frame) and then at each requested pose/face keyframe rate. Windows are
+timed from the recorded frame timestamps, so window N covers the same span in
+every run and can be compared feature by feature.
+
+Reports CPU ms/frame, the fraction of frames each model ran on, and for the
+window features: the mean absolute difference from the full-cadence run, the
+same relative to each feature's size (|mean| + std across windows), and the
+worst few features.
+
+Usage:
+  python backend/bench_detection_cadence.py --replay session.mp4 --rates 10:15 5:10 5:5
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent import run_replay
+from frame_sources import ReplaySource
+from frame_transport import parse_resolution
+from ingest_label_windows import flatten_window
+
+# Bookkeeping fields that differ between runs without being features
+SKIP_PREFIXES = ("window_id", "timestamp", "duration", "frame_count")
+REPLAY_EPOCH = 1_700_000_000.0
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark adaptive detection cadence")
+    p.add_argument("--replay", required=True, help="Video file or directory of images")
+    p.add_argument("--rates", nargs="+", default=["10:15", "5:10"],
+                   help="pose_hz:face_hz pairs to compare against full cadence")
+    p.add_argument("--adaptive", action="store_true", help="Also run each rate with motion-adaptive cadence")
+    p.add_argument("--max-frames", type=int, default=0)
+    p.add_argument("--resolution", default="640x360")
+    p.add_argument("--top", type=int, default=5, help="Worst-drifting features to list per run")
+    return p.parse_args()
+
+
+def replay(args: argparse.Namespace, pose_hz: float, face_hz: float,
+           adaptive: bool = False) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    windows: List[Dict[str, Any]] = []
+    # Same start time every run so window boundaries line up
+    source = ReplaySource(args.replay, max_size=parse_resolution(args.resolution), start_time=REPLAY_EPOCH)
+    stats = run_replay(source, on_window=windows.append, max_frames=args.max_frames,
+                       pose_hz=pose_hz, face_hz=face_hz, adaptive_cadence=adaptive)
+    return stats, windows
+
+
+def numeric_features(window: Dict[str, Any]) -> Dict[str, float]:
+    flat = flatten_window(window)
+    return {k: float(v) for k, v in flat.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+            and not k.split(".")[-1].startswith(SKIP_PREFIXES)}
+
+
+def drift(reference: List[Dict[str, Any]], candidate: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-feature mean |candidate - reference| over paired windows, raw and relative to the feature's size."""
+    pairs = list(zip(map(numeric_features, reference), map(numeric_features, candidate)))
+    keys = sorted(set.intersection(*(set(a) & set(b) for a, b in pairs))) if pairs else []
+    per_feature: Dict[str, Tuple[float, float]] = {}
+    for key in keys:
+        ref = np.array([a[key] for a, _ in pairs])
+        cand = np.array([b[key] for _, b in pairs])
+        err = float(np.abs(cand - ref).mean())
+        # Relative to the feature's magnitude; spread alone is ~0 for features that barely move
+        scale = float(np.abs(ref).mean() + ref.std()) or 1.0
+        per_feature[key] = (err, err / scale)
+    rel = [r for _, r in per_feature.values()]
+    return {
+        "windows": len(pairs),
+        "features": len(keys),
+        "mean_abs": float(np.mean([e for e, _ in per_feature.values()])) if per_feature else 0.0,
+        "mean_rel": float(np.mean(rel)) if rel else 0.0,
+        "p95_rel": float(np.percentile(rel, 95)) if rel else 0.0,
+        "per_feature": per_feature,
+    }
+
+
+def report(label: str, stats: Dict[str, Any], base_cpu: Optional[float], d: Optional[Dict[str, Any]], top: int) -> None:
+    cpu_ms = stats["cpu_seconds"] * 1000 / max(1, stats["frames"])
+    k = stats["keyframe_ratios"]
+    saved = f", {100 * (1 - cpu_ms / base_cpu):+.0f}% CPU saved" if base_cpu else ""
+    print(f"{label:>18}: {cpu_ms:6.1f} CPU ms/frame{saved}, keyframes pose {k['pose']:.0%} face {k['face']:.0%}, "
+          f"{stats['windows']} windows")
+    if d is None:
+        return
+    print(f"{'':>18}  drift over {d['windows']} windows x {d['features']} features: "
+          f"mean |Δ| {d['mean_abs']:.4f}, mean relative {d['mean_rel']:.1%}, p95 relative {d['p95_rel']:.1%}")
+    worst = sorted(d["per_feature"].items(), key=lambda item: -item[1][1])[:top]
+    for key, (err, rel) in worst:
+        print(f"{'':>20}{key}: |Δ| {err:.4f} ({rel:.1%})")
+
+
+def main() -> None:
+    args = parse_args()
+    runs: List[Tuple[str, float, float, bool]] = []
+    for spec in args.rates:
+        pose_hz, face_hz = (float(x) for x in spec.split(":"))
+        runs.append((f"pose {pose_hz:g}/face {face_hz:g} Hz", pose_hz, face_hz, False))
+        if args.adaptive:
+            runs.append((f"{spec} adaptive", pose_hz, face_hz, True))
+
+    t0 = time.perf_counter()
+    base_stats, base_windows = replay(args, 0.0, 0.0)
+    base_cpu = base_stats["cpu_seconds"] * 1000 / max(1, base_stats["frames"])
+    results = [("full cadence", base_stats, None)]
+    for label, pose_hz, face_hz, adaptive in runs:
+        stats, windows = replay(args, pose_hz, face_hz, adaptive)
+        results.append((label, stats, drift(base_windows, windows)))
+
+    print(f"\n📊 {base_stats['frames']} frames, {base_stats['recorded_seconds']:.1f}s recorded "
+          f"({time.perf_counter() - t0:.0f}s total)")
+    for label, stats, d in results:
+        report(label, stats, base_cpu if d is not None else None, d, args.top)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,160 @@
+"""Benchmark the flat-array forest runtime against the joblib RandomForest it was compiled from.
+
+Scores synthetic rows around the training medians from model_metadata.json:
+
+- single-row ``predict_proba`` latency (p50/p99), which is what the server pays per window,
+- batch throughput,
+- exactness: ``predict_proba`` must be identical (compared with ``n_jobs=1``,
+  because threaded accumulation order makes the shipped ``n_jobs=-1`` model
+  vary in the last bit between calls),
+- memory: array bytes and file size, plus the time, RSS and private memory (USS) each
+  loader adds in a fresh process. ``forest`` memory-maps the export, so its pages
+  are page cache shared by every process on the host. ``forest-copy`` reads them
+  into process memory.
+
+Usage:
+  python backend/bench_forest_runtime.py --calls 2000
+  python backend/bench_forest_runtime.py --model backend/models/stress_rf.joblib --forest backend/models/stress_rf_forest.npz
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from forest_runtime import FlatForest
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+LOADERS = ("sklearn", "forest-copy", "forest")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark the flat forest runtime")
+    p.add_argument("--model", default=os.path.join(MODELS_DIR, "stress_rf.joblib"))
+    p.add_argument("--forest", default=os.path.join(MODELS_DIR, "stress_rf_forest.npz"))
+    p.add_argument("--metadata", default=os.path.join(MODELS_DIR, "model_metadata.json"))
+    p.add_argument("--calls", type=int, default=1000, help="Single-row calls per runtime")
+    p.add_argument("--batch", type=int, default=256)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--load", choices=LOADERS, help=argparse.SUPPRESS)  # child mode for memory
+    return p.parse_args()
+
+
+def make_rows(metadata_path: str, n: int, seed: int) -> np.ndarray:
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    medians = np.array([metadata["medians"].get(name, 0.0) for name in metadata["features"]], dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    scale = np.abs(medians) + 1.0
+    return (medians + rng.normal(0.0, 0.5, size=(n, len(medians))) * scale).astype(np.float32)
+
+
+def latencies(fn: Callable[[np.ndarray], Any], rows: np.ndarray) -> np.ndarray:
+    fn(rows[:1])  # warm up
+    out = np.empty(len(rows))
+    for i in range(len(rows)):
+        row = rows[i:i + 1]
+        t0 = time.perf_counter()
+        fn(row)
+        out[i] = time.perf_counter() - t0
+    return out * 1e3
+
+
+def throughput(fn: Callable[[np.ndarray], Any], rows: np.ndarray, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return len(rows) / best
+
+
+def measure_load(kind: str, args: argparse.Namespace) -> Dict[str, float]:
+    """Runs in a child process: memory after imports and after loading + scoring once, and the load time."""
+    import psutil
+
+    process = psutil.Process(os.getpid())
+    rows = make_rows(args.metadata, args.batch, args.seed)
+    base = process.memory_full_info()
+    if kind == "sklearn":
+        import importlib
+        from joblib import load
+        importlib.import_module("sklearn.ensemble")  # unpickling imports it anyway; count it as import cost
+    imported = process.memory_full_info()
+    t0 = time.perf_counter()
+    if kind == "sklearn":
+        model = load(args.model)
+    else:
+        model = FlatForest.load(args.forest, mmap_arrays=kind == "forest")
+    load_ms = (time.perf_counter() - t0) * 1e3
+    model.predict_proba(rows[:1])  # every tree's root and a path per tree: the pages a first window touches
+    loaded = process.memory_full_info()
+    return {"import_mb": (imported.rss - base.rss) / 1e6, "load_mb": (loaded.rss - imported.rss) / 1e6,
+            "private_mb": (loaded.uss - imported.uss) / 1e6, "load_ms": load_ms}
+
+
+def child_load(kind: str, args: argparse.Namespace) -> Dict[str, float]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--load", kind,
+           "--model", args.model, "--forest", args.forest, "--metadata", args.metadata]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    args = parse_args()
+    if args.load:
+        print(json.dumps(measure_load(args.load, args)))
+        return
+
+    from joblib import load
+
+    model = load(args.model)
+    forest = FlatForest.load(args.forest)
+    if not forest.matches(args.model):
+        print(f"⚠️ {args.forest} was not exported from {args.model}; results compare different models")
+    rows = make_rows(args.metadata, max(args.calls, args.batch), args.seed)
+    single, batch = rows[:args.calls], rows[:args.batch]
+
+    print(f"📊 {forest.n_estimators} trees, {len(forest.feature)} nodes, depth {forest.max_depth}, "
+          f"{forest.n_features_in_} features")
+    runtimes: List = [(f"sklearn (n_jobs={model.n_jobs})", model.predict_proba)]
+    shipped_jobs = model.n_jobs
+    sequential = load(args.model)
+    sequential.n_jobs = 1
+    if shipped_jobs != 1:
+        runtimes.append(("sklearn (n_jobs=1)", sequential.predict_proba))
+    runtimes.append(("FlatForest", forest.predict_proba))
+
+    print(f"  single row, {args.calls} calls          p50 ms    p99 ms   batch {args.batch} rows/s")
+    base_p50 = None
+    for label, fn in runtimes:
+        ms = latencies(fn, single)
+        p50, p99 = np.percentile(ms, [50, 99])
+        base_p50 = base_p50 or p50
+        print(f"  {label:<32} {p50:8.3f}  {p99:8.3f}   {throughput(fn, batch):12.0f}"
+              f"   ({base_p50 / p50:.0f}x)")
+
+    exact = np.array_equal(sequential.predict_proba(rows), forest.predict_proba(rows))
+    with_nan = rows[:64].copy()
+    with_nan[::3, ::7] = np.nan
+    exact_nan = np.array_equal(sequential.predict_proba(with_nan), forest.predict_proba(with_nan))
+    print(f"  predict_proba identical: {exact} ({len(rows)} rows), with NaNs: {exact_nan}")
+
+    print("  memory")
+    print(f"    FlatForest arrays {forest.nbytes / 1e3:8.0f} KB   npz    {os.path.getsize(args.forest) / 1e3:6.0f} KB")
+    print(f"    sklearn pickle    {len(pickle.dumps(model)) / 1e3:8.0f} KB   joblib {os.path.getsize(args.model) / 1e3:6.0f} KB")
+    for kind in LOADERS:
+        r = child_load(kind, args)
+        print(f"    load {kind:<11} {r['load_ms']:6.1f} ms  +{r['load_mb']:5.2f} MB RSS  +{r['private_mb']:5.2f} MB private"
+              f"  (+{r['import_mb']:.1f} MB RSS for imports)")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark the producer -> agent frame handoff for both transports.
+
+For each transport a synthetic camera frame is published and then read back the
+way the agent does it, in a tight loop:
+
+  jpeg: cv2.imwrite + atomic rename  ->  file read + FFD9 check + cv2.imdecode
+  shm:  copy into SharedFrameRing    ->  copy of the newest slot (read_latest(copy=True), as the agent reads it)
+
+Reports frames/sec and CPU milliseconds per frame (process CPU time, producer and
+consumer side combined).
+
+Usage:
+  python backend/bench_frame_transport.py --width 1280 --height 720 --frames 300
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from frame_transport import SharedFrameRing, read_jpeg_frame, write_jpeg_frame
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark frame transports")
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--transports", nargs="+", default=["jpeg", "shm"], choices=["jpeg", "shm"])
+    return p.parse_args()
+
+
+def synthetic_frames(width: int, height: int, count: int = 8):
+    """A few camera-like BGR frames (smooth gradient + sensor noise) to cycle through."""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([(xx * 255 // max(1, width - 1)), (yy * 255 // max(1, height - 1)),
+                     ((xx + yy) * 127 // max(1, width + height))], axis=-1).astype(np.int16)
+    frames = []
+    for _ in range(count):
+        noise = rng.integers(-12, 12, size=base.shape, dtype=np.int16)
+        frames.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+def bench_jpeg(frames, n: int):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_frames_")
+    path = os.path.join(tmp_dir, "latest_frame.jpg")
+    checksum = 0
+    for i in range(n):
+        write_jpeg_frame(path, frames[i % len(frames)])
+        img = read_jpeg_frame(path)
+        checksum += int(img[0, 0, 0])
+    os.remove(path)
+    os.rmdir(tmp_dir)
+    return checksum
+
+
+def bench_shm(frames, n: int):
+    # Reading through the owner's mapping is the same memory access the agent does, and
+    # avoids two attachments of one segment within a single process
+    ring = SharedFrameRing.create(name=f"bench_frames_{os.getpid()}", slot_capacity=frames[0].nbytes)
+    checksum = 0
+    for i in range(n):
+        ring.write(frames[i % len(frames)])
+        latest = ring.read_latest(copy=True)
+        checksum += int(latest.image[0, 0, 0])
+        del latest
+    ring.close()
+    return checksum
+
+
+def main():
+    args = parse_args()
+    frames = synthetic_frames(args.width, args.height)
+    runners = {"jpeg": bench_jpeg, "shm": bench_shm}
+    print(f"Frame {args.width}x{args.height} BGR ({frames[0].nbytes / 1e6:.1f} MB), {args.frames} frames")
+    print(f"{'transport':>10} {'frames/s':>10} {'cpu ms/frame':>13} {'wall ms/frame':>14}")
+    for name in args.transports:
+        runners[name](frames, 10)  # warm-up
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        runners[name](frames, args.frames)
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        print(f"{name:>10} {args.frames / wall:>10.1f} {cpu * 1000 / args.frames:>13.3f} "
+              f"{wall * 1000 / args.frames:>14.3f}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
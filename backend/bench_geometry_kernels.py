@@ -0,0 +1,175 @@
+"""Microbenchmark the geometry kernels against the per-landmark tuple code they replaced.
+
+Builds synthetic FaceMesh and Pose frames. The reference path starts from what
+the agent used to keep per frame (a flat coordinate list plus an index map) and
+runs the old min/max/sorted measurements. The kernel path measures the same
+frames one at a time with ``measure_frame`` and all at once with ``measure``.
+
+Reports the time per frame for each path and the largest difference from the
+reference. Zero means the results are identical.
+
+Usage:
+  python backend/bench_geometry_kernels.py --frames 2000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from geometry_kernels import measure, measure_frame
+from landmark_arrays import FACE_REGION_COUNTS, FACE_REGIONS, POSE_INDEX, face_subset
+
+Point = Tuple[float, float, float]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark vectorised geometry kernels")
+    p.add_argument("--frames", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=3, help="Best of N timings")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+def make_frames(n: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(n, 478, 3) face meshes around a jittered face box, (n, 33, 4) pose landmarks."""
+    rng = np.random.default_rng(seed)
+    center = rng.uniform(0.4, 0.6, size=(n, 1, 3))
+    meshes = (center + rng.uniform(-0.15, 0.15, size=(n, 478, 3))).astype(np.float32)
+    poses = rng.uniform(0.1, 0.9, size=(n, 33, 4)).astype(np.float32)
+    return meshes, poses
+
+
+# --- reference: the tuple-based measurements -------------------------------------------------------------------
+
+def reference_inputs(mesh: np.ndarray, pose: np.ndarray) -> Tuple[List[float], Dict[int, Point], List[float]]:
+    index_map = {i: tuple(row) for i, row in enumerate(mesh.tolist())}
+    coords: List[float] = []
+    for indices in FACE_REGIONS.values():
+        for i in indices.tolist():
+            coords.extend(index_map[i])
+    pose_coords: List[float] = []
+    for row in pose[POSE_INDEX].tolist():
+        pose_coords.extend(row)
+    return coords, index_map, pose_coords
+
+
+def _regions(coords: List[float]) -> Dict[str, List[Point]]:
+    features, offset = {}, 0
+    for name, count in FACE_REGION_COUNTS.items():
+        features[name] = [(coords[offset + i * 3], coords[offset + i * 3 + 1], coords[offset + i * 3 + 2])
+                          for i in range(count) if offset + i * 3 + 2 < len(coords)]
+        offset += count * 3
+    return features
+
+
+def _eye_openness(eye: List[Point]) -> float:
+    if len(eye) < 6:
+        return 1.0
+    top = sorted(eye, key=lambda p: p[1])[:3]
+    bottom = sorted(eye, key=lambda p: p[1], reverse=True)[:3]
+    return max(0.0, sum(p[1] for p in bottom) / len(bottom) - sum(p[1] for p in top) / len(top))
+
+
+def _ear(im: Dict[int, Point], lc: int, rc: int, t1: int, b1: int, t2: int, b2: int) -> float:
+    x1, y1, _ = im[lc]
+    x2, y2, _ = im[rc]
+    w = ((x2 - x1)**2 + (y2 - y1)**2) ** 0.5
+    h = 0.5 * (abs(im[b1][1] - im[t1][1]) + abs(im[b2][1] - im[t2][1]))
+    return max(0.0, h / (w + 1e-6))
+
+
+def reference_measure(coords: List[float], index_map: Dict[int, Point], pose_coords: List[float]) -> Dict[str, float]:
+    features = _regions(coords)
+    lips, lb, rb = features["lips"], features["left_eyebrow"], features["right_eyebrow"]
+    jaw_width = max(lips, key=lambda p: p[0])[0] - min(lips, key=lambda p: p[0])[0]
+    jaw_height = max(lips, key=lambda p: p[1])[1] - min(lips, key=lambda p: p[1])[1]
+    center_y = sum(p[1] for p in lips) / len(lips)
+    upper = [p for p in lips if p[1] < center_y]
+    lower = [p for p in lips if p[1] >= center_y]
+    lip_thickness = (sum(p[1] for p in lower) / len(lower) - sum(p[1] for p in upper) / len(upper)
+                     if upper and lower else 0.0)
+    corner_avg_y = (min(lips, key=lambda p: p[0])[1] + max(lips, key=lambda p: p[0])[1]) / 2
+    nose_y, left_y, right_y = pose_coords[1], pose_coords[5], pose_coords[9]
+    avg_shoulder = (left_y + right_y) / 2
+
+    _regions(coords)  # the eye features rebuilt the region tuples a second time
+    return {
+        "jaw_width": jaw_width,
+        "jaw_height": jaw_height,
+        "mouth_area": jaw_width * jaw_height,
+        "eyebrow_height": (sum(p[1] for p in lb) / len(lb) + sum(p[1] for p in rb) / len(rb)) / 2,
+        "eyebrow_distance": abs(min(rb, key=lambda p: abs(p[0] - 0.5))[0] - min(lb, key=lambda p: abs(p[0] - 0.5))[0]),
+        "lip_thickness": lip_thickness,
+        "mouth_curvature": center_y - corner_avg_y,
+        "left_eye_openness": _ear(index_map, 33, 133, 159, 145, 160, 144),
+        "right_eye_openness": _ear(index_map, 362, 263, 386, 374, 385, 380),
+        "shoulder_height_avg": avg_shoulder,
+        "shoulder_asymmetry": abs(left_y - right_y),
+        "head_shoulder_distance": abs(nose_y - avg_shoulder),
+        "left_shoulder_height": left_y,
+        "right_shoulder_height": right_y,
+    }
+
+
+def region_openness_reference(subset: np.ndarray) -> Dict[str, float]:
+    features = _regions(subset.astype(np.float64).ravel().tolist())
+    return {"left_eye_openness": _eye_openness(features["left_eye"]),
+            "right_eye_openness": _eye_openness(features["right_eye"])}
+
+
+# --- benchmark ---------------------------------------------------------------------------------------------------
+
+def best_of(repeat: int, fn: Callable[[], object]) -> Tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def max_diff(reference: List[Dict[str, float]], candidate: List[Dict[str, float]]) -> Tuple[float, int]:
+    """Largest |Δ| over every frame and key, and how many values differ at all."""
+    worst, differing = 0.0, 0
+    for ref, cand in zip(reference, candidate):
+        for key, value in ref.items():
+            d = abs(cand[key] - value)
+            worst = max(worst, d)
+            differing += d != 0.0
+    return worst, differing
+
+
+def main() -> None:
+    args = parse_args()
+    meshes, poses = make_frames(args.frames, args.seed)
+    subsets = face_subset(meshes)  # (F, N, 3)
+    pose_points = poses[:, POSE_INDEX]
+    inputs = [reference_inputs(m, p) for m, p in zip(meshes, poses)]
+    n = args.frames
+
+    t_ref, reference = best_of(args.repeat, lambda: [reference_measure(*x) for x in inputs])
+    t_frame, per_frame = best_of(args.repeat, lambda: [measure_frame(s, m, p) for s, m, p in
+                                                       zip(subsets, meshes, pose_points)])
+    t_batch, batched = best_of(args.repeat, lambda: measure(subsets, meshes, pose_points))
+    batched_rows = [{k: float(v[i]) for k, v in batched.items()} for i in range(n)]
+
+    # Region-based eye openness is the fallback when there is no full mesh
+    eye_ref = [region_openness_reference(s) for s in subsets]
+    eye_batched = measure(subsets)
+    eye_rows = [{k: float(eye_batched[k][i]) for k in ("left_eye_openness", "right_eye_openness")} for i in range(n)]
+
+    print(f"📊 {n} frames, {len(reference[0])} measurements each (best of {args.repeat})")
+    print(f"  tuple reference : {1e6 * t_ref / n:8.1f} µs/frame")
+    print(f"  measure_frame   : {1e6 * t_frame / n:8.1f} µs/frame ({t_ref / t_frame:.1f}x)")
+    print(f"  measure (batch) : {1e6 * t_batch / n:8.1f} µs/frame ({t_ref / t_batch:.1f}x)")
+    for label, ref, cand in (("measure_frame", reference, per_frame), ("measure (batch)", reference, batched_rows),
+                             ("region openness", eye_ref, eye_rows)):
+        worst, differing = max_diff(ref, cand)
+        print(f"  {label:<16}: max |Δ| vs reference {worst:.3g} ({differing} values differ)")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
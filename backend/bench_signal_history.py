@@ -0,0 +1,126 @@
+"""Benchmark the per-frame cost and memory traffic of the BreathingTracker and FeatureExtractor histories.
+
+Feeds a synthetic breathing session (``bench_breathing.synthetic_trace``) to
+``BreathingTracker.update`` in each filter mode, and matching face/pose frames
+plus the tracker's output to ``FeatureExtractor.extract_features``. Reports:
+
+- time per call (mean/p50/p99), measured without tracing;
+- with ``tracemalloc``: the memory allocated above the live baseline at the
+  peak of each call (temporaries such as list copies of a history), and the
+  blocks and bytes the object still holds after the run (the histories).
+
+Only the public entry points are called, so the same script measures an older
+checkout for a before/after comparison:
+  git worktree add /tmp/before HEAD~1
+  cp backend/bench_signal_history.py /tmp/before/backend/ && python /tmp/before/backend/bench_signal_history.py
+
+Usage:
+  python backend/bench_signal_history.py --frames 3000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from agent import BreathingTracker, FeatureExtractor
+from bench_breathing import synthetic_trace
+from bench_geometry_kernels import make_frames
+from landmark_arrays import face_subset
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark signal-history cost")
+    p.add_argument("--frames", type=int, default=3000)
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+def tracker_calls(trace, mode: str) -> Tuple[Callable[[], Any], Callable[[int], Any]]:
+    nose, left, right = trace.nose.tolist(), trace.left.tolist(), trace.right.tolist()
+    t = trace.t.tolist()
+    state: Dict[str, Any] = {}
+
+    def make():
+        state["tracker"] = BreathingTracker(fps=30.0, window_seconds=5.0, filter_mode=mode)
+        return state["tracker"]
+
+    def call(i: int):
+        return state["tracker"].update(t[i], tuple(nose[i]), tuple(left[i]), tuple(right[i]))
+
+    return make, call
+
+
+def extractor_calls(trace, seed: int) -> Tuple[Callable[[], Any], Callable[[int], Any]]:
+    meshes, poses = make_frames(len(trace.t), seed)
+    tracker = BreathingTracker(fps=30.0, window_seconds=5.0)
+    frames: List[Dict[str, Any]] = []
+    for i, ts in enumerate(trace.t.tolist()):
+        breathing = tracker.update(ts, tuple(trace.nose[i]), tuple(trace.left[i]), tuple(trace.right[i]))
+        frames.append({"pose_landmarks": {"points": poses[i]},
+                       "face_landmarks": {"points": face_subset(meshes[i]), "mesh": meshes[i]},
+                       "breathing": breathing})
+    state: Dict[str, Any] = {}
+
+    def make():
+        state["extractor"] = FeatureExtractor()
+        return state["extractor"]
+
+    def call(i: int):
+        return state["extractor"].extract_features(frames[i])
+
+    return make, call
+
+
+def timed(make: Callable[[], Any], call: Callable[[int], Any], n: int) -> np.ndarray:
+    make()
+    out = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        call(i)
+        out[i] = time.perf_counter() - t0
+    return out * 1e6
+
+
+def traced(make: Callable[[], Any], call: Callable[[int], Any], n: int) -> Tuple[np.ndarray, int, int]:
+    """Peak bytes allocated above the live baseline per call; blocks and bytes held after the run."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        held = make()
+        peaks = np.empty(n)
+        for i in range(n):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call(i)
+            peaks[i] = tracemalloc.get_traced_memory()[1] - current
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    del held
+    return peaks, sum(d.count_diff for d in diff), sum(d.size_diff for d in diff)
+
+
+def main() -> None:
+    args = parse_args()
+    trace = synthetic_trace(0, args.frames / 30.0, np.random.default_rng(args.seed))
+    n = len(trace.t)
+    subjects = [(f"BreathingTracker.update ({mode})", *tracker_calls(trace, mode)) for mode in ("streaming", "filtfilt")]
+    subjects.append(("FeatureExtractor.extract_features", *extractor_calls(trace, args.seed)))
+
+    print(f"📊 {n} frames")
+    print(f"  {'call':<42} mean µs   p50 µs   p99 µs   peak KB/call (mean, p99)   held blocks   held KB")
+    for label, make, call in subjects:
+        us = timed(make, call, n)
+        peaks, blocks, size = traced(make, call, n)
+        kb = peaks / 1e3
+        print(f"  {label:<42} {us.mean():7.1f} {np.percentile(us, 50):8.1f} {np.percentile(us, 99):8.1f}"
+              f"   {kb.mean():10.2f} {np.percentile(kb, 99):10.2f}      {blocks:10d} {size / 1e3:9.1f}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
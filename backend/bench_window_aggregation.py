@@ -0,0 +1,152 @@
+"""Benchmark MLDataAggregator: per-frame buffering, window close, and the memory the window holds.
+
+Builds frames the way the pipeline does: a synthetic breathing session
+(``bench_breathing.synthetic_trace``) through ``BreathingTracker`` and
+matching face/pose landmarks through ``FeatureExtractor``. The frames are fed
+to ``MLDataAggregator.add_frame_data``, and the buffer is cleared after each
+exported window like ``export_landmark_data_node`` does. Reports:
+
+- time per buffered frame and per window close (mean/p50/p99);
+- with ``tracemalloc``: the memory allocated above the live baseline at the
+  peak of a window close, and the blocks and bytes the aggregator holds after
+  the run.
+
+Each ``--stats`` mode (``WINDOW_STATS``) runs at each ``--window-seconds``, so
+the close cost can be seen growing with the window length or not. For online
+mode it also reports how far each window feature drifts from the exact mode
+(largest absolute difference, over the features that differ).
+
+Usage:
+  python backend/bench_window_aggregation.py --frames 9000
+  python backend/bench_window_aggregation.py --window-seconds 5 10 20 --stats exact online
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import math
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent import BreathingTracker, FeatureExtractor, MLDataAggregator
+from bench_breathing import synthetic_trace
+from bench_geometry_kernels import make_frames
+from landmark_arrays import face_subset
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark window aggregation cost")
+    p.add_argument("--frames", type=int, default=9000)
+    p.add_argument("--window-seconds", type=float, nargs="+", default=[5.0])
+    p.add_argument("--stats", nargs="+", choices=("exact", "online"), default=["exact", "online"])
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+def pipeline_frames(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Aggregator input for ``n`` frames at 30 fps."""
+    trace = synthetic_trace(0, n / 30.0, np.random.default_rng(seed))
+    meshes, poses = make_frames(len(trace.t), seed)
+    tracker = BreathingTracker(fps=30.0, window_seconds=5.0)
+    extractor = FeatureExtractor()
+    frames = []
+    for i, ts in enumerate(trace.t.tolist()):
+        breathing = tracker.update(ts, tuple(trace.nose[i]), tuple(trace.left[i]), tuple(trace.right[i]))
+        ml_features = extractor.extract_features({"pose_landmarks": {"points": poses[i]},
+                                                  "face_landmarks": {"points": face_subset(meshes[i]), "mesh": meshes[i]},
+                                                  "breathing": breathing})
+        frames.append({"timestamp": ts, "ml_features": ml_features, "breathing": breathing,
+                       "has_pose": True, "has_face": True})
+    return frames
+
+
+def feed(aggregator: MLDataAggregator, frame: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """One pipeline step; the window features when it closed a window."""
+    aggregated = aggregator.add_frame_data(frame)
+    if aggregated is not None:
+        aggregator.data_buffer.clear()
+    return aggregated
+
+
+def timed(frames: List[Dict[str, Any]], window_seconds: float, mode: str) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+    aggregator = MLDataAggregator(window_seconds=window_seconds, fps=30.0, stats_mode=mode)
+    buffered, closed, windows = [], [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        aggregated = feed(aggregator, frame)
+        (closed if aggregated is not None else buffered).append(time.perf_counter() - t0)
+        if aggregated is not None:
+            windows.append(aggregated)
+    return np.array(buffered) * 1e6, np.array(closed) * 1e6, windows
+
+
+def traced(frames: List[Dict[str, Any]], window_seconds: float, mode: str) -> Tuple[np.ndarray, int, int]:
+    """Peak bytes allocated above the live baseline per window close; blocks and bytes held after the run."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        aggregator = MLDataAggregator(window_seconds=window_seconds, fps=30.0, stats_mode=mode)
+        peaks = []
+        for frame in frames:
+            # A fresh dict per frame, as the pipeline builds them, so whatever the aggregator keeps counts as held
+            frame = copy.deepcopy(frame)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            if feed(aggregator, frame) is not None:
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        # Held at the fullest point of a window: refill it without closing
+        for frame in frames[:int(window_seconds * 30) - 1]:
+            aggregator.data_buffer.append(copy.deepcopy(frame))
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    del aggregator
+    return np.array(peaks), sum(d.count_diff for d in diff), sum(d.size_diff for d in diff)
+
+
+def drift(exact: List[Dict[str, Any]], online: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Largest absolute difference per numeric window feature (NaN when only one side is NaN)."""
+    worst: Dict[str, float] = {}
+
+    def walk(a: Any, b: Any, path: str) -> None:
+        if isinstance(a, dict):
+            for key in a:
+                walk(a[key], b.get(key), f"{path}.{key}" if path else key)
+        elif isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+            diff = 0.0 if math.isnan(a) and math.isnan(b) else abs(a - b)
+            worst[path] = max(worst.get(path, 0.0), diff)
+
+    for a, b in zip(exact, online):
+        walk({k: v for k, v in a.items() if isinstance(v, dict)}, b, "")
+    return worst
+
+
+def main() -> None:
+    args = parse_args()
+    frames = pipeline_frames(args.frames, args.seed)
+
+    print(f"📊 {len(frames)} frames")
+    print(f"  {'window':<8} {'stats':<8} {'step':<14} mean µs   p50 µs   p99 µs")
+    for window_seconds in args.window_seconds:
+        results = {}
+        for mode in args.stats:
+            buffered, closed, results[mode] = timed(frames, window_seconds, mode)
+            peaks, blocks, size = traced(frames, window_seconds, mode)
+            for label, us in (("buffer frame", buffered), ("close window", closed)):
+                print(f"  {window_seconds:<8g} {mode:<8} {label:<14} {us.mean():7.1f} {np.percentile(us, 50):8.1f} "
+                      f"{np.percentile(us, 99):8.1f}")
+            print(f"  {'':<17} {len(closed)} windows; close peak KB (mean, p99) {peaks.mean() / 1e3:.1f}, "
+                  f"{np.percentile(peaks, 99) / 1e3:.1f}; held with a full window {blocks} blocks, {size / 1e3:.1f} KB")
+        if "exact" in results and "online" in results:
+            print(f"  online drift from exact at {window_seconds:g}s (largest absolute difference):")
+            for feature, diff in sorted(drift(results["exact"], results["online"]).items(), key=lambda kv: -kv[1]):
+                if diff > 1e-6:
+                    print(f"    {feature:<52} {diff:.4g}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,132 @@
+"""Breathing-rate estimators over a band-passed chest/head signal.
+
+Breathing lives below 1 Hz, so the 30 fps signal is block-averaged down to a
+few Hz (``decimate``) before any O(n log n) work:
+
+- ``autocorr_bpm``: FFT autocorrelation. The rate comes from the strongest
+  local maximum between the shortest and longest allowed cycle, refined to a
+  sub-sample lag by parabolic interpolation. A maximum on the edge of the
+  range is a decaying tail, not a cycle, so it is rejected.
+- ``spectrum_bpm``: the peak of the Hann-windowed, zero-padded power
+  spectrum inside the allowed band.
+- ``cycle_bpm``: ``find_peaks`` over the filtered buffer for peaks and
+  valleys, then the mean interval between consecutive ones, like the
+  tracker's per-frame cycle detector.
+
+Each estimator returns ``(bpm, confidence)`` and ``(0.0, 0.0)`` when it has
+nothing to report.
+"""
+from __future__ import annotations
+
+import math
+from typing import Sequence, Tuple
+
+import numpy as np
+from scipy import fft as sp_fft
+from scipy.signal import find_peaks
+
+Estimate = Tuple[float, float]
+NO_ESTIMATE: Estimate = (0.0, 0.0)
+
+
+def decimate(x: np.ndarray, fs: float, target_fs: float) -> Tuple[np.ndarray, float]:
+    """Mean of consecutive blocks of ``round(fs / target_fs)`` samples, aligned to the newest sample."""
+    q = max(1, int(round(fs / target_fs))) if target_fs > 0 else 1
+    if q == 1:
+        return np.asarray(x, dtype=np.float64), fs
+    n = len(x) // q * q
+    blocks = np.asarray(x[len(x) - n:], dtype=np.float64).reshape(-1, q)
+    return blocks.mean(axis=1), fs / q
+
+
+def _parabolic(y0: float, y1: float, y2: float) -> float:
+    """Offset (-0.5..0.5) of the vertex of the parabola through three equally spaced points."""
+    denom = y0 - 2.0 * y1 + y2
+    return 0.5 * (y0 - y2) / denom if denom != 0 else 0.0
+
+
+def autocorr_bpm(x: np.ndarray, fs: float, min_cycle: float, max_cycle: float) -> Estimate:
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if n < 4:
+        return NO_ESTIMATE
+    x = x - x.mean()
+    if np.max(np.abs(x)) < 1e-9:
+        return NO_ESTIMATE
+    nfft = sp_fft.next_fast_len(2 * n, real=True)
+    spectrum = sp_fft.rfft(x, nfft)
+    acf = sp_fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, nfft)[:n]
+    if acf[0] <= 0:
+        return NO_ESTIMATE
+    lo = max(1, int(math.ceil(min_cycle * fs)))
+    hi = min(n - 2, int(math.floor(max_cycle * fs)))
+    if hi <= lo:
+        return NO_ESTIMATE
+    segment = acf[lo - 1:hi + 2]
+    inner = segment[1:-1]
+    maxima = np.flatnonzero((inner > segment[:-2]) & (inner >= segment[2:]))
+    if len(maxima) == 0:
+        return NO_ESTIMATE
+    k = int(maxima[np.argmax(inner[maxima])]) + lo
+    lag = (k + _parabolic(acf[k - 1], acf[k], acf[k + 1])) / fs
+    if lag <= 0:
+        return NO_ESTIMATE
+    return 60.0 / lag, float(min(1.0, max(0.0, acf[k] / acf[0])))
+
+
+def spectrum_bpm(x: np.ndarray, fs: float, min_cycle: float, max_cycle: float, pad: int = 8) -> Estimate:
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if n < 4:
+        return NO_ESTIMATE
+    x = (x - x.mean()) * np.hanning(n)
+    nfft = sp_fft.next_fast_len(pad * n, real=True)
+    power = np.abs(sp_fft.rfft(x, nfft)) ** 2
+    freqs = sp_fft.rfftfreq(nfft, 1.0 / fs)
+    band = np.flatnonzero((freqs >= 1.0 / max_cycle) & (freqs <= 1.0 / min_cycle))
+    if len(band) < 3:
+        return NO_ESTIMATE
+    total = power[band].sum()
+    if total <= 0:
+        return NO_ESTIMATE
+    k = int(band[np.argmax(power[band])])
+    if 0 < k < len(power) - 1:
+        f = freqs[k] + _parabolic(power[k - 1], power[k], power[k + 1]) * (freqs[1] - freqs[0])
+    else:
+        f = freqs[k]
+    if f <= 0:
+        return NO_ESTIMATE
+    # Confidence: share of in-band power within one resolution bin (fs / n) of the peak
+    near = band[np.abs(freqs[band] - freqs[k]) <= fs / n]
+    return 60.0 * f, float(min(1.0, power[near].sum() / total))
+
+
+def interval_bpm(peak_times: Sequence[float], valley_times: Sequence[float],
+                 min_cycle: float, max_cycle: float) -> Estimate:
+    """Mean peak-to-peak and valley-to-valley interval; confidence from their consistency and count."""
+    if len(peak_times) < 2 or len(valley_times) < 2:
+        return NO_ESTIMATE
+    intervals = np.concatenate([np.diff(peak_times), np.diff(valley_times)])
+    valid = intervals[(intervals >= min_cycle) & (intervals <= max_cycle)]
+    if len(valid) == 0:
+        return NO_ESTIMATE
+    avg_cycle = float(valid.mean())
+    if len(valid) > 1:
+        consistency = max(0.0, 1.0 - float(valid.std()) / avg_cycle)
+        confidence = consistency * min(1.0, len(valid) / 3)
+    else:
+        confidence = 0.3
+    return 60.0 / avg_cycle, confidence
+
+
+def cycle_bpm(t: np.ndarray, y: np.ndarray, fs: float, min_cycle: float, max_cycle: float,
+              min_amplitude: float) -> Estimate:
+    """Peaks and valleys of a filtered buffer (at least half a cycle apart, above ``min_amplitude``)."""
+    if len(y) < 3:
+        return NO_ESTIMATE
+    distance = max(1, int(fs * min_cycle / 2))
+    peaks, _ = find_peaks(y, distance=distance)
+    valleys, _ = find_peaks(-y, distance=distance)
+    peaks = peaks[np.abs(y[peaks]) > min_amplitude]
+    valleys = valleys[np.abs(y[valleys]) > min_amplitude]
+    return interval_bpm(t[peaks], t[valleys], min_cycle, max_cycle)
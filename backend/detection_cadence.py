@@ -0,0 +1,150 @@
+"""Run Pose and FaceMesh below the frame rate and extrapolate landmarks in between.
+
+Breathing, posture and jaw metrics change slowly compared with 30 fps, so each
+model gets its own ``ModelCadence`` (``AGENT_POSE_HZ`` / ``AGENT_FACE_HZ``;
+``0`` = every frame). Frames where a model is not due are filled in by a
+``LandmarkExtrapolator``: a constant-velocity prediction from the last two
+keyframes, handed downstream as objects shaped like MediaPipe results, so
+``BreathingTracker.update`` and ``FeatureExtractor`` still get a sample every
+frame.
+
+With ``AGENT_CADENCE_ADAPTIVE=1`` a model runs every frame while its landmarks
+move faster than ``AGENT_CADENCE_MOTION`` (normalized image units per second),
+and drops back to its base rate when motion settles.
+"""
+from __future__ import annotations
+
+import os
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import numpy as np
+
+from landmark_arrays import landmark_points
+
+POSE_HZ = float(os.getenv("AGENT_POSE_HZ", "0"))
+FACE_HZ = float(os.getenv("AGENT_FACE_HZ", "0"))
+CADENCE_ADAPTIVE = os.getenv("AGENT_CADENCE_ADAPTIVE", "0").lower() in ("1", "true", "yes", "on")
+CADENCE_MOTION = float(os.getenv("AGENT_CADENCE_MOTION", "0.5"))
+# Never extrapolate further than this past a keyframe; hold the last prediction instead
+MAX_EXTRAPOLATION_S = 0.25
+
+
+class _Landmark:
+    __slots__ = ("x", "y", "z", "visibility")
+
+    def __init__(self, x: float, y: float, z: float, visibility: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visibility = visibility
+
+
+class _LandmarkSeq:
+    """Read-only ``.landmark`` sequence over an (N, 3|4) array; items are built on access."""
+
+    __slots__ = ("_array",)
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def __len__(self) -> int:
+        return len(self._array)
+
+    def __getitem__(self, index: int) -> _Landmark:
+        row = self._array[index].tolist()
+        return _Landmark(row[0], row[1], row[2], row[3] if len(row) > 3 else 0.0)
+
+
+class LandmarkExtrapolator:
+    """Constant-velocity predictor over one landmark set (pose or face), fed with keyframe results."""
+
+    def __init__(self, max_extrapolation_s: float = MAX_EXTRAPOLATION_S):
+        self.max_extrapolation_s = max_extrapolation_s
+        self._t: Optional[float] = None
+        self._points: Optional[np.ndarray] = None   # (N, 3|4): x, y, z[, visibility]; None = nothing detected
+        self._velocity: Optional[np.ndarray] = None  # (N, 3) per second
+
+    def reset(self) -> None:
+        self._t = self._points = self._velocity = None
+
+    @property
+    def speed(self) -> float:
+        """Fastest visible landmark's speed at the last keyframe (normalized units/s); 0 without a velocity."""
+        if self._velocity is None:
+            return 0.0
+        speeds = np.sqrt((self._velocity[:, :2] ** 2).sum(axis=1))
+        # Off-screen pose landmarks jitter wildly; FaceMesh reports no visibility at all
+        if self._points.shape[1] < 4 or not (self._points[:, 3] >= 0.5).any():
+            return float(speeds.max())
+        return float(speeds[self._points[:, 3] >= 0.5].max())
+
+    def update(self, t: float, landmark_list: Any) -> None:
+        """Record a keyframe: a MediaPipe NormalizedLandmarkList, or None if nothing was detected."""
+        if landmark_list is None:
+            self.reset()
+            return
+        points = landmark_points(landmark_list).astype(np.float64)
+        if self._points is not None and self._t is not None and len(points) == len(self._points) and t > self._t:
+            self._velocity = (points[:, :3] - self._points[:, :3]) / (t - self._t)
+        else:
+            self._velocity = None
+        self._t, self._points = t, points
+
+    def predict(self, t: float) -> Optional[SimpleNamespace]:
+        """Landmarks at time ``t`` (``.points`` array, plus MediaPipe-style ``.landmark[i].x``), or None."""
+        if self._points is None:
+            return None
+        points = self._points
+        if self._velocity is not None:
+            dt = min(max(0.0, t - self._t), self.max_extrapolation_s)
+            points = points.copy()
+            points[:, :3] += self._velocity * dt
+        return SimpleNamespace(landmark=_LandmarkSeq(points), points=points)
+
+
+class ModelCadence:
+    """Decides per frame whether a model runs (keyframe) or its landmarks are extrapolated."""
+
+    def __init__(self, rate_hz: float = 0.0, adaptive: bool = False,
+                 motion_threshold: float = CADENCE_MOTION):
+        self.rate_hz = rate_hz
+        self.adaptive = adaptive
+        self.motion_threshold = motion_threshold
+        self.predictor = LandmarkExtrapolator()
+        self.last_run: Optional[float] = None
+        self._last_t: Optional[float] = None
+        self._frame_dt = 0.0
+        self.runs = 0
+        self.predicted = 0
+
+    def due(self, t: float) -> bool:
+        if self._last_t is not None and t > self._last_t:
+            self._frame_dt = t - self._last_t
+        self._last_t = t
+        if self.rate_hz <= 0 or self.last_run is None:
+            return True  # full rate or first frame; a miss (nothing detected) waits for the next keyframe too
+        if self.adaptive and self.predictor.speed > self.motion_threshold:
+            return True
+        # Half a frame of slack so 15 Hz on a 30 fps stream is every other frame, not every third
+        return t - self.last_run >= 1.0 / self.rate_hz - 0.5 * self._frame_dt
+
+    def keyframe(self, t: float, landmark_list: Any) -> None:
+        self.last_run = t
+        self.runs += 1
+        if self.rate_hz > 0:  # at full rate nothing is ever extrapolated
+            self.predictor.update(t, landmark_list)
+
+    def predict(self, t: float) -> Any:
+        self.predicted += 1
+        return self.predictor.predict(t)
+
+
+def as_pose_results(landmarks: Any) -> SimpleNamespace:
+    """Stand-in for ``mp.solutions.pose.Pose.process`` output."""
+    return SimpleNamespace(pose_landmarks=landmarks)
+
+
+def as_face_results(landmarks: Any) -> SimpleNamespace:
+    """Stand-in for ``mp.solutions.face_mesh.FaceMesh.process`` output."""
+    return SimpleNamespace(multi_face_landmarks=[landmarks] if landmarks is not None else None)
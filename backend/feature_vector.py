@@ -0,0 +1,95 @@
+"""Compile the model's feature list into a fast window -> row builder.
+
+``model_metadata.json`` names features by dotted path into the nested window
+dict (``breathing_analysis.mean_bpm``), the same names ``ingest_label_windows``
+flattens to for training. ``FeatureVectorizer`` turns that list into a path
+tree once. Each window is then walked along the tree straight into a
+preallocated float32 row, with no flattening and no per-name lookups.
+
+Missing, non-numeric (strings, None, nested dicts) and non-finite values take
+the training median. float32 is what scikit-learn's trees compare against
+internally, so scores are unchanged.
+"""
+from __future__ import annotations
+
+import json
+from numbers import Real
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_Tree = Dict[str, Any]  # key -> column index (leaf) or subtree
+_NUMERIC = (float, int, bool)
+
+
+def compile_paths(features: Sequence[str]) -> _Tree:
+    """Path tree for dotted feature names; a name that is both a leaf and a prefix keeps the leaf."""
+    tree: _Tree = {}
+    for col, name in enumerate(features):
+        *parents, leaf = name.split(".")
+        node = tree
+        for key in parents:
+            child = node.setdefault(key, {})
+            if not isinstance(child, dict):
+                break
+            node = child
+        else:
+            node.setdefault(leaf, col)
+    return tree
+
+
+def _fill(tree: _Tree, window: Dict[str, Any], row: List[Any]) -> None:
+    for key, target in tree.items():
+        value = window.get(key)
+        if value is None:
+            continue
+        if type(target) is dict:
+            if isinstance(value, dict):
+                _fill(target, value, row)
+        elif type(value) in _NUMERIC or isinstance(value, Real):  # numpy scalars too; strings keep the median
+            row[target] = value
+
+
+class FeatureVectorizer:
+    """Window dict -> model input row(s) in ``features`` order."""
+
+    def __init__(self, features: Sequence[str], medians: Optional[Dict[str, float]] = None):
+        self.features: List[str] = list(features)
+        medians = medians or {}
+        self.medians = np.array([medians.get(name, 0) for name in self.features], dtype=np.float32)
+        self._tree = compile_paths(self.features)
+        self._defaults = self.medians.tolist()
+        self._row = np.empty((1, len(self.features)), dtype=np.float32)
+
+    @classmethod
+    def from_metadata(cls, path: str) -> "FeatureVectorizer":
+        with open(path, "r") as f:
+            metadata = json.load(f)
+        return cls(metadata.get("features", []), metadata.get("medians", {}))
+
+    @property
+    def width(self) -> int:
+        return len(self.features)
+
+    def _impute(self, rows: np.ndarray) -> None:
+        np.copyto(rows, self.medians, where=~np.isfinite(rows))
+
+    def transform(self, window: Dict[str, Any]) -> np.ndarray:
+        """(1, d) row for one window. The buffer is reused on the next call, so copy it to keep it."""
+        values = self._defaults.copy()
+        _fill(self._tree, window, values)
+        row = self._row
+        row[0] = values
+        self._impute(row)
+        return row
+
+    def transform_many(self, windows: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """(n, d) matrix for many windows, in one freshly allocated array."""
+        table = []
+        for window in windows:
+            values = self._defaults.copy()
+            _fill(self._tree, window, values)
+            table.append(values)
+        rows = np.array(table, dtype=np.float32).reshape(len(table), len(self.features))
+        self._impute(rows)
+        return rows
@@ -0,0 +1,242 @@
+"""Flat-array runtime for the stress RandomForest.
+
+``RandomForestClassifier.predict_proba`` on one row still pays for input
+validation and a joblib dispatch over 400 trees, which is milliseconds of
+overhead for microseconds of work. ``compile_forest`` flattens every tree into
+one set of contiguous node arrays, and ``FlatForest`` walks all trees for all
+rows at once with numpy gathers.
+
+Node arrays (all trees concatenated, ``roots[t]`` is tree t's first node):
+
+- ``feature`` (int64), ``threshold`` (float64), ``missing_left`` (bool): the split.
+- ``children`` (int64, 2 per node): ``children[2 * node + went_left]``, so the
+  next node is one gather. A leaf points to itself, so walking ``max_depth``
+  steps parks every row on its leaf.
+- ``value`` (float64, nodes x classes): class fractions, as ``tree_.predict`` returns them.
+
+``save_forest`` writes them to an uncompressed ``.npz`` with every array
+64-byte aligned in the file. ``FlatForest.load`` memory-maps those arrays
+read-only instead of copying them, so every process scoring with the same file
+shares one page-cache copy. ``np.load`` ignores ``mmap_mode`` for ``.npz``.
+
+Because running processes keep that file mapped, it must never be changed in
+place: truncating or rewriting a mapped file kills its readers with SIGBUS on
+their next prediction. ``write_aligned_npz`` writes a temp file in the same
+directory and ``os.replace``s it over the old one, so mapped processes keep
+the old inode until they reload.
+
+Scores match ``predict_proba`` bit for bit. Rows are cast to float32 like
+sklearn's input check, compared against float64 thresholds, and NaNs follow
+``missing_go_to_left``. Tree outputs are summed in tree order, then divided by
+the number of trees.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+FOREST_ARRAYS = ("feature", "threshold", "children", "missing_left", "value", "roots")
+FOREST_FORMAT = 2
+ARRAY_ALIGN = 64
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")  # zip local file header, 30 bytes
+_PAD_FIELD = 0xA11C  # private zip extra-field id used for alignment padding
+
+
+def file_digest(path: str) -> str:
+    """sha1 of a model file, recorded in the export so a stale one can be detected."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compile_forest(model: Any, source: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Flatten a fitted single-output ``RandomForestClassifier`` (or any list of sklearn trees) into node arrays."""
+    estimators = getattr(model, "estimators_", None)
+    if not estimators:
+        raise ValueError("compile_forest needs a fitted tree ensemble")
+    n_classes = int(np.atleast_1d(model.n_classes_)[0])
+    parts: Dict[str, list] = {name: [] for name in FOREST_ARRAYS if name != "roots"}
+    roots = []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        n = tree.node_count
+        local = np.arange(n)
+        is_leaf = tree.children_left < 0
+        roots.append(offset)
+        parts["feature"].append(np.where(is_leaf, 0, tree.feature))
+        parts["threshold"].append(np.where(is_leaf, 0.0, tree.threshold))
+        left = np.where(is_leaf, local, tree.children_left) + offset
+        right = np.where(is_leaf, local, tree.children_right) + offset
+        parts["children"].append(np.stack([right, left], axis=1).ravel())
+        missing = getattr(tree, "missing_go_to_left", None)
+        parts["missing_left"].append(np.asarray(missing, dtype=bool) if missing is not None and len(missing) == n
+                                     else np.zeros(n, dtype=bool))
+        parts["value"].append(tree.value[:, 0, :n_classes])
+        offset += n
+        max_depth = max(max_depth, int(tree.max_depth))
+    arrays = {
+        "feature": np.concatenate(parts["feature"]).astype(np.int64),
+        "threshold": np.concatenate(parts["threshold"]).astype(np.float64),
+        "children": np.concatenate(parts["children"]).astype(np.int64),
+        "missing_left": np.concatenate(parts["missing_left"]),
+        "value": np.ascontiguousarray(np.concatenate(parts["value"]), dtype=np.float64),
+        "roots": np.array(roots, dtype=np.int64),
+    }
+    meta = {
+        "format": FOREST_FORMAT,
+        "classes": np.asarray(model.classes_).tolist(),
+        "n_features": int(model.n_features_in_),
+        "max_depth": max_depth,
+        "source_sha1": file_digest(source) if source else None,
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    return arrays
+
+
+def write_aligned_npz(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Uncompressed ``.npz`` whose array data starts on ``ARRAY_ALIGN`` boundaries (padding in the zip extra field).
+
+    Written to a temp file next to ``path`` and renamed over it, never rewritten in place.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with zipfile.ZipFile(f, "w", zipfile.ZIP_STORED) as zf:
+                for name, array in arrays.items():
+                    buf = io.BytesIO()
+                    np.lib.format.write_array(buf, np.ascontiguousarray(array), allow_pickle=False)
+                    info = zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+                    # The .npy header is itself padded to a multiple of 64, so aligning the member aligns the data
+                    start = zf.fp.tell() + _LOCAL_HEADER.size + len(info.filename.encode()) + 4
+                    pad = -start % ARRAY_ALIGN
+                    info.extra = struct.pack("<HH", _PAD_FIELD, pad) + bytes(pad)
+                    zf.writestr(info, buf.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; give the export the permissions a plain open() would
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def map_npz(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Read-only arrays backed by one ``mmap`` of an uncompressed ``.npz``; None if a member is compressed."""
+    arrays = {}
+    with open(path, "rb") as f:
+        with zipfile.ZipFile(f) as zf:
+            members = zf.infolist()
+        if any(info.compress_type != zipfile.ZIP_STORED for info in members):
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in members:
+            f.seek(info.header_offset)
+            *_, name_len, extra_len = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            f.seek(name_len + extra_len, io.SEEK_CUR)
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            count = int(np.prod(shape, dtype=np.int64))
+            array = np.frombuffer(mapped, dtype=dtype, count=count, offset=f.tell())
+            arrays[info.filename[:-len(".npy")]] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+
+def save_forest(model: Any, path: str, source: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Compile ``model`` (saved at ``source``, if given) and write the arrays for ``FlatForest.load``."""
+    arrays = compile_forest(model, source)
+    write_aligned_npz(path, arrays)
+    return arrays
+
+
+class FlatForest:
+    """Vectorised ``predict_proba`` over compiled node arrays; a drop-in for the fitted forest when scoring."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        meta = json.loads(bytes(arrays["meta"]).decode())
+        if meta.get("format") != FOREST_FORMAT:
+            raise ValueError(f"flat forest format {meta.get('format')} != {FOREST_FORMAT}; re-export the model")
+        for name in FOREST_ARRAYS:
+            setattr(self, name, arrays[name])
+        # Gather indices must be intp: a no-op on 64-bit, where the stored int64 already is
+        self.feature = np.asarray(self.feature, dtype=np.intp)
+        self.children = np.asarray(self.children, dtype=np.intp)
+        self.roots = np.asarray(self.roots, dtype=np.intp)
+        self.classes_ = np.array(meta["classes"])
+        self.n_features_in_ = meta["n_features"]
+        self.max_depth = meta["max_depth"]
+        self.source_sha1: Optional[str] = meta.get("source_sha1")
+        self.n_estimators = len(self.roots)
+        self.mapped = all(not getattr(self, name).flags.owndata for name in FOREST_ARRAYS)
+
+    @classmethod
+    def load(cls, path: str, mmap_arrays: bool = True) -> "FlatForest":
+        """Arrays from ``save_forest``, memory-mapped read-only unless ``mmap_arrays`` is False."""
+        arrays = map_npz(path) if mmap_arrays else None
+        if arrays is None:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        return cls(arrays)
+
+    @classmethod
+    def from_model(cls, model: Any) -> "FlatForest":
+        return cls(compile_forest(model))
+
+    def matches(self, source: str) -> bool:
+        """Whether this export was compiled from the model file at ``source``."""
+        return self.source_sha1 is not None and self.source_sha1 == file_digest(source)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in FOREST_ARRAYS)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node (global index) reached by every row in every tree: (n_rows, n_trees)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_start = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_estimators))
+        check_missing = bool(np.isnan(flat).any())
+        for _ in range(self.max_depth):
+            x = flat.take(row_start + self.feature.take(nodes))
+            go_left = x <= self.threshold.take(nodes)
+            if check_missing:
+                go_left |= np.isnan(x) & self.missing_left.take(nodes)
+            nodes = self.children.take(2 * nodes + go_left)
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """(n_rows, n_classes), identical to the source forest's ``predict_proba``."""
+        leaves = self.value[self.apply(X)]  # (rows, trees, classes)
+        # Running sum in tree order, like the forest's accumulation, then the same division
+        proba = np.cumsum(leaves, axis=1)[:, -1, :]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
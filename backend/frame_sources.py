@@ -0,0 +1,309 @@
+"""Pluggable frame sources for the agent.
+
+A ``FrameSource`` hands the agent frames (see ``frame_transport.Frame``) with a
+per-source sequence id and capture timestamp:
+
+* ``JpegFileSource``     – the original ``frames/latest_frame.jpg`` handoff.
+* ``SharedMemorySource`` – the producer's shared-memory ring (live WebRTC frames).
+* ``LiveFrameSource``    – shared memory first, JPEG file as fallback (the agent default).
+* ``MailboxSource``      – the in-process ``FrameMailbox`` fed by ``main.py``.
+* ``ReplaySource``       – a recorded video file or a directory of images decoded
+  through PyAV. By default frames are delivered as fast as the pipeline takes
+  them, stamped with their recorded timestamps; ``realtime=True`` paces them to
+  the wall clock instead.
+"""
+from __future__ import annotations
+
+import contextlib
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, ContextManager, Iterator, List, Optional, Tuple
+
+from frame_transport import (
+    FRAME_SHM_NAME,
+    Frame,
+    FrameMailbox,
+    JpegFrameReader,
+    SharedFrameRing,
+    av_frame_to_ndarray,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class FrameSource(ABC):
+    """Polling interface: ``has_new`` is cheap, ``read`` returns the next unseen frame (or None)."""
+
+    name = "source"
+    # True when frame timestamps are wall-clock capture times (frame age is meaningful)
+    live = True
+    # True once a finite source has delivered its last frame
+    exhausted = False
+
+    @abstractmethod
+    def has_new(self) -> bool:
+        ...
+
+    @abstractmethod
+    def read(self) -> Optional[Frame]:
+        ...
+
+    def wait(self, timeout: float) -> bool:
+        """Block (polling every 2 ms) until ``has_new`` or the timeout expires."""
+        deadline = time.time() + timeout
+        while True:
+            if self.has_new():
+                return True
+            if self.exhausted or time.time() >= deadline:
+                return False
+            time.sleep(0.002)
+
+    def mark_consumed(self, frame: Frame, age_ms: float) -> None:
+        """Feedback to the producer: ``frame`` was taken for detection."""
+
+    def publish_processing_fps(self, frame: Frame, fps: float) -> None:
+        """Feedback to the producer: frames/sec the consumer can sustain."""
+
+    def close(self) -> None:
+        pass
+
+
+class JpegFileSource(FrameSource):
+    """The producer's atomically replaced JPEG file; seq advances when the file changes."""
+
+    name = "jpeg"
+
+    def __init__(self, path: str, read_guard: Callable[[], ContextManager] = contextlib.nullcontext,
+                 retries: int = 3):
+        self._reader = JpegFrameReader(path)
+        self._read_guard = read_guard  # e.g. stderr suppression around OpenCV's JPEG warnings
+        self._retries = retries
+        self.errors = 0
+
+    def has_new(self) -> bool:
+        return self._reader.has_new()
+
+    def read(self) -> Optional[Frame]:
+        # Size and JPEG end marker (FFD9) checks guard against partial writes; retry briefly
+        for attempt in range(self._retries):
+            try:
+                with self._read_guard():
+                    frame = self._reader.read()
+                if frame is not None:
+                    return frame
+            except Exception as e:
+                if attempt == self._retries - 1:
+                    self.errors += 1
+                    if self.errors % 50 == 1:
+                        print(f"⚠️ Failed to load frame after {attempt + 1} attempts: {e}")
+                    return None
+            if attempt < self._retries - 1:
+                time.sleep(0.002)
+        return None
+
+
+class SharedMemorySource(FrameSource):
+    """Newest frame from the producer's shared-memory ring, attached lazily (retried once a second)."""
+
+    name = "shm"
+
+    def __init__(self, shm_name: str = FRAME_SHM_NAME):
+        self.shm_name = shm_name
+        self.ring: Optional[SharedFrameRing] = None
+        self._retry_at = 0.0
+        self._last_seq = 0
+        self.torn_reads = 0  # newest slot overwritten while it was being copied out
+
+    def _get_ring(self) -> Optional[SharedFrameRing]:
+        if self.ring is not None and self.ring.closed:
+            # Producer restarted; drop the stale mapping and re-attach
+            self.ring = None
+            self._last_seq = 0
+        if self.ring is None and time.time() >= self._retry_at:
+            self.ring = SharedFrameRing.attach(self.shm_name)
+            self._retry_at = time.time() + 1.0
+            if self.ring is not None:
+                print("🧠 Attached to shared-memory frame ring")
+        return self.ring
+
+    def has_new(self) -> bool:
+        ring = self._get_ring()
+        return ring is not None and ring.latest_seq > self._last_seq
+
+    def read(self) -> Optional[Frame]:
+        ring = self._get_ring()
+        if ring is None:
+            return None
+        # Copied out: detection outlives the slot, which the producer reuses after slot_count - 1 frames
+        frame = ring.read_latest(copy=True)
+        if frame is None:
+            if ring.latest_seq > self._last_seq:
+                self.torn_reads += 1
+                if self.torn_reads % 100 == 1:
+                    print(f"⚠️ Shared-memory frame overwritten while copying ({self.torn_reads} so far)")
+            return None
+        if frame.seq <= self._last_seq:
+            return None
+        self._last_seq = frame.seq
+        return frame
+
+    def mark_consumed(self, frame: Frame, age_ms: float) -> None:
+        if self.ring is not None:
+            self.ring.mark_consumed(frame.seq, age_ms)
+
+    def publish_processing_fps(self, frame: Frame, fps: float) -> None:
+        if self.ring is not None:
+            self.ring.publish_consumer_fps(fps)
+
+    def close(self) -> None:
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class LiveFrameSource(FrameSource):
+    """First child with a new frame wins (shared memory before the JPEG fallback)."""
+
+    name = "live"
+
+    def __init__(self, sources: List[FrameSource]):
+        self.sources = sources
+
+    def has_new(self) -> bool:
+        return any(source.has_new() for source in self.sources)
+
+    def read(self) -> Optional[Frame]:
+        for source in self.sources:
+            if source.has_new():
+                frame = source.read()
+                if frame is not None:
+                    return frame
+        return None
+
+    def _owner(self, frame: Frame) -> Optional[FrameSource]:
+        return next((source for source in self.sources if source.name == frame.source), None)
+
+    def mark_consumed(self, frame: Frame, age_ms: float) -> None:
+        owner = self._owner(frame)
+        if owner is not None:
+            owner.mark_consumed(frame, age_ms)
+
+    def publish_processing_fps(self, frame: Frame, fps: float) -> None:
+        owner = self._owner(frame)
+        if owner is not None:
+            owner.publish_processing_fps(frame, fps)
+
+    def close(self) -> None:
+        for source in self.sources:
+            source.close()
+
+
+class MailboxSource(FrameSource):
+    """Frames submitted in-process through a ``FrameMailbox``."""
+
+    name = "queue"
+
+    def __init__(self, mailbox: FrameMailbox):
+        self.mailbox = mailbox
+
+    def has_new(self) -> bool:
+        return self.mailbox.pending
+
+    def read(self) -> Optional[Frame]:
+        return self.mailbox.get(timeout=0)
+
+    def wait(self, timeout: float) -> bool:
+        return self.mailbox.wait(timeout)
+
+
+class ReplaySource(FrameSource):
+    """
+    Decode a recorded video file, or a directory of images (sorted by name), through PyAV.
+
+    Timestamps are ``start_time`` plus the recorded presentation time (or
+    ``index / fps`` for image directories), so window timing follows the
+    recording regardless of how fast frames are processed. With ``realtime=True``
+    ``read`` sleeps until each frame's due time, like a live camera.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, realtime: bool = False, loop: bool = False, fps: float = 30.0,
+                 pixel_format: str = "rgb24", max_size: Optional[Tuple[int, int]] = None,
+                 start_time: Optional[float] = None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.realtime = realtime
+        self.live = realtime
+        self.loop = loop
+        self.fps = fps
+        self.pixel_format = pixel_format
+        self.max_size = max_size
+        self.start_time = time.time() if start_time is None else start_time
+        self.frames_read = 0
+        self.duration = 0.0  # recorded seconds delivered so far (across loops)
+        self._offset = 0.0  # recorded time of previous loops
+        self._seq = 0
+        self._frames = self._decode()
+        self._next: Optional[Tuple[object, float]] = None
+
+    def _image_paths(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        return [os.path.join(self.path, n) for n in names]
+
+    def _decode(self) -> Iterator[Tuple[object, float]]:
+        """Yield ``(av.VideoFrame, seconds since the start of the recording)``."""
+        import av
+
+        if os.path.isdir(self.path):
+            for index, image_path in enumerate(self._image_paths()):
+                with av.open(image_path) as container:
+                    for frame in container.decode(video=0):
+                        yield frame, index / self.fps
+                        break
+            return
+        with av.open(self.path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            first = None
+            for index, frame in enumerate(container.decode(stream)):
+                t = frame.time if frame.time is not None else index / self.fps
+                first = t if first is None else first
+                yield frame, t - first
+
+    def _peek(self) -> Optional[Tuple[object, float]]:
+        if self._next is None and not self.exhausted:
+            self._next = next(self._frames, None)
+            if self._next is None and self.loop and self.frames_read:
+                self._offset = self.duration + 1.0 / self.fps
+                self._frames = self._decode()
+                self._next = next(self._frames, None)
+            if self._next is None:
+                self.exhausted = True
+        return self._next
+
+    def has_new(self) -> bool:
+        return self._peek() is not None
+
+    def wait(self, timeout: float) -> bool:
+        return self.has_new()
+
+    def read(self) -> Optional[Frame]:
+        item = self._peek()
+        if item is None:
+            return None
+        self._next = None
+        av_frame, rel = item
+        rel += self._offset
+        timestamp = self.start_time + rel
+        if self.realtime:
+            delay = timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        self._seq += 1
+        self.frames_read += 1
+        self.duration = rel
+        image = av_frame_to_ndarray(av_frame, self.pixel_format, self.max_size)
+        return Frame(image, self._seq, timestamp, self.name, self.pixel_format)
@@ -0,0 +1,505 @@
+"""Frame handoff between the WebRTC receiver (main.py) and the agent.
+
+Two transports are supported:
+
+* ``shm``  – a shared-memory ring buffer of raw frames. The producer copies each
+  decoded frame into the next slot together with a sequence number and capture
+  timestamp; the consumer maps the same segment and reads the newest slot as a
+  numpy view (no copy, no encode/decode).
+* ``jpeg`` – the original ``frames/latest_frame.jpg`` handoff (encode + atomic
+  rename on the producer, read + decode on the consumer). Kept as a fallback for
+  platforms without POSIX shared memory and for external tools.
+
+Select with ``FRAME_TRANSPORT=shm|jpeg`` (default ``shm``).
+
+Both the ring and the in-process :class:`FrameMailbox` are newest-frame-wins:
+the consumer always gets the latest frame, and the producer can ask
+``wants_frame()`` to skip converting frames while the consumer has not yet
+picked up the previous one.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "shm").lower()
+FRAME_SHM_NAME = os.getenv("FRAME_SHM_NAME", "ctphackathon_frames")
+FRAME_SHM_SLOTS = int(os.getenv("FRAME_SHM_SLOTS", "6"))
+FRAME_SHM_MAX_BYTES = int(os.getenv("FRAME_SHM_MAX_BYTES", str(1920 * 1080 * 3)))
+# A published-but-unconsumed frame is only replaced once it is older than this
+FRAME_MAX_PENDING_MS = float(os.getenv("FRAME_MAX_PENDING_MS", "50"))
+
+_MAGIC = 0x43545046  # "CTPF"
+_VERSION = 4
+
+# Channel order of the raw pixels in a slot
+PIXEL_FORMATS = ("bgr24", "rgb24")
+
+_HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u4"),
+    ("slot_count", "<u4"),
+    ("closed", "<u4"),
+    ("slot_capacity", "<u8"),
+    ("latest_seq", "<u8"),
+    ("consumer_fps", "<f8"),  # written by the agent: frames/sec it can sustain
+    ("consumer_seq", "<u8"),  # written by the agent: last frame taken for detection
+    ("frame_age_ms", "<f8"),  # written by the agent: capture -> detection age of that frame
+    ("reserved", "<u8", (1,)),
+])  # 64 bytes
+
+_SLOT_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("timestamp", "<f8"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("pixel_format", "<u4"),
+    ("reserved", "<u4", (2,)),
+])  # 40 bytes
+
+
+class Frame(NamedTuple):
+    """A decoded frame plus the metadata the consumer needs to reason about it."""
+    image: np.ndarray
+    seq: int  # monotonically increasing per source
+    timestamp: float  # capture time (epoch seconds)
+    source: str = "shm"
+    pixel_format: str = "bgr24"  # "rgb24" when the producer already converted for MediaPipe
+
+
+def parse_resolution(spec: str) -> Optional[Tuple[int, int]]:
+    """'640x360' -> (640, 360); 'native' (or empty) keeps the source resolution."""
+    spec = (spec or "").strip().lower()
+    if spec in ("", "native", "0", "off"):
+        return None
+    width, height = spec.split("x")
+    return int(width), int(height)
+
+
+def av_frame_to_ndarray(frame, pixel_format: str, max_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Convert a PyAV ``VideoFrame`` to a ``pixel_format`` array, scaled down to fit
+    ``max_size`` (aspect preserved, never upscaled) in the same libswscale pass.
+    """
+    width, height = frame.width, frame.height
+    if max_size is not None:
+        max_w, max_h = max_size
+        scale = min(max_w / width, max_h / height, 1.0)
+        # Even dimensions keep chroma-subsampled sources happy
+        width = max(2, int(round(width * scale / 2)) * 2)
+        height = max(2, int(round(height * scale / 2)) * 2)
+    if (width, height) != (frame.width, frame.height) or frame.format.name != pixel_format:
+        frame = frame.reformat(width=width, height=height, format=pixel_format)
+    return frame.to_ndarray()
+
+
+def _align(n: int, to: int = 64) -> int:
+    return (n + to - 1) // to * to
+
+
+def _open_existing(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without letting this process unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        return shm
+
+
+class SharedFrameRing:
+    """
+    Fixed-slot ring buffer of raw frames in POSIX shared memory.
+
+    Layout: one 64-byte header, ``slot_count`` slot headers, then ``slot_count``
+    data regions of ``slot_capacity`` bytes each. A slot's ``seq`` is zeroed
+    while it is being written and set last, so a reader can tell a complete slot
+    from one in flight. Views returned by :meth:`read_latest` stay valid only
+    until the producer laps the ring (``slot_count - 1`` further frames), so
+    anything that keeps a frame longer (detection) reads with ``copy=True``,
+    which also rejects a slot overwritten while it was being copied.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self._header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        slot_count = int(self._header["slot_count"])
+        self._slots = np.ndarray((slot_count,), dtype=_SLOT_DTYPE, buffer=shm.buf,
+                                 offset=_HEADER_DTYPE.itemsize)
+        self._data_offset = _align(_HEADER_DTYPE.itemsize + _SLOT_DTYPE.itemsize * slot_count)
+        self.slot_count = slot_count
+        self.slot_capacity = int(self._header["slot_capacity"])
+        self._data = np.ndarray((slot_count, self.slot_capacity), dtype=np.uint8, buffer=shm.buf,
+                                offset=self._data_offset)
+        self._seq = int(self._header["latest_seq"])
+
+    @classmethod
+    def create(cls, name: str = FRAME_SHM_NAME, slot_count: int = FRAME_SHM_SLOTS,
+               slot_capacity: int = FRAME_SHM_MAX_BYTES) -> "SharedFrameRing":
+        """Create (or replace a stale) segment. Called by the producer."""
+        slot_capacity = _align(slot_capacity)
+        size = _align(_HEADER_DTYPE.itemsize + _SLOT_DTYPE.itemsize * slot_count) + slot_count * slot_capacity
+        try:
+            stale = _open_existing(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        header["slot_count"] = slot_count
+        header["slot_capacity"] = slot_capacity
+        header["latest_seq"] = 0
+        header["consumer_fps"] = 0.0
+        header["consumer_seq"] = 0
+        header["frame_age_ms"] = 0.0
+        header["closed"] = 0
+        header["version"] = _VERSION
+        header["magic"] = _MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = FRAME_SHM_NAME) -> Optional["SharedFrameRing"]:
+        """Map an existing segment. Returns None if the producer has not created it."""
+        try:
+            shm = _open_existing(name)
+        except (FileNotFoundError, OSError):
+            return None
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=shm.buf, offset=0)
+        valid = int(header["magic"]) == _MAGIC and int(header["version"]) == _VERSION
+        del header
+        if not valid:
+            shm.close()
+            return None
+        return cls(shm, owner=False)
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header["closed"])
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self._header["latest_seq"])
+
+    @property
+    def consumer_fps(self) -> float:
+        return float(self._header["consumer_fps"])
+
+    def publish_consumer_fps(self, fps: float) -> None:
+        """Consumer side: advertise the processing rate so the producer can skip frames it won't use."""
+        self._header["consumer_fps"] = fps
+
+    @property
+    def consumer_seq(self) -> int:
+        return int(self._header["consumer_seq"])
+
+    @property
+    def frame_age_ms(self) -> float:
+        return float(self._header["frame_age_ms"])
+
+    def mark_consumed(self, seq: int, age_ms: float) -> None:
+        """Consumer side: record the frame taken for detection and how old it was."""
+        self._header["frame_age_ms"] = age_ms
+        self._header["consumer_seq"] = seq
+
+    def wants_frame(self, now: Optional[float] = None, max_pending_ms: float = FRAME_MAX_PENDING_MS) -> bool:
+        """
+        Producer side: False while the newest published frame is still waiting for
+        the consumer and is younger than ``max_pending_ms``, i.e. writing another
+        frame now would only be overwritten work.
+        """
+        seq = self._seq
+        if seq == 0 or int(self._header["consumer_seq"]) >= seq:
+            return True
+        now = time.time() if now is None else now
+        return (now - float(self._slots[seq % self.slot_count]["timestamp"])) * 1000.0 >= max_pending_ms
+
+    def write(self, image: np.ndarray, timestamp: Optional[float] = None, pixel_format: str = "bgr24") -> int:
+        """Copy one frame into the next slot. Returns its sequence number (0 if it does not fit)."""
+        if image.nbytes > self.slot_capacity:
+            return 0
+        image = np.ascontiguousarray(image)
+        seq = self._seq + 1
+        slot = self._slots[seq % self.slot_count]
+        slot["seq"] = 0
+        self._data[seq % self.slot_count, :image.nbytes] = image.reshape(-1).view(np.uint8)
+        height, width = image.shape[:2]
+        slot["height"] = height
+        slot["width"] = width
+        slot["channels"] = image.shape[2] if image.ndim == 3 else 1
+        slot["pixel_format"] = PIXEL_FORMATS.index(pixel_format)
+        slot["timestamp"] = time.time() if timestamp is None else timestamp
+        slot["seq"] = seq
+        self._header["latest_seq"] = seq
+        self._seq = seq
+        return seq
+
+    def read_latest(self, copy: bool = False) -> Optional[Frame]:
+        """
+        Newest complete frame, or None if nothing is published yet. A zero-copy
+        view of its slot by default; with ``copy`` a private copy, or None if the
+        producer overwrote the slot during the copy.
+        """
+        seq = int(self._header["latest_seq"])
+        if seq == 0:
+            return None
+        slot = self._slots[seq % self.slot_count]
+        if int(slot["seq"]) != seq:
+            return None
+        height, width, channels = int(slot["height"]), int(slot["width"]), int(slot["channels"])
+        timestamp = float(slot["timestamp"])
+        pixel_format = PIXEL_FORMATS[int(slot["pixel_format"])]
+        nbytes = height * width * channels
+        view = self._data[seq % self.slot_count, :nbytes]
+        image = view.reshape((height, width, channels)) if channels > 1 else view.reshape((height, width))
+        if copy:
+            image = image.copy()
+        if int(slot["seq"]) != seq:  # overwritten while we were reading metadata (or copying)
+            return None
+        return Frame(image, seq, timestamp, "shm", pixel_format)
+
+    def is_current(self, seq: int) -> bool:
+        """True while the slot holding ``seq`` has not been overwritten."""
+        return int(self._slots[seq % self.slot_count]["seq"]) == seq
+
+    def close(self) -> None:
+        if self._owner:
+            try:
+                self._header["closed"] = 1
+            except Exception:
+                pass
+        # Drop numpy views before closing the mapping
+        self._header = self._slots = self._data = None  # type: ignore[assignment]
+        try:
+            self._shm.close()
+        except BufferError:
+            # A consumer still holds a view into the segment; the mapping is released on exit
+            pass
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FrameMailbox:
+    """
+    Single-slot, thread-safe, newest-frame-wins handoff for the in-process agent.
+
+    ``put`` replaces any frame the consumer has not taken yet; ``get`` blocks for
+    the next frame. ``wants_frame`` mirrors :meth:`SharedFrameRing.wants_frame`.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame: Optional[Frame] = None
+        self.replaced = 0  # frames overwritten before the consumer took them
+
+    def put(self, frame: Frame) -> None:
+        with self._cond:
+            if self._frame is not None:
+                self.replaced += 1
+            self._frame = frame
+            self._cond.notify()
+
+    @property
+    def pending(self) -> bool:
+        return self._frame is not None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until a frame is pending (without taking it)."""
+        with self._cond:
+            if self._frame is None:
+                self._cond.wait(timeout)
+            return self._frame is not None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        with self._cond:
+            if self._frame is None:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def wants_frame(self, now: Optional[float] = None, max_pending_ms: float = FRAME_MAX_PENDING_MS) -> bool:
+        pending = self._frame
+        if pending is None:
+            return True
+        now = time.time() if now is None else now
+        return (now - pending.timestamp) * 1000.0 >= max_pending_ms
+
+
+class FrameAgeStats:
+    """Rolling capture -> detection age of processed frames (milliseconds)."""
+
+    def __init__(self, window: int = 300):
+        self._ages: "deque[float]" = deque(maxlen=window)
+        self.last_ms = 0.0
+
+    def record(self, age_ms: float) -> None:
+        self.last_ms = age_ms
+        self._ages.append(age_ms)
+
+    def percentiles(self) -> dict:
+        if not self._ages:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        ages = np.fromiter(self._ages, dtype=np.float64, count=len(self._ages))
+        p50, p95 = np.percentile(ages, [50, 95])
+        return {"p50": float(p50), "p95": float(p95), "max": float(ages.max())}
+
+
+class ProcessingRate:
+    """EMA of the consumer's busy time per frame; ``fps`` is the rate it could sustain."""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.mean_seconds: Optional[float] = None
+
+    def update(self, seconds: float) -> None:
+        if self.mean_seconds is None:
+            self.mean_seconds = seconds
+        else:
+            self.mean_seconds += self.alpha * (seconds - self.mean_seconds)
+
+    @property
+    def fps(self) -> float:
+        return 1.0 / self.mean_seconds if self.mean_seconds else 0.0
+
+
+class DecodeScheduler:
+    """
+    Producer-side decision, per received frame, whether to convert it at all.
+
+    The target rate is either static (``target_fps > 0``) or taken from the
+    consumer through ``rate_source`` (scaled by ``headroom`` so the consumer is
+    never starved). Frames between due times are counted as dropped and should
+    be discarded without ``to_ndarray``/``reformat``. A due frame only counts as
+    decoded once the caller converts it (:meth:`note_decoded`), since it may
+    still be held back for the consumer.
+    """
+
+    def __init__(self, target_fps: float = 0.0, rate_source: Optional[Callable[[], float]] = None,
+                 headroom: float = 1.25):
+        self.static_fps = target_fps
+        self.rate_source = rate_source
+        self.headroom = headroom
+        self.decoded = 0
+        self.dropped = 0
+        self._next_due: Optional[float] = None
+
+    def target_fps(self) -> float:
+        if self.static_fps > 0:
+            return self.static_fps
+        if self.rate_source is not None:
+            try:
+                return self.rate_source() * self.headroom
+            except Exception:
+                return 0.0
+        return 0.0
+
+    def should_decode(self, timestamp: float) -> bool:
+        """True if the frame is due; dropped frames are counted here."""
+        fps = self.target_fps()
+        if fps <= 0:
+            return True
+        interval = 1.0 / fps
+        if self._next_due is None or timestamp >= self._next_due:
+            # Advance on a fixed grid so the average rate matches the target; resync after gaps
+            if self._next_due is None or timestamp - self._next_due > interval:
+                self._next_due = timestamp
+            self._next_due += interval
+            return True
+        self.dropped += 1
+        return False
+
+    def note_decoded(self) -> None:
+        """Count a due frame that was actually converted."""
+        self.decoded += 1
+
+
+def write_jpeg_frame(path: str, image: np.ndarray) -> bool:
+    """Encode to a temp file and atomically rename over ``path`` to avoid partial reads."""
+    root, ext = os.path.splitext(path)
+    temp_path = f"{root}.tmp{ext}"  # keep the extension so OpenCV picks the JPEG encoder
+    if not cv2.imwrite(temp_path, image):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    os.rename(temp_path, path)
+    return True
+
+
+def read_jpeg_frame(path: str) -> Optional[np.ndarray]:
+    """Read and decode ``path`` once; None if missing, too small or truncated."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return _decode_jpeg(data)
+
+
+def _decode_jpeg(data: bytes) -> Optional[np.ndarray]:
+    # At least 1KB and a JPEG end marker (FFD9), otherwise the write is incomplete
+    if len(data) <= 1024 or data[-2:] != b"\xff\xd9":
+        return None
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None or frame.size == 0:
+        return None
+    return frame
+
+
+class JpegFrameReader:
+    """
+    Sequence numbers for the ``latest_frame.jpg`` fallback. Every atomic rename
+    installs a new file (new inode / mtime), so a changed signature means a new
+    frame; the file mtime serves as its capture timestamp.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seq = 0
+        self._last_signature = None
+
+    @staticmethod
+    def _signature(st: os.stat_result):
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def has_new(self) -> bool:
+        """Cheap stat-only check whether a frame newer than the last read one exists."""
+        try:
+            return self._signature(os.stat(self.path)) != self._last_signature
+        except OSError:
+            return False
+
+    def read(self) -> Optional[Frame]:
+        try:
+            with open(self.path, "rb") as f:
+                # fstat the handle we read from, not the path, so content and signature match
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        image = _decode_jpeg(data)
+        if image is None:
+            return None
+        signature = self._signature(st)
+        if signature != self._last_signature:
+            self.seq += 1
+            self._last_signature = signature
+        return Frame(image, self.seq, st.st_mtime, "jpeg")
@@ -0,0 +1,153 @@
+"""Vectorised facial, eye and posture measurements over landmark arrays.
+
+Every kernel takes landmark arrays with any leading batch shape: one frame is
+``(N, 3)``, a batch is ``(F, N, 3)``. Each measurement comes back as a float64
+array of that leading shape (a 0-d array for a single frame), so offline
+re-featurization can measure many frames per call.
+
+The input is widened to float64 before any arithmetic, as the per-landmark
+Python code did. Sums of at most 40 float32 coordinates are exact in float64,
+so reduction order does not matter and the results are the same floats the
+tuple code produced.
+
+Inputs come from ``landmark_arrays``:
+
+- ``subset``: ``face_subset(mesh)``, the region landmarks stacked in ``FACE_REGIONS`` order.
+- ``mesh``: the full FaceMesh, used for EAR eye openness.
+- ``pose``: ``POSE_INDEX`` rows (nose, left shoulder, right shoulder), x and y at least.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from landmark_arrays import EAR_INDEX, FACE_REGION_SLICES
+
+FACIAL_KEYS = ("jaw_width", "jaw_height", "mouth_area", "eyebrow_height", "eyebrow_distance",
+               "lip_thickness", "mouth_curvature")
+EYE_KEYS = ("left_eye_openness", "right_eye_openness")
+POSTURE_KEYS = ("shoulder_height_avg", "shoulder_asymmetry", "head_shoulder_distance",
+                "left_shoulder_height", "right_shoulder_height")
+
+
+def _region(subset: np.ndarray, name: str) -> np.ndarray:
+    return subset[..., FACE_REGION_SLICES[name], :]
+
+
+def _pick(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """``values[..., index]`` per batch element."""
+    if values.ndim == 1:
+        return values[index]
+    return np.take_along_axis(values, index[..., None], axis=-1)[..., 0]
+
+
+# Both eyebrows as one (2, k) gather into the face subset, so they are measured together
+_BROW_INDEX = np.array([
+    np.arange(FACE_REGION_SLICES[name].start, FACE_REGION_SLICES[name].stop)
+    for name in ("left_eyebrow", "right_eyebrow")
+])
+
+
+def facial_measurements(subset: np.ndarray) -> Dict[str, np.ndarray]:
+    """Jaw, mouth, eyebrow and lip measurements from a face subset (..., N, 3)."""
+    subset = np.asarray(subset, dtype=np.float64)
+    lips = _region(subset, "lips")[..., :2]
+    lx, ly = lips[..., 0], lips[..., 1]
+    k = ly.shape[-1]
+
+    # x and y ranges of the lips in one reduction each
+    jaw = lips.max(axis=-2) - lips.min(axis=-2)
+    jaw_width, jaw_height = jaw[..., 0], jaw[..., 1]
+
+    # Upper lip is everything above the mean lip y; empty halves measure 0
+    total_y = ly.sum(axis=-1)
+    center_y = total_y / k
+    upper = ly < center_y[..., None]
+    n_upper = np.count_nonzero(upper, axis=-1)
+    upper_y = (ly * upper).sum(axis=-1)
+    thickness = (total_y - upper_y) / np.maximum(k - n_upper, 1) - upper_y / np.maximum(n_upper, 1)
+    lip_thickness = np.where((n_upper > 0) & (n_upper < k), thickness, 0.0)
+
+    # Corners are the first leftmost and rightmost lip points
+    corner_y = (_pick(ly, lx.argmin(axis=-1)) + _pick(ly, lx.argmax(axis=-1))) / 2
+    mouth_curvature = center_y - corner_y
+
+    brows = subset[..., _BROW_INDEX, :2]  # (..., 2, k, 2)
+    brow_y = brows[..., 1].sum(axis=-1) / brows.shape[-2]
+    # Inner ends are the points closest to the image's vertical center line
+    brow_x = brows[..., 0]
+    inner_x = _pick(brow_x, np.abs(brow_x - 0.5).argmin(axis=-1))
+
+    zeros = np.zeros(subset.shape[:-2])
+    return {
+        "jaw_width": jaw_width if k >= 4 else zeros,
+        "jaw_height": jaw_height if k >= 4 else zeros,
+        "mouth_area": jaw_width * jaw_height if k >= 4 else zeros,
+        "eyebrow_height": (brow_y[..., 0] + brow_y[..., 1]) / 2 if brows.shape[-2] >= 3 else zeros,
+        "eyebrow_distance": np.abs(inner_x[..., 1] - inner_x[..., 0]) if brows.shape[-2] >= 3 else zeros,
+        "lip_thickness": lip_thickness if k >= 8 else zeros,
+        "mouth_curvature": mouth_curvature if k >= 6 else zeros,
+    }
+
+
+def eye_aspect_ratio(mesh: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """EAR-like openness (mean vertical gap / corner distance) for the left and right eye of a mesh (..., 478, 3)."""
+    points = np.asarray(mesh)[..., EAR_INDEX, :2].astype(np.float64)  # (..., eye, point, xy)
+    corners = points[..., 1, :] - points[..., 0, :]
+    width = np.sqrt((corners * corners).sum(axis=-1))
+    gaps = np.abs(points[..., 3::2, 1] - points[..., 2::2, 1])  # (top, bottom) pairs
+    ratio = np.maximum(0.0, 0.5 * gaps.sum(axis=-1) / (width + 1e-6))
+    return ratio[..., 0], ratio[..., 1]
+
+
+def region_openness(eye: np.ndarray) -> np.ndarray:
+    """Openness of one eye region (..., k, 3): mean of the 3 lowest minus the 3 highest points' y."""
+    eye = np.asarray(eye, dtype=np.float64)
+    if eye.shape[-2] < 6:
+        return np.ones(eye.shape[:-2])
+    ys = np.sort(eye[..., 1], axis=-1)
+    return np.maximum(0.0, ys[..., :-4:-1].mean(axis=-1) - ys[..., :3].mean(axis=-1))
+
+
+def eye_measurements(subset: np.ndarray, mesh: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Left/right eye openness: EAR from the mesh when there is one, else the eye regions' vertical spread."""
+    if mesh is not None and np.shape(mesh)[-2] > EAR_INDEX.max():
+        left, right = eye_aspect_ratio(mesh)
+    else:
+        left = region_openness(_region(np.asarray(subset), "left_eye"))
+        right = region_openness(_region(np.asarray(subset), "right_eye"))
+    return {"left_eye_openness": left, "right_eye_openness": right}
+
+
+def posture_measurements(pose: np.ndarray) -> Dict[str, np.ndarray]:
+    """Shoulder height, asymmetry and head distance from nose/shoulder rows (..., 3, >=2)."""
+    y = np.asarray(pose, dtype=np.float64)[..., 1]
+    nose_y, left_y, right_y = y[..., 0], y[..., 1], y[..., 2]
+    avg = (left_y + right_y) / 2
+    return {
+        "shoulder_height_avg": avg,
+        "shoulder_asymmetry": np.abs(left_y - right_y),
+        "head_shoulder_distance": np.abs(nose_y - avg),
+        "left_shoulder_height": left_y,
+        "right_shoulder_height": right_y,
+    }
+
+
+def measure(subset: Optional[np.ndarray] = None, mesh: Optional[np.ndarray] = None,
+            pose: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """All facial, eye and posture measurements in one pass; groups without input are left out."""
+    out: Dict[str, np.ndarray] = {}
+    if subset is not None:
+        subset = np.asarray(subset, dtype=np.float64)
+        out.update(facial_measurements(subset))
+        out.update(eye_measurements(subset, mesh))
+    if pose is not None:
+        out.update(posture_measurements(pose))
+    return out
+
+
+def measure_frame(subset: Optional[np.ndarray] = None, mesh: Optional[np.ndarray] = None,
+                  pose: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """``measure`` for a single frame, as plain floats."""
+    return {key: float(value) for key, value in measure(subset, mesh, pose).items()}
@@ -0,0 +1,112 @@
+"""Landmark arrays and precomputed index tables for the detection hot path.
+
+Each MediaPipe landmark list becomes one float32 array per frame (N x 3, or
+N x 4 with visibility for pose). Region subsets are index tables built once at
+import, so per-frame extraction is a few numpy operations instead of thousands
+of protobuf attribute reads.
+
+``landmark_array`` reads the serialized protobuf directly when every landmark
+has the same fields: a landmark record is ``0x0a <len>`` followed by one
+``<tag> <float32>`` pair per field, so the floats sit at a fixed stride.
+Anything else (missing fields, other list types) goes through the attribute
+fallback.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# FaceMesh (468/478 topology) regions, in the order they are stacked into the face subset.
+# Left eye (subject's left, image right): corners 33 (outer), 133 (inner), top ~159, bottom ~145;
+# right eye: corners 362 (inner), 263 (outer), top ~386, bottom ~374
+FACE_REGIONS: Dict[str, np.ndarray] = {
+    name: np.array(indices, dtype=np.intp) for name, indices in (
+        ("left_eye", [33, 133, 159, 145, 160, 158, 144, 153, 163, 7, 246]),
+        ("right_eye", [362, 263, 386, 374, 385, 387, 380, 373, 390, 466]),
+        ("left_eyebrow", [276, 282, 283, 285, 293, 295, 296, 300, 334, 336]),
+        ("right_eyebrow", [46, 52, 53, 55, 63, 65, 66, 70, 105, 107]),
+        ("nose", [1, 2, 6, 168, 3, 51, 48, 115, 131, 134, 102, 49, 220, 305, 281, 275]),
+        ("lips", [0, 13, 14, 17, 37, 39, 40, 61, 78, 80, 81, 82, 84, 87, 88, 91, 95, 146, 178, 181, 185, 191,
+                  267, 269, 270, 291, 308, 310, 311, 312, 314, 317, 318, 321, 324, 375, 402, 405, 409, 415]),
+        ("face_oval", [10, 21, 54, 58, 67, 93, 103, 109, 127, 132, 136, 148, 149, 150, 152, 162, 172, 176,
+                       234, 251, 284, 288, 297, 323, 332, 338, 356, 361, 365, 377, 378, 379, 389, 397, 400, 454]),
+    )
+}
+# One gather pulls every region; each region is then a contiguous slice (a view) of the result
+FACE_SUBSET_INDEX = np.concatenate(list(FACE_REGIONS.values()))
+FACE_REGION_SLICES: Dict[str, slice] = {}
+_start = 0
+for _name, _indices in FACE_REGIONS.items():
+    FACE_REGION_SLICES[_name] = slice(_start, _start + len(_indices))
+    _start += len(_indices)
+FACE_REGION_COUNTS = {name: len(indices) for name, indices in FACE_REGIONS.items()}
+
+# EAR points per eye: corner, corner, then two (top, bottom) vertical pairs
+EAR_INDEX = np.array([
+    [33, 133, 159, 145, 160, 144],    # left
+    [362, 263, 386, 374, 385, 380],   # right
+], dtype=np.intp)
+
+# Pose (BlazePose topology): nose, left shoulder, right shoulder
+POSE_NAMES = ("nose", "left_shoulder", "right_shoulder")
+POSE_INDEX = np.array([0, 11, 12], dtype=np.intp)
+
+_FIELD_TAGS = np.array([0x0D, 0x15, 0x1D, 0x25, 0x2D], dtype=np.uint8)  # x, y, z, visibility, presence
+
+
+def _from_serialized(landmark_list: Any, fields: Optional[int]) -> Optional[np.ndarray]:
+    """
+    Fixed-stride read of a serialized NormalizedLandmarkList, or None if the layout isn't uniform.
+    ``fields=None`` takes every field present, up to visibility.
+    """
+    serialize = getattr(landmark_list, "SerializeToString", None)
+    if serialize is None:
+        return None
+    buf = serialize()
+    n = len(landmark_list.landmark)
+    if n == 0 or len(buf) % n:
+        return None
+    record = len(buf) // n
+    present = (record - 2) // 5
+    if fields is None:
+        fields = min(present, 4)
+    if record != 2 + 5 * present or not 3 <= fields <= present <= len(_FIELD_TAGS):
+        return None
+    raw = np.frombuffer(buf, dtype=np.uint8).reshape(n, record)
+    if ((raw[:, 0] != 0x0A).any() or (raw[:, 1] != record - 2).any()
+            or (raw[:, 2::5] != _FIELD_TAGS[:present]).any()):
+        return None
+    floats = np.ndarray((n, fields), dtype="<f4", buffer=buf, offset=3, strides=(record, 5))
+    return floats.astype(np.float32)
+
+
+def landmark_array(landmark_list: Any, fields: int = 3) -> np.ndarray:
+    """(N, fields) float32 array of x, y, z[, visibility] for a landmark list."""
+    points = getattr(landmark_list, "points", None)  # extrapolated landmarks already carry an array
+    if points is not None:
+        return points[:, :fields].astype(np.float32)
+    array = _from_serialized(landmark_list, fields)
+    if array is not None:
+        return array
+    names = ("x", "y", "z", "visibility")[:fields]
+    return np.array([[getattr(lm, name) for name in names] for lm in landmark_list.landmark], dtype=np.float32)
+
+
+def landmark_points(landmark_list: Any) -> np.ndarray:
+    """x, y, z plus visibility when every landmark carries it (pose), else x, y, z (face mesh)."""
+    points = getattr(landmark_list, "points", None)
+    if points is not None:
+        return points
+    array = _from_serialized(landmark_list, None)
+    return array if array is not None else landmark_array(landmark_list, 3)
+
+
+def face_subset(mesh: np.ndarray) -> np.ndarray:
+    """The region landmarks of a face mesh (..., 478, 3), stacked in ``FACE_REGIONS`` order."""
+    return mesh[..., FACE_SUBSET_INDEX, :]
+
+
+def face_regions(subset: np.ndarray) -> Dict[str, np.ndarray]:
+    """Views of each region in a ``face_subset`` array."""
+    return {name: subset[..., region, :] for name, region in FACE_REGION_SLICES.items()}
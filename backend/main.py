@@ -6,19 +6,37 @@ import sys
 import threading
 import time
 import subprocess
-from typing import Any, Dict, Optional, Set
+import uuid
+import queue
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from asyncio import AbstractEventLoop
 
-import cv2
 import av
+import cv2
 import websockets
 from websockets.server import WebSocketServerProtocol
 
 from dotenv import load_dotenv
 from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
-from joblib import load
 import numpy as np
-import re
+
+from agent_ipc import AGENT_IPC, read_messages
+from agent_pool import AgentWorkerPool
+from feature_vector import FeatureVectorizer
+from forest_runtime import FlatForest
+from frame_transport import (
+    FRAME_SHM_NAME,
+    FRAME_TRANSPORT,
+    DecodeScheduler,
+    Frame,
+    FrameAgeStats,
+    SharedFrameRing,
+    av_frame_to_ndarray,
+    parse_resolution,
+    read_jpeg_frame,
+    write_jpeg_frame,
+)
 
 av.logging.set_level(av.logging.ERROR)
 
@@ -27,13 +45,45 @@ load_dotenv()
 
 WS_PORT = int(os.getenv("WS_PORT", "8765"))
 
-# Load the stress model once
+# "forest": score with the flat-array runtime (forest_runtime.py); "sklearn": the joblib model as trained
+STRESS_MODEL_RUNTIME = os.getenv("STRESS_MODEL_RUNTIME", "forest").lower()
+# "background": serve WebSocket clients while the model loads (windows queue until it is ready); "eager": load first
+STRESS_MODEL_LOAD = os.getenv("STRESS_MODEL_LOAD", "background").lower()
+
+
+def load_forest_runtime(model_path: str) -> Optional[FlatForest]:
+    """The exported flat forest next to ``model_path`` if it was compiled from that exact file."""
+    forest_path = model_path.replace('.joblib', '_forest.npz')
+    if not os.path.exists(forest_path):
+        return None
+    try:
+        forest = FlatForest.load(forest_path)  # memory-mapped: processes on one host share the pages
+    except Exception as e:
+        print(f"⚠️ Could not load {os.path.basename(forest_path)} ({e}); "
+              "re-export with train_stress_model.py --export-forest")
+        return None
+    if not forest.matches(model_path):
+        print(f"⚠️ {os.path.basename(forest_path)} is stale for {os.path.basename(model_path)}; "
+              "re-export with train_stress_model.py --export-forest")
+        return None
+    return forest
+
+
+# Load the stress model once (off the import path: main() hands this to PREDICTIONS.load_in_background)
 def load_stress_model():
     try:
         model_path = os.path.join(os.path.dirname(__file__), 'models', 'stress_rf.joblib')
         meta_path = os.path.join(os.path.dirname(__file__), 'models', 'model_metadata.json')
         # Load model and metadata
-        model = load(model_path)
+        model = load_forest_runtime(model_path) if STRESS_MODEL_RUNTIME == "forest" else None
+        if model is None:
+            from joblib import load  # unpickling imports scikit-learn; the flat forest path never does
+            model = load(model_path)
+            if STRESS_MODEL_RUNTIME == "forest":
+                try:
+                    model = FlatForest.from_model(model)
+                except (ValueError, AttributeError) as e:
+                    print(f"⚠️ Flat forest runtime unavailable, scoring with {type(model).__name__}: {e}")
         with open(meta_path, 'r') as f:
             metadata = json.load(f)
         # Extract features from metadata
@@ -44,52 +94,341 @@ def load_stress_model():
         print(f"❌ Error loading stress model: {e}")
         return None, None, None
 
-STRESS_MODEL, FEATURE_LIST, FEATURE_MEDIANS = load_stress_model()
+PREDICTION_QUEUE_SIZE = int(os.getenv("PREDICTION_QUEUE_SIZE", "256"))
+PREDICTION_DEDUP_WINDOWS = 64  # recent window ids remembered per session
+# Micro-batching: one predict_proba call scores up to BATCH_MAX queued windows, waiting at most
+# BATCH_WAIT_MS after the first for more to arrive (0 = only take what is already queued)
+PREDICTION_BATCH_MAX = max(1, int(os.getenv("PREDICTION_BATCH_MAX", "32")))
+PREDICTION_BATCH_WAIT_MS = float(os.getenv("PREDICTION_BATCH_WAIT_MS", "5"))
+
+_Pending = Tuple[Dict[str, Any], Optional["Session"], float]  # window, session, submit time
+
+
+class BatchSizeHistogram:
+    """Counts of scored batch sizes in power-of-two buckets (``"4"`` holds sizes 3-4)."""
+
+    def __init__(self, max_size: int):
+        self.bounds = [1]
+        while self.bounds[-1] < max_size:
+            self.bounds.append(self.bounds[-1] * 2)
+        self.counts = [0] * len(self.bounds)
+
+    def record(self, size: int) -> None:
+        for i, bound in enumerate(self.bounds):
+            if size <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+
+
+class PredictionService:
+    """
+    Scores aggregated windows on its own thread and sends each prediction to its session (or broadcasts).
+
+    Every agent mode hands windows to ``submit``: the agent reader threads, pool callbacks and in-process
+    agents never run the model themselves. A window id already seen for the same session is dropped.
+    Queued windows are scored in micro-batches (``batch_max`` windows or ``batch_wait_ms`` after the first),
+    one model call per batch. ``metrics()`` reports queue depth, batch sizes, time spent queued, model time
+    per batch and each prediction's latency (submit -> sent).
+
+    Without a model at construction, windows queue until ``set_model`` (or ``load_in_background``) provides one.
+    """
+
+    def __init__(self, model: Any, features: Optional[list], medians: Optional[Dict[str, float]],
+                 queue_size: int = PREDICTION_QUEUE_SIZE, batch_max: int = PREDICTION_BATCH_MAX,
+                 batch_wait_ms: float = PREDICTION_BATCH_WAIT_MS):
+        self.model = None
+        self.vectorizer: Optional[FeatureVectorizer] = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self.load_ms: Optional[float] = None
+        if model is not None:
+            self.set_model(model, features, medians)
+        self.batch_max = max(1, batch_max)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue(queue_size)
+        self._seen: Dict[Optional[str], "deque[Any]"] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.latency = FrameAgeStats()
+        self.model_ms = FrameAgeStats()
+        self.queue_ms = FrameAgeStats()  # submit -> picked up by the scoring thread
+        self.queue_depth = FrameAgeStats()  # windows still queued when each batch is scored
+        self.batch_sizes = BatchSizeHistogram(self.batch_max)
+        self.counts = {"submitted": 0, "predicted": 0, "duplicates": 0, "dropped": 0, "errors": 0, "batches": 0}
+
+    def set_model(self, model: Any, features: Optional[list], medians: Optional[Dict[str, float]]) -> None:
+        """Install the model and release queued windows (a None model drops them, as before)."""
+        # Compiled once: window -> float32 row in the model's feature order, medians for missing values
+        self.vectorizer = FeatureVectorizer(features, medians) if features and medians else None
+        self.model = model
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def load_in_background(self, loader: Callable[[], Tuple[Any, Optional[list], Optional[Dict[str, float]]]]
+                           ) -> threading.Thread:
+        """Run ``loader`` (-> model, features, medians) on a daemon thread, then ``set_model``."""
+        def run() -> None:
+            start = time.perf_counter()
+            try:
+                model, features, medians = loader()
+            except Exception as e:
+                print(f"❌ Error loading stress model: {e}")
+                model, features, medians = None, None, None
+            self.load_ms = (time.perf_counter() - start) * 1000.0
+            self.set_model(model, features, medians)
+            if model is not None:
+                print(f"✅ Stress model ready ({type(model).__name__}) in {self.load_ms:.0f} ms")
+
+        thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="predictions", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopping.set()
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                pass  # the thread is a daemon; a full backlog is abandoned at shutdown
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def submit(self, window: Dict[str, Any], session: Optional["Session"] = None) -> bool:
+        """Queue a window for scoring; False if it is a duplicate or the queue is full."""
+        key = session.id if session is not None else None
+        window_id = window.get("window_id")
+        with self._lock:
+            self.counts["submitted"] += 1
+            if window_id is not None:
+                seen = self._seen.setdefault(key, deque(maxlen=PREDICTION_DEDUP_WINDOWS))
+                if window_id in seen:
+                    self.counts["duplicates"] += 1
+                    return False
+                seen.append(window_id)
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((window, session, time.perf_counter()))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.counts["dropped"] += 1
+            print(f"⚠️ Prediction queue full, dropped window {window_id}")
+            return False
+
+    def forget(self, session_id: str) -> None:
+        """Drop a session's dedup history: it closed, or its agent (re)started and numbers windows from 0 again."""
+        with self._lock:
+            self._seen.pop(session_id, None)
+
+    def _next_batch(self) -> Tuple[List[_Pending], bool]:
+        """Block for one window, then gather more until the batch is full or the wait runs out; (batch, stop)."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            while not self._ready.wait(timeout=0.1):  # model still loading: windows wait in the queue
+                if self._stopping.is_set():
+                    return
+            batch, stop = self._next_batch()
+            # Ended sessions get no predictions (and must not be broadcast)
+            batch = [item for item in batch if item[1] is None or not item[1].closed]
+            if not batch:
+                continue
+            try:
+                self.predict_batch(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    with self._lock:
+                        self.counts["errors"] += 1
+                    print(f"❌ Prediction error: {e}")
+                    continue
+                # Score the windows one by one so a single bad window doesn't cost the whole batch
+                for item in batch:
+                    try:
+                        self.predict_batch([item])
+                    except Exception as item_error:
+                        with self._lock:
+                            self.counts["errors"] += 1
+                        print(f"❌ Prediction error: {item_error}")
+
+    def vectorize(self, window: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Training feature order, with missing values filled from the training medians."""
+        return self.vectorizer.transform(window) if self.vectorizer is not None else None
+
+    def score_many(self, X: np.ndarray) -> np.ndarray:
+        """P(stressed) per row, with fallbacks for models without predict_proba."""
+        if hasattr(self.model, "predict_proba"):
+            probs = np.asarray(self.model.predict_proba(X))
+            return probs[:, 1] if probs.shape[1] > 1 else probs[:, 0]
+        if hasattr(self.model, "decision_function"):
+            # Map decision score to [0,1]
+            return 1.0 / (1.0 + np.exp(-np.asarray(self.model.decision_function(X), dtype=np.float64)))
+        return np.asarray(self.model.predict(X)).astype(int).astype(np.float64)
+
+    def score(self, x: np.ndarray) -> float:
+        """P(stressed) for a single row."""
+        return float(self.score_many(x)[0])
+
+    @staticmethod
+    def auxiliary_metrics(window: Dict[str, Any]) -> Dict[str, float]:
+        """Breathing rate, blink rate and posture stress, when the window has them."""
+        metrics: Dict[str, float] = {}
+        ba = window.get("breathing_analysis", {}) or {}
+        ea = window.get("eye_analysis", {}) or {}
+        pa = window.get("posture_analysis", {}) or {}
+        br = ba.get("mean_bpm")
+        if isinstance(br, (int, float)):
+            metrics["breathing_rate"] = float(br)
+        bl = ea.get("blink_frequency")
+        if isinstance(bl, (int, float)):
+            metrics["blink_rate"] = float(bl)
+        ps = pa.get("posture_stability")
+        if isinstance(ps, (int, float)):
+            # Map stability [0..1+] to stress [0..100]
+            metrics["posture_stress"] = float(max(0.0, min(100.0, (1.0 - float(ps)) * 100.0)))
+        return metrics
+
+    def predict_batch(self, batch: List[_Pending]) -> List[Dict[str, Any]]:
+        """Score queued windows in one model call and send each prediction to its session."""
+        if self.model is None or self.vectorizer is None or not batch:
+            return []
+        start = time.perf_counter()
+        for _, _, submitted in batch:
+            self.queue_ms.record((start - submitted) * 1000.0)
+        self.queue_depth.record(self._queue.qsize())
+        X = self.vectorizer.transform_many(window for window, _, _ in batch)
+        p_stressed = self.score_many(X)
+        self.model_ms.record((time.perf_counter() - start) * 1000.0)
+        with self._lock:
+            self.counts["batches"] += 1
+            self.batch_sizes.record(len(batch))
+        return [self._send(window, session, float(p), submitted)
+                for (window, session, submitted), p in zip(batch, p_stressed)]
+
+    def predict(self, window: Dict[str, Any], session: Optional["Session"] = None,
+                submitted: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Score one window now and send the prediction; returns the message (None without a model)."""
+        sent = self.predict_batch([(window, session, submitted if submitted is not None else time.perf_counter())])
+        return sent[0] if sent else None
+
+    def _send(self, window: Dict[str, Any], session: Optional["Session"], p_stressed: float,
+              submitted: float) -> Dict[str, Any]:
+        label = "stressed" if p_stressed >= 0.5 else "calm"
+        confidence = p_stressed if label == "stressed" else (1.0 - p_stressed)
+        # Send prediction via websocket (top-level type + fields)
+        msg = {
+            "type": "prediction",
+            "label": label,
+            "confidence": float(confidence),
+            "client_id": session.client_id if session is not None else None,
+            "session_id": session.id if session is not None else None,
+            "timestamp": window.get("timestamp_start"),
+            "window_id": window.get("window_id"),
+            **self.auxiliary_metrics(window),
+        }
+        if session is not None:
+            session.send(msg)
+        else:
+            ws_broadcast_raw(msg)
+        self.latency.record((time.perf_counter() - submitted) * 1000.0)
+        with self._lock:
+            self.counts["predicted"] += 1
+        return msg
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+            batch_sizes = self.batch_sizes.snapshot()
+        return {**counts, "model_ready": self.ready, "model_load_ms": self.load_ms,
+                "queued": self._queue.qsize(), "queue_depth": self.queue_depth.percentiles(),
+                "batch_max": self.batch_max, "batch_wait_ms": self.batch_wait * 1000.0, "batch_sizes": batch_sizes,
+                "queue_ms": self.queue_ms.percentiles(), "latency_ms": self.latency.percentiles(),
+                "model_ms": self.model_ms.percentiles()}
+
+
+PREDICTIONS = PredictionService(None, None, None)  # model installed by main() via load_in_background
+
+
+def predict_window(window_data: Dict[str, Any], session: Optional["Session"] = None) -> None:
+    """Hand one aggregated window to the prediction service (scored off the caller's thread)."""
+    PREDICTIONS.submit(window_data, session)
 
-def preprocess_window(window_data):
-    if not FEATURE_LIST or not FEATURE_MEDIANS:
-        return None
-    
-    # Flatten the window data similar to ingest_label_windows
-    def flatten_dict(d, prefix=''):
-        flat = {}
-        for k, v in d.items():
-            if isinstance(v, dict):
-                flat.update(flatten_dict(v, prefix=f"{prefix}{k}."))
-            else:
-                flat[f"{prefix}{k}"] = v
-        return flat
-    
-    flat_data = flatten_dict(window_data)
-    
-    # Select and preprocess features
-    features_subset = []
-    for feat in FEATURE_LIST:
-        value = flat_data.get(feat, np.nan)
-        if value is None:
-            value = np.nan
-        features_subset.append(value)
-    
-    # Replace NaNs with stored medians from training
-    for i, feat in enumerate(FEATURE_LIST):
-        if np.isnan(features_subset[i]):
-            features_subset[i] = FEATURE_MEDIANS.get(feat, 0)
-    
-    return np.array(features_subset).reshape(1, -1)
 
 AGENT_CMD = os.getenv("AGENT_CMD")
+# "subprocess" runs agent.py as a child process per session; "inprocess" runs the pipeline on a worker
+# thread here; "pool" shares a fixed set of warm worker processes (AGENT_POOL_SIZE) between sessions
+AGENT_MODE = os.getenv("AGENT_MODE", "subprocess").lower()
+AGENT_POOL: Optional[AgentWorkerPool] = None
 outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
 
 tcs: Set[RTCPeerConnection] = set()
-webrtc_ready = threading.Event()
-
-# Buffer candidates until peer connection is ready
-pending_candidates: list = []
-connection_ready = False
 
 os.makedirs("frames", exist_ok=True)
-latest_frame_path = os.path.join("frames", "latest_frame.jpg")
-webrtc_status_path = os.path.join("frames", "webrtc_ready")
+
+# Processing resolution (bounding box, aspect preserved, never upscaled) applied in recv_frames
+INGEST_RESOLUTION = parse_resolution(os.getenv("INGEST_RESOLUTION", "640x360"))
+
+
+def ingest_frame(frame: "av.VideoFrame", pixel_format: str) -> np.ndarray:
+    """Scale to the processing resolution and convert colour in a single libswscale pass."""
+    return av_frame_to_ndarray(frame, pixel_format, INGEST_RESOLUTION)
+
+
+def parse_decode_target(spec: str) -> Optional[float]:
+    """'auto' -> None (follow the agent's processing rate); '0'/'off' -> 0.0 (decode all); '12' -> 12.0."""
+    spec = (spec or "").strip().lower()
+    if spec in ("", "auto"):
+        return None
+    if spec in ("0", "off", "none"):
+        return 0.0
+    return float(spec)
+
+
+# Frames/sec converted in recv_frames; the rest are dropped before reformat/to_ndarray
+DECODE_TARGET_FPS = parse_decode_target(os.getenv("DECODE_TARGET_FPS", "auto"))
+
+def make_decode_scheduler(session: "Session") -> DecodeScheduler:
+    """Static target if configured, otherwise the consumer-advertised rate (shm / in-process only)."""
+    if DECODE_TARGET_FPS is not None:
+        return DecodeScheduler(target_fps=DECODE_TARGET_FPS)
+    if AGENT_MODE == "inprocess":
+        return DecodeScheduler(rate_source=lambda: session.inprocess_agent.processing_fps
+                               if session.inprocess_agent else 0.0)
+    ring = session.get_frame_ring()
+    if ring is not None:
+        return DecodeScheduler(rate_source=lambda: ring.consumer_fps)
+    # JPEG handoff has no back-channel for the agent's rate: decode everything
+    return DecodeScheduler()
 
 def _msg(msg_type: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     return {"type": msg_type, "payload": payload or {}}
@@ -97,7 +436,6 @@ def _msg(msg_type: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, A
 
 clients: Set[WebSocketServerProtocol] = set()
 MAIN_LOOP: Optional[AbstractEventLoop] = None
-LAST_CLIENT_ID: Optional[str] = None
 
 def ws_send_sync(msg_type: str, payload: Optional[Dict[str, Any]] = None) -> None:
     """Thread-safe broadcast helper for payload-wrapped messages."""
@@ -136,8 +474,192 @@ def ws_broadcast_raw(message: Dict[str, Any]) -> None:
             pass
 
 
-def send_log(event: str, message: str) -> None:
-    ws_send_sync(f"logs.{event}", {"message": message})
+def ws_send_raw(ws: WebSocketServerProtocol, message: Dict[str, Any]) -> None:
+    """Thread-safe send of a pre-shaped JSON object to one client."""
+    try:
+        msg = json.dumps(message)
+    except Exception as e:
+        print(f"⚠️ Failed to encode message: {e}")
+        return
+    try:
+        if MAIN_LOOP is not None:
+            asyncio.run_coroutine_threadsafe(ws.send(msg), MAIN_LOOP)
+        else:
+            asyncio.get_running_loop().create_task(ws.send(msg))
+    except Exception:
+        pass
+
+
+def send_log(event: str, message: str, session: Optional["Session"] = None) -> None:
+    if session is not None:
+        session.send(_msg(f"logs.{event}", {"message": message}))
+    else:
+        ws_send_sync(f"logs.{event}", {"message": message})
+
+
+class Session:
+    """
+    One RTCPeerConnection and everything downstream of it: its own frame channel
+    (shared-memory ring with JPEG fallback, or an in-process mailbox), its own
+    agent pipeline (BreathingTracker / FeatureExtractor / MLDataAggregator state)
+    and prediction routing back to the websocket that negotiated it.
+    """
+
+    def __init__(self, ws: WebSocketServerProtocol, pc: RTCPeerConnection, client_id: str):
+        self.id = uuid.uuid4().hex[:8]
+        self.ws = ws
+        self.pc = pc
+        self.client_id = client_id
+        self.frames_dir = os.path.join("frames", self.id)
+        os.makedirs(self.frames_dir, exist_ok=True)
+        self.latest_frame_path = os.path.join(self.frames_dir, "latest_frame.jpg")
+        self.ready_path = os.path.join(self.frames_dir, "webrtc_ready")
+        self.shm_name = f"{FRAME_SHM_NAME}_{self.id}"
+        self.ready = threading.Event()
+        self.agent_requested = False
+        self.ring: Optional[SharedFrameRing] = None
+        self.inprocess_agent = None  # agent.InProcessAgent when AGENT_MODE=inprocess
+        self.pool_worker: Optional[int] = None  # AGENT_POOL worker serving this session when AGENT_MODE=pool
+        self.agent_proc: Optional[subprocess.Popen] = None
+        self.agent_thread: Optional[threading.Thread] = None
+        self.agent_metrics: Dict[str, Any] = {}  # latest stats() from the agent subprocess (AGENT_IPC)
+        self.agent_heartbeat: Optional[float] = None  # wall time of its last heartbeat
+        self.decode_stats: Dict[str, Dict[str, float]] = {}  # per-track decode counters
+        self.closed = False
+        self._lock = threading.Lock()
+        self._frame_seq = 0  # last in-process frame id, shared by every track of the session
+
+    def get_frame_ring(self) -> Optional[SharedFrameRing]:
+        """Create this session's shared-memory ring on first use; fall back to JPEG if unavailable."""
+        # In-process agents take frames from memory directly; the ring is only for agent subprocesses
+        if self.ring is None and FRAME_TRANSPORT == "shm" and AGENT_MODE != "inprocess" and not self.closed:
+            try:
+                self.ring = SharedFrameRing.create(name=self.shm_name)
+                print(f"🧠 [{self.id}] Shared-memory frame ring ready "
+                      f"({self.ring.slot_count} slots x {self.ring.slot_capacity} bytes)")
+            except Exception as e:
+                print(f"⚠️ [{self.id}] Shared-memory frame ring unavailable, using JPEG handoff: {e}")
+        return self.ring
+
+    def next_frame_seq(self) -> int:
+        """Next in-process frame id. Monotonic for the session, so a new or renegotiated track
+        continues where the previous one stopped (the agent rejects ids it has already seen)."""
+        with self._lock:
+            self._frame_seq += 1
+            return self._frame_seq
+
+    @property
+    def consumer(self):
+        """Whatever takes this session's frames, for backpressure (``wants_frame``)."""
+        return self.inprocess_agent if AGENT_MODE == "inprocess" else self.ring
+
+    def send(self, message: Dict[str, Any]) -> None:
+        ws_send_raw(self.ws, message)
+
+    def mark_ready(self) -> None:
+        """First video track is live: frames are about to flow."""
+        if self.ready.is_set():
+            return
+        self.ready.set()
+        try:
+            with open(self.ready_path, "w") as f:
+                f.write("ready")
+            print(f"✅ [{self.id}] WebRTC status file created")
+        except Exception as e:
+            print(f"⚠️ [{self.id}] Failed to write webrtc status file: {e}")
+        self.maybe_start_agent()
+
+    def request_agent(self) -> None:
+        self.agent_requested = True
+        self.maybe_start_agent()
+
+    def maybe_start_agent(self) -> None:
+        """Start the agent once the client asked for it and the video track is live."""
+        with self._lock:
+            if self.closed or not (self.agent_requested and self.ready.is_set()):
+                return
+            if AGENT_MODE == "inprocess":
+                # Importing the pipeline and building it takes seconds; do it off the event loop and outside _lock
+                starting = self.agent_thread is not None and self.agent_thread.is_alive()
+                if not starting and (self.inprocess_agent is None or not self.inprocess_agent.is_alive()):
+                    self.agent_thread = threading.Thread(target=start_inprocess_agent, args=(self,),
+                                                         name=f"agent-start-{self.id}", daemon=True)
+                    self.agent_thread.start()
+                return
+            if AGENT_MODE == "pool":
+                if self.pool_worker is None:
+                    PREDICTIONS.forget(self.id)
+                    self.pool_worker = AGENT_POOL.assign(self.id, self.shm_name,
+                                                         os.path.abspath(self.latest_frame_path))
+                    print(f"✅ [{self.id}] Assigned to agent worker {self.pool_worker}")
+                    send_log("new_log", "Starting agent", self)
+                return
+            if self.agent_thread and self.agent_thread.is_alive():
+                print(f"🔹 [{self.id}] Agent already running.")
+                return
+            self.agent_thread = threading.Thread(target=run_agent_subprocess, args=(self,),
+                                                 name=f"agent-{self.id}", daemon=True)
+            self.agent_thread.start()
+            print(f"✅ [{self.id}] Agent thread started.")
+
+    def close(self) -> None:
+        """Stop the agent and release the frame channel (the peer connection is closed by the caller)."""
+        with self._lock:  # an in-process agent starting on another thread checks closed under the same lock
+            if self.closed:
+                return
+            self.closed = True
+        if self.inprocess_agent is not None:
+            self.inprocess_agent.stop()
+        if self.pool_worker is not None and AGENT_POOL is not None:
+            AGENT_POOL.release(self.id)
+        PREDICTIONS.forget(self.id)
+        if self.agent_proc is not None and self.agent_proc.poll() is None:
+            self.agent_proc.terminate()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        for path in (self.latest_frame_path, self.ready_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(self.frames_dir)
+        except OSError:
+            pass
+        print(f"🧹 [{self.id}] Session closed")
+
+
+class ClientState:
+    """Per-websocket state: client id, start request, its sessions and ICE candidates buffered before the answer."""
+
+    def __init__(self, ws: WebSocketServerProtocol):
+        self.ws = ws
+        try:
+            self.client_id = f"{ws.remote_address[0]}:{ws.remote_address[1]}"
+        except Exception:
+            self.client_id = "unknown"
+        self.agent_requested = False
+        self.sessions: list = []
+        self.pending_candidates: list = []
+        self.connection_ready = False
+
+    def peer_connections(self) -> list:
+        return [session.pc for session in self.sessions if not session.closed]
+
+
+SESSIONS: Dict[str, Session] = {}
+CLIENT_STATES: Dict[WebSocketServerProtocol, ClientState] = {}
+
+
+async def close_session(session: Session) -> None:
+    SESSIONS.pop(session.id, None)
+    session.close()
+    tcs.discard(session.pc)
+    try:
+        await session.pc.close()
+    except Exception:
+        pass
 
 
 async def handle_offer(payload: Dict[str, Any], ws: WebSocketServerProtocol) -> None:
@@ -148,55 +670,27 @@ async def handle_offer(payload: Dict[str, Any], ws: WebSocketServerProtocol) ->
         await ws.send(json.dumps(_msg("error", {"reason": "Invalid offer payload"})))
         return
 
+    client = CLIENT_STATES.get(ws) or CLIENT_STATES.setdefault(ws, ClientState(ws))
     pc = RTCPeerConnection()
     tcs.add(pc)
-    print(f"🔗 Created RTCPeerConnection, total connections: {len(tcs)}")
+    session = Session(ws, pc, client.client_id)
+    session.agent_requested = client.agent_requested
+    SESSIONS[session.id] = session
+    client.sessions.append(session)
+    print(f"🔗 Created RTCPeerConnection for session {session.id}, total connections: {len(tcs)}")
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        print(f"🔌 [{session.id}] Connection state: {pc.connectionState}")
+        if pc.connectionState in ("failed", "closed"):
+            await close_session(session)
 
     @pc.on("track")
     def on_track(track):
-        print(f"🎥 Received track: kind={track.kind}, id={track.id}")
+        print(f"🎥 [{session.id}] Received track: kind={track.kind}, id={track.id}")
         if track.kind == "video":
             print("📹 Video track detected, starting frame capture...")
-            async def recv_frames() -> None:
-                webrtc_ready.set()
-                try:
-                    with open(webrtc_status_path, "w") as f:
-                        f.write("ready")
-                    print("✅ WebRTC status file created")
-                except Exception as e:
-                    print(f"⚠️ Failed to write webrtc status file: {e}")
-
-                frame_count = 0
-                while True:
-                    try:
-                        frame = await track.recv()
-                        frame_count += 1
-                        
-                        img = frame.to_ndarray(format="bgr24")
-                        
-                        # Atomic write: write to temp file first, then rename
-                        temp_path = latest_frame_path + ".tmp"
-                        success = await asyncio.to_thread(cv2.imwrite, temp_path, img)
-                        
-                        if success:
-                            # Atomic rename to avoid partial reads
-                            await asyncio.to_thread(os.rename, temp_path, latest_frame_path)
-                        else:
-                            print(f"⚠️ Failed to write frame #{frame_count}")
-                            # Clean up temp file if write failed
-                            try:
-                                await asyncio.to_thread(os.remove, temp_path)
-                            except:
-                                pass
-                        
-                        if frame_count % 100 == 1:
-                            print(f"📸 Frame #{frame_count} saved ({img.shape})")
-                        
-                    except Exception as e:
-                        print(f"⚠️ Failed to process frame #{frame_count}: {e}")
-                        break
-
-            asyncio.create_task(recv_frames())
+            asyncio.create_task(recv_frames(session, track))
         else:
             print(f"🔊 Non-video track received: {track.kind}")
     desc = RTCSessionDescription(offer_sdp, offer_type)
@@ -215,39 +709,108 @@ async def handle_offer(payload: Dict[str, Any], ws: WebSocketServerProtocol) ->
     await ws.send(json.dumps(_msg("webrtc.answer", {
         "sdp": pc.localDescription.sdp,
         "type": pc.localDescription.type,
+        "session_id": session.id,
     })))
     print("📤 Sent WebRTC answer to client")
     
     # Mark connection as ready and process any buffered candidates
-    global connection_ready, pending_candidates
-    connection_ready = True
-    print(f"🔗 Connection ready! Processing {len(pending_candidates)} buffered candidates...")
+    client.connection_ready = True
+    print(f"🔗 Connection ready! Processing {len(client.pending_candidates)} buffered candidates...")
     
     # Process any candidates that arrived while we were setting up
-    for buffered_payload in pending_candidates:
+    for buffered_payload in client.pending_candidates:
         try:
-            await handle_candidate_internal(buffered_payload)
+            await handle_candidate_internal(buffered_payload, client)
         except Exception as e:
             print(f"⚠️ Error processing buffered candidate: {e}")
     
-    pending_candidates.clear()
+    client.pending_candidates.clear()
     print("✅ All buffered candidates processed")
 
 
-async def handle_candidate(payload: Dict[str, Any]) -> None:
-    """Main candidate handler that buffers candidates if connection isn't ready"""
-    global connection_ready, pending_candidates
-    
-    if not connection_ready:
-        print(f"📦 Buffering ICE candidate (total buffered: {len(pending_candidates) + 1})")
-        pending_candidates.append(payload)
+async def recv_frames(session: Session, track) -> None:
+    """Receive one video track and hand its frames to the session's agent."""
+    ring = session.get_frame_ring()
+    scheduler = make_decode_scheduler(session)
+    session.mark_ready()
+
+    frame_count = 0
+    held_back = 0  # frames not converted because the agent had not taken the previous one
+    while not session.closed:
+        try:
+            frame = await track.recv()
+            frame_count += 1
+            capture_ts = time.time()
+            
+            # Skip the conversion entirely for frames the agent would never get to
+            decode = scheduler.should_decode(capture_ts)
+            if frame_count % 100 == 0:
+                session.decode_stats[track.id] = {
+                    "decoded": scheduler.decoded,
+                    "dropped": scheduler.dropped,
+                    "held_back": held_back,
+                    "target_fps": scheduler.target_fps(),
+                }
+                print(f"🎚️ [{session.id}] Track {track.id}: {scheduler.decoded} decoded, {scheduler.dropped} dropped, "
+                      f"{held_back} held back (target {scheduler.target_fps():.1f} fps)")
+            if not decode:
+                continue
+            
+            # Backpressure: while the agent hasn't taken the last frame and it is still fresh,
+            # converting another one would just overwrite it
+            consumer = session.consumer
+            if consumer is not None and not consumer.wants_frame(capture_ts):
+                held_back += 1
+                continue
+            scheduler.note_decoded()
+            
+            # RGB for MediaPipe unless frames go through the JPEG file (OpenCV wants BGR)
+            pixel_format = "rgb24" if (AGENT_MODE == "inprocess" or ring is not None) else "bgr24"
+            img = ingest_frame(frame, pixel_format)
+            
+            # In-process agent: hand the frame over in memory, nothing touches disk
+            if AGENT_MODE == "inprocess":
+                agent = session.inprocess_agent
+                if agent is not None and agent.is_alive():
+                    agent.submit(Frame(img, session.next_frame_seq(), capture_ts, "queue", pixel_format))
+                if scheduler.decoded % 100 == 1:
+                    print(f"📸 [{session.id}] Frame #{frame_count} queued ({img.shape} {pixel_format}, in-process, "
+                          f"{img.nbytes / 1e6:.2f} MB copied vs {frame.width * frame.height * 3 / 1e6:.2f} MB native bgr24)")
+                continue
+            
+            # Raw copy into shared memory; JPEG file only as fallback
+            seq = ring.write(img, capture_ts, pixel_format) if ring is not None else 0
+            if not seq:
+                if pixel_format == "rgb24":
+                    img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+                success = await asyncio.to_thread(write_jpeg_frame, session.latest_frame_path, img)
+                if not success:
+                    print(f"⚠️ [{session.id}] Failed to write frame #{frame_count}")
+            
+            if scheduler.decoded % 100 == 1:
+                transport = "shm" if seq else "jpeg"
+                # ndarray conversion + transport write, vs the same at native resolution
+                native_bytes = frame.width * frame.height * 3
+                print(f"📸 [{session.id}] Frame #{frame_count} saved ({img.shape} {pixel_format}, {transport}, "
+                      f"{2 * img.nbytes / 1e6:.2f} MB copied vs {2 * native_bytes / 1e6:.2f} MB native)")
+            
+        except Exception as e:
+            print(f"⚠️ [{session.id}] Failed to process frame #{frame_count}: {e}")
+            break
+
+
+async def handle_candidate(payload: Dict[str, Any], client: ClientState) -> None:
+    """Main candidate handler that buffers candidates until this client's connection is ready"""
+    if not client.connection_ready:
+        print(f"📦 Buffering ICE candidate (total buffered: {len(client.pending_candidates) + 1})")
+        client.pending_candidates.append(payload)
         return
     
-    await handle_candidate_internal(payload)
+    await handle_candidate_internal(payload, client)
 
 
-async def handle_candidate_internal(payload: Dict[str, Any]) -> None:
-    """Internal candidate handler that processes candidates immediately"""
+async def handle_candidate_internal(payload: Dict[str, Any], client: ClientState) -> None:
+    """Internal candidate handler that adds the candidate to this client's peer connections immediately"""
     candidate_str = payload.get("candidate")
     sdp_mid = payload.get("sdpMid")
     sdp_mline_index = payload.get("sdpMLineIndex")
@@ -262,7 +825,7 @@ async def handle_candidate_internal(payload: Dict[str, Any]) -> None:
         return
     
     # Add initial delay for very early candidates to allow connection setup
-    if len(tcs) == 0:
+    if len(client.peer_connections()) == 0:
         print("⏳ Waiting for peer connection to be established...")
         await asyncio.sleep(1.0)  # Give connection time to establish
     
@@ -275,13 +838,13 @@ async def handle_candidate_internal(payload: Dict[str, Any]) -> None:
             retry_count += 1
             
             # Wait longer if peer connections aren't ready yet
-            if len(tcs) == 0:
+            if len(client.peer_connections()) == 0:
                 wait_time = base_delay * retry_count * 2  # Progressive delay: 1s, 2s, 4s
                 print(f"⏳ No peer connections available, waiting {wait_time}s before retry {retry_count}")
                 await asyncio.sleep(wait_time)
                 
             # Check if we have active connections
-            if len(tcs) == 0:
+            if len(client.peer_connections()) == 0:
                 print(f"⚠️ No peer connections available for ICE candidate (attempt {retry_count})")
                 if retry_count < max_retries:
                     continue
@@ -319,10 +882,10 @@ async def handle_candidate_internal(payload: Dict[str, Any]) -> None:
             
             # Try to add candidate to all active peer connections
             successful_adds = 0
-            total_connections = len(tcs)
+            total_connections = len(client.peer_connections())
             print(f"🔍 Attempting to add ICE candidate to {total_connections} peer connection(s)")
             
-            for i, pc in enumerate(list(tcs)):
+            for i, pc in enumerate(client.peer_connections()):
                 try:
                     connection_state = getattr(pc, 'connectionState', 'unknown')
                     ice_state = getattr(pc, 'iceConnectionState', 'unknown')
@@ -376,13 +939,29 @@ async def handle_candidate_internal(payload: Dict[str, Any]) -> None:
         print(f"❌ Failed to handle ICE candidate after {max_retries} attempts")
 
 
-async def webrtc_capture_frame() -> Dict[str, Any]:
+async def webrtc_capture_frame(session: Optional[Session] = None) -> Dict[str, Any]:
+    """Latest frame of ``session`` (default: the most recently connected live session) as BGR."""
     try:
-        if not os.path.exists(webrtc_status_path):
+        if session is None:
+            live = [s for s in SESSIONS.values() if s.ready.is_set() and not s.closed]
+            session = live[-1] if live else None
+        if session is None or not os.path.exists(session.ready_path):
             return {"status": "error", "error": "WebRTC connection not established yet"}
 
-        if os.path.exists(latest_frame_path):
-            frame = await asyncio.to_thread(cv2.imread, latest_frame_path)
+        ring = session.ring
+        if ring is not None:
+            latest = ring.read_latest()
+            if latest is not None:
+                if latest.pixel_format == "rgb24":
+                    frame = cv2.cvtColor(latest.image, cv2.COLOR_RGB2BGR)
+                else:
+                    frame = latest.image.copy()
+                # The view is only valid until the producer reuses the slot; drop a copy it raced with
+                if ring.is_current(latest.seq):
+                    return {"status": "success", "frame": frame}
+
+        if os.path.exists(session.latest_frame_path):
+            frame = await asyncio.to_thread(read_jpeg_frame, session.latest_frame_path)
             if frame is None:
                 return {"status": "error", "error": "Failed to read frame from file"}
             return {"status": "success", "frame": frame}
@@ -391,221 +970,193 @@ async def webrtc_capture_frame() -> Dict[str, Any]:
     except Exception as e:
         return {"status": "error", "error": f"WebRTC error: {str(e)}"}
 
-agent_thread: Optional[threading.Thread] = None
 
+def import_agent_module():
+    """The pipeline module (MediaPipe/TensorFlow/langgraph): seconds on a cold import, so never on the event loop."""
+    import agent as agent_module
+    return agent_module
 
-def start_agent(_data: Optional[Dict[str, Any]] = None) -> None:
-    global agent_thread
-    if agent_thread and agent_thread.is_alive():
-        print("🔹 Agent already running.")
-        return
 
-    def _run():
-        webrtc_ready.wait()
-        print("🔹 WebRTC ready, starting agent.")
+def start_inprocess_agent(session: Session) -> None:
+    """Import the pipeline lazily and run the session's agent on a worker thread (runs on a starter thread)."""
+    try:
+        agent_module = import_agent_module()
+        inprocess_agent = agent_module.InProcessAgent(
+            on_window=lambda window: predict_window(window, session), name=session.id)
+    except Exception as e:
+        print(f"❌ Failed to start in-process agent: {e}")
+        send_log("new_log", f"❌ Failed to start in-process agent: {e}", session)
+        return
+    with session._lock:
+        if session.closed:  # ended while the pipeline was being built
+            inprocess_agent.stop()
+            return
+        PREDICTIONS.forget(session.id)  # the new pipeline's window ids start at 0
+        session.inprocess_agent = inprocess_agent
+        inprocess_agent.start()
+    send_log("new_log", "Starting in-process agent", session)
 
-        if AGENT_CMD:
-            cmd = AGENT_CMD.split()
-        else:
-            candidate = os.path.join(os.path.dirname(__file__), "agent.py")
-            if not os.path.exists(candidate):
-                err = "agent.py not found and AGENT_CMD not set."
-                print(f"❌ {err}")
-                send_log("new_log", f"❌ {err}")
-                return
-            cmd = [sys.executable, "-u", candidate]
 
-        print(f"⏳ Starting agent subprocess: {cmd}")
+def preload_agent_module() -> threading.Thread:
+    """Warm the in-process pipeline import at server start, so the first session doesn't wait for it."""
+    def run() -> None:
+        start = time.perf_counter()
         try:
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-            )
+            import_agent_module()
         except Exception as e:
-            print(f"❌ Failed to start agent: {e}")
-            send_log("new_log", f"❌ Failed to start agent: {e}")
+            print(f"❌ Failed to import agent pipeline: {e}")
             return
+        print(f"✅ Agent pipeline imported in {(time.perf_counter() - start) * 1000.0:.0f} ms")
 
-        assert proc.stdout is not None
-        for raw in proc.stdout:
-            line = raw.rstrip()
-            print(f"[agent] {line}")
-            try:
-                # Check for feature window JSON printed inline (not typical currently)
-                if line.startswith("{") and "window_id" in line:
-                    try:
-                        window_data = json.loads(line)
-                        if STRESS_MODEL is not None:
-                            processed_window = preprocess_window(window_data)
-                            if processed_window is not None:
-                                # Predict probabilities with fallbacks
-                                if hasattr(STRESS_MODEL, "predict_proba"):
-                                    probs = STRESS_MODEL.predict_proba(processed_window)[0]
-                                    p_stressed = float(probs[1]) if len(probs) > 1 else float(probs[0])
-                                elif hasattr(STRESS_MODEL, "decision_function"):
-                                    score = float(STRESS_MODEL.decision_function(processed_window)[0])
-                                    # Map decision score to [0,1]
-                                    p_stressed = 1.0 / (1.0 + np.exp(-score))
-                                else:
-                                    pred = int(STRESS_MODEL.predict(processed_window)[0])
-                                    p_stressed = float(pred)
-
-                                label = "stressed" if p_stressed >= 0.5 else "calm"
-                                confidence = p_stressed if label == "stressed" else (1.0 - p_stressed)
-                                
-                                # Derive auxiliary metrics when available
-                                breathing_rate = None
-                                blink_rate = None
-                                posture_stress = None
-                                try:
-                                    ba = window_data.get("breathing_analysis", {}) or {}
-                                    ea = window_data.get("eye_analysis", {}) or {}
-                                    pa = window_data.get("posture_analysis", {}) or {}
-                                    br = ba.get("mean_bpm")
-                                    if isinstance(br, (int, float)):
-                                        breathing_rate = float(br)
-                                    bl = ea.get("blink_frequency")
-                                    if isinstance(bl, (int, float)):
-                                        blink_rate = float(bl)
-                                    ps = pa.get("posture_stability")
-                                    if isinstance(ps, (int, float)):
-                                        # Map stability [0..1+] to stress [0..100]
-                                        posture_stress = float(max(0.0, min(100.0, (1.0 - float(ps)) * 100.0)))
-                                except Exception:
-                                    pass
-
-                                # Send prediction via websocket (top-level type + fields)
-                                msg = {
-                                    "type": "prediction",
-                                    "label": label,
-                                    "confidence": float(confidence),
-                                    "client_id": LAST_CLIENT_ID,
-                                    "timestamp": window_data.get("timestamp_start"),
-                                    "window_id": window_data.get("window_id"),
-                                }
-                                # Attach auxiliary metrics if present
-                                if breathing_rate is not None:
-                                    msg["breathing_rate"] = breathing_rate
-                                if blink_rate is not None:
-                                    msg["blink_rate"] = blink_rate
-                                if posture_stress is not None:
-                                    msg["posture_stress"] = posture_stress
-                                ws_broadcast_raw(msg)
-                    except Exception as pred_error:
-                        print(f"❌ Prediction error: {pred_error}")
-
-                # Detect saved JSON file path from agent and run prediction by loading file
-                if "Saved to: ml_training_data/window_" in line:
-                    try:
-                        m = re.search(r"Saved to: (ml_training_data\/window_\d+_ml_features\.json)", line)
-                        if m:
-                            json_path = os.path.join(os.path.dirname(__file__), m.group(1))
-                            with open(json_path, 'r') as jf:
-                                window_data = json.load(jf)
-                            if STRESS_MODEL is not None:
-                                processed_window = preprocess_window(window_data)
-                                if processed_window is not None:
-                                    if hasattr(STRESS_MODEL, "predict_proba"):
-                                        probs = STRESS_MODEL.predict_proba(processed_window)[0]
-                                        p_stressed = float(probs[1]) if len(probs) > 1 else float(probs[0])
-                                    elif hasattr(STRESS_MODEL, "decision_function"):
-                                        score = float(STRESS_MODEL.decision_function(processed_window)[0])
-                                        p_stressed = 1.0 / (1.0 + np.exp(-score))
-                                    else:
-                                        pred = int(STRESS_MODEL.predict(processed_window)[0])
-                                        p_stressed = float(pred)
-                                    label = "stressed" if p_stressed >= 0.5 else "calm"
-                                    confidence = p_stressed if label == "stressed" else (1.0 - p_stressed)
-                                    # Derive auxiliary metrics when available
-                                    breathing_rate = None
-                                    blink_rate = None
-                                    posture_stress = None
-                                    try:
-                                        ba = window_data.get("breathing_analysis", {}) or {}
-                                        ea = window_data.get("eye_analysis", {}) or {}
-                                        pa = window_data.get("posture_analysis", {}) or {}
-                                        br = ba.get("mean_bpm")
-                                        if isinstance(br, (int, float)):
-                                            breathing_rate = float(br)
-                                        bl = ea.get("blink_frequency")
-                                        if isinstance(bl, (int, float)):
-                                            blink_rate = float(bl)
-                                        ps = pa.get("posture_stability")
-                                        if isinstance(ps, (int, float)):
-                                            posture_stress = float(max(0.0, min(100.0, (1.0 - float(ps)) * 100.0)))
-                                    except Exception:
-                                        pass
-
-                                    msg = {
-                                        "type": "prediction",
-                                        "label": label,
-                                        "confidence": float(confidence),
-                                        "client_id": LAST_CLIENT_ID,
-                                        "timestamp": window_data.get("timestamp_start"),
-                                        "window_id": window_data.get("window_id"),
-                                    }
-                                    if breathing_rate is not None:
-                                        msg["breathing_rate"] = breathing_rate
-                                    if blink_rate is not None:
-                                        msg["blink_rate"] = blink_rate
-                                    if posture_stress is not None:
-                                        msg["posture_stress"] = posture_stress
-                                    ws_broadcast_raw(msg)
-                    except Exception as file_pred_err:
-                        print(f"❌ File-based prediction error: {file_pred_err}")
-
-                # Original log handling
-                if line.startswith("Starting") or line.startswith("Capturing") or line.startswith("✅ Body posture calibrated") or line.startswith("✅ Face angle calibrated") or line.startswith("❌"):
-                    send_log("new_log", line)
-                elif line.startswith("⚠️ Bad posture detected!"):
-                    send_log("bad_posture", line)
-                elif line.startswith("📱 Suspicious!"):
-                    send_log("phone_suspicion", line)
-                elif line.startswith("✅ You're no longer"):
-                    send_log("phone_suspicion", line)
-                elif line.startswith("✅ Posture corrected!"):
-                    send_log("bad_posture", line)
-            except Exception as e:
-                print(f"Log dispatch error: {e}")
+    thread = threading.Thread(target=run, name="agent-import", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_agent_pool() -> AgentWorkerPool:
+    """Launch the warm worker pool at server start; windows come back tagged with their session id."""
+    def on_window(session_id: str, window: Dict[str, Any]) -> None:
+        session = SESSIONS.get(session_id)
+        if session is not None:  # ended sessions get no predictions (and must not be broadcast)
+            predict_window(window, session)
+
+    def on_log(session_id: str, message: str) -> None:
+        print(f"[agent {session_id}] {message}")
+        session = SESSIONS.get(session_id)
+        if session is not None:
+            send_log("new_log", message, session)
+
+    pool = AgentWorkerPool(on_window=on_window, on_log=on_log, on_restart=PREDICTIONS.forget)
+    pool.start()
+    return pool
+
+
+def read_agent_ipc(session: Session, stream) -> None:
+    """Dispatch one agent's binary channel: windows to prediction, typed logs to the client, metrics onto the session."""
+    try:
+        for kind, payload in read_messages(stream):
+            if kind == "window":
+                predict_window(payload, session)
+            elif kind == "log":
+                send_log(payload.get("event", "new_log"), payload.get("message", ""), session)
+            elif kind == "metrics":
+                session.agent_metrics = payload
+            elif kind == "heartbeat":
+                session.agent_heartbeat = time.time()
+    except Exception as e:
+        print(f"⚠️ [{session.id}] Agent IPC error: {e}")
+    finally:
+        stream.close()
+
+
+def run_agent_subprocess(session: Session) -> None:
+    """Run agent.py for one session, reading from the session's ring / frame file, and route its output."""
+    if AGENT_CMD:
+        cmd = AGENT_CMD.split()
+    else:
+        candidate = os.path.join(os.path.dirname(__file__), "agent.py")
+        if not os.path.exists(candidate):
+            err = "agent.py not found and AGENT_CMD not set."
+            print(f"❌ {err}")
+            send_log("new_log", f"❌ {err}", session)
+            return
+        cmd = [sys.executable, "-u", candidate]
+
+    # The agent picks its frame channel up from the environment, so AGENT_CMD needs no extra args
+    env = dict(os.environ,
+               FRAME_SHM_NAME=session.shm_name,
+               AGENT_SESSION_ID=session.id,
+               AGENT_FRAME_FILE=os.path.abspath(session.latest_frame_path),
+               AGENT_READY_FILE=os.path.abspath(session.ready_path))
+    # Windows, typed logs and heartbeats come back over a pipe; stdout is only human-readable logs
+    ipc_read = ipc_write = None
+    if AGENT_IPC:
+        ipc_read, ipc_write = os.pipe()
+        env["AGENT_IPC_FD"] = str(ipc_write)
+    print(f"⏳ [{session.id}] Starting agent subprocess: {cmd}")
+    PREDICTIONS.forget(session.id)  # a new (or restarted) agent numbers its windows from 0
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            env=env,
+            pass_fds=(ipc_write,) if ipc_write is not None else (),
+        )
+    except Exception as e:
+        print(f"❌ Failed to start agent: {e}")
+        send_log("new_log", f"❌ Failed to start agent: {e}", session)
+        if ipc_write is not None:
+            os.close(ipc_read)
+            os.close(ipc_write)
+        return
+    session.agent_proc = proc
+    if ipc_write is not None:
+        os.close(ipc_write)  # the agent holds the only write end, so the reader sees EOF when it exits
+        threading.Thread(target=read_agent_ipc, args=(session, os.fdopen(ipc_read, "rb")),
+                         name=f"agent-ipc-{session.id}", daemon=True).start()
+
+    assert proc.stdout is not None
+    for raw in proc.stdout:
+        line = raw.rstrip()
+        print(f"[agent {session.id}] {line}")
         try:
-            proc.stdout.close()
-        except Exception:
-            pass
-        proc.wait()
-        exit_code = proc.returncode
-        print(f"⚠️ Agent exited ({exit_code})")
-        send_log("new_log", f"⚠️ Agent exited ({exit_code})")
-        
-        # Auto-restart agent if it crashes (but not if manually stopped)
-        if exit_code != 0 and exit_code != -2:  # -2 is SIGINT (Ctrl+C)
-            print("🔄 Agent crashed, will auto-restart in 3 seconds...")
-            import time
-            time.sleep(3)
-            
-            # Clear the agent_thread to allow restart
-            agent_thread = None
-            
-            # Restart the agent
-            print("🔄 Auto-restarting agent...")
-            start_agent(_data)
+            # Without the binary channel (AGENT_IPC=0) windows are scraped from stdout
+            if ipc_read is None and line.startswith("{") and "window_id" in line:
+                try:
+                    predict_window(json.loads(line), session)
+                except ValueError as parse_error:
+                    print(f"❌ Window JSON parse error: {parse_error}")
 
-    agent_thread = threading.Thread(target=_run, daemon=True)
-    agent_thread.start()
-    print("✅ Agent thread started.")
+            # Original log handling
+            if line.startswith("Starting") or line.startswith("Capturing") or line.startswith("✅ Body posture calibrated") or line.startswith("✅ Face angle calibrated") or line.startswith("❌"):
+                send_log("new_log", line, session)
+            elif line.startswith("⚠️ Bad posture detected!"):
+                send_log("bad_posture", line, session)
+            elif line.startswith("📱 Suspicious!"):
+                send_log("phone_suspicion", line, session)
+            elif line.startswith("✅ You're no longer"):
+                send_log("phone_suspicion", line, session)
+            elif line.startswith("✅ Posture corrected!"):
+                send_log("bad_posture", line, session)
+        except Exception as e:
+            print(f"Log dispatch error: {e}")
+    try:
+        proc.stdout.close()
+    except Exception:
+        pass
+    proc.wait()
+    exit_code = proc.returncode
+    print(f"⚠️ [{session.id}] Agent exited ({exit_code})")
+    send_log("new_log", f"⚠️ Agent exited ({exit_code})", session)
+
+    # Auto-restart agent if it crashes (but not if manually stopped or the session has ended)
+    if exit_code != 0 and exit_code != -2 and not session.closed:  # -2 is SIGINT (Ctrl+C)
+        print(f"🔄 [{session.id}] Agent crashed, will auto-restart in 3 seconds...")
+        time.sleep(3)
+        if not session.closed:
+            print(f"🔄 [{session.id}] Auto-restarting agent...")
+            run_agent_subprocess(session)
+
+
+def start_agent(client: ClientState, data: Optional[Dict[str, Any]] = None) -> None:
+    """control.start: run an agent for each of this client's sessions (now, or once its video is live)."""
+    client.agent_requested = True
+    cid = (data or {}).get("client_id") or (data or {}).get("clientId")
+    if cid:
+        client.client_id = str(cid)
+    for session in client.sessions:
+        session.client_id = client.client_id
+        session.request_agent()
 
 
 async def ws_handler(ws: WebSocketServerProtocol):
     clients.add(ws)
     print(f"🔗 Client connected: {ws.remote_address}")
-    global LAST_CLIENT_ID
-    # Track a simple client_id for prediction routing
-    try:
-        LAST_CLIENT_ID = f"{ws.remote_address[0]}:{ws.remote_address[1]}"
-    except Exception:
-        LAST_CLIENT_ID = "unknown"
+    # Per-connection client id, sessions and candidate buffer for prediction routing
+    client = CLIENT_STATES.setdefault(ws, ClientState(ws))
     connection_errors = 0
     max_connection_errors = 5
     
@@ -642,15 +1193,23 @@ async def ws_handler(ws: WebSocketServerProtocol):
                 if msg_type == "ping":
                     await ws.send(json.dumps(_msg("pong", {"ts": payload.get("ts")})))
                 elif msg_type == "control.start":
-                    # Optionally take provided client id
-                    cid = payload.get("client_id") or payload.get("clientId")
-                    if cid:
-                        LAST_CLIENT_ID = str(cid)
-                    start_agent(payload)
+                    # Optionally takes a provided client id
+                    start_agent(client, payload)
                 elif msg_type == "webrtc.offer":
                     asyncio.create_task(handle_offer(payload, ws))
                 elif msg_type == "webrtc.candidate":
-                    asyncio.create_task(handle_candidate(payload))
+                    asyncio.create_task(handle_candidate(payload, client))
+                elif msg_type == "metrics.get":
+                    # Per-worker CPU %, queue depth and fps (AGENT_MODE=pool), per-agent stats (subprocess + AGENT_IPC),
+                    # prediction counts and latency
+                    workers = AGENT_POOL.metrics() if AGENT_POOL is not None else {}
+                    now = time.time()
+                    agents = {
+                        sid: dict(s.agent_metrics, heartbeat_age_s=(now - s.agent_heartbeat) if s.agent_heartbeat else None)
+                        for sid, s in list(SESSIONS.items()) if s.agent_heartbeat is not None
+                    }
+                    await ws.send(json.dumps(_msg("metrics", {"agent_mode": AGENT_MODE, "workers": workers, "agents": agents,
+                                                              "predictions": PREDICTIONS.metrics()})))
                 else:
                     print(f"ℹ️ Unhandled msg: {msg_type}")
             except Exception as handler_error:
@@ -661,6 +1220,10 @@ async def ws_handler(ws: WebSocketServerProtocol):
         print(f"⚠️ WebSocket connection error: {ws_error}")
     finally:
         clients.discard(ws)
+        CLIENT_STATES.pop(ws, None)
+        # The user is gone: stop their agents and release their frame channels
+        for session in client.sessions:
+            await close_session(session)
         print(f"🔗 Client disconnected: {ws.remote_address}")
 
 
@@ -673,18 +1236,30 @@ async def ws_main() -> None:
         await asyncio.Future()
 
 def main() -> None:
+    global AGENT_POOL
+    loader = PREDICTIONS.load_in_background(load_stress_model)
+    if STRESS_MODEL_LOAD == "eager":
+        loader.join()
+    PREDICTIONS.start()
+    if AGENT_MODE == "pool":
+        AGENT_POOL = start_agent_pool()
+    elif AGENT_MODE == "inprocess":
+        preload_agent_module()
     try:
         asyncio.run(ws_main())
     except KeyboardInterrupt:
         print("⏹️ Shutting down...")
     finally:
+        for session in list(SESSIONS.values()):
+            session.close()
+        if AGENT_POOL is not None:
+            AGENT_POOL.stop()
+        PREDICTIONS.stop()
         for pc in list(tcs):
             try:
                 asyncio.run(pc.close())
             except Exception:
                 pass
-        if agent_thread and agent_thread.is_alive():
-            agent_thread.join(timeout=2)
 
 
 if __name__ == "__main__":
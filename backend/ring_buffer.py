@@ -0,0 +1,62 @@
+"""Fixed-capacity float64 ring buffer with zero-copy views of the newest samples.
+
+Every sample is stored twice, at ``i`` and ``i + capacity`` of one
+``2 * capacity`` array, so the newest ``n`` samples are always a single
+contiguous slice. ``last(n)`` returns that slice as a read-only view: reading
+a signal history costs no list conversion and no copy, for one extra store per
+append.
+
+A view aliases the buffer. Appends after taking it overwrite the oldest
+samples in place, so copy it if it has to outlive the next append.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+class RingBuffer:
+    """The newest ``capacity`` values appended, like ``deque(maxlen=capacity)`` of floats."""
+
+    __slots__ = ("capacity", "_data", "_pos", "_len")
+
+    def __init__(self, capacity: int, dtype: type = np.float64):
+        if capacity < 1:
+            raise ValueError(f"RingBuffer capacity must be positive, got {capacity}")
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=dtype)
+        self._pos = 0  # next slot to write, in [0, capacity)
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, value: float) -> None:
+        pos = self._pos
+        self._data[pos] = value
+        self._data[pos + self.capacity] = value
+        self._pos = pos + 1 if pos + 1 < self.capacity else 0
+        if self._len < self.capacity:
+            self._len += 1
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.append(value)
+
+    def clear(self) -> None:
+        self._pos = 0
+        self._len = 0
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """Read-only view of the newest ``n`` values (all of them by default), oldest first."""
+        n = self._len if n is None else max(0, min(int(n), self._len))
+        end = self._pos + self.capacity
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def latest(self) -> float:
+        if not self._len:
+            raise IndexError("latest() on an empty RingBuffer")
+        return float(self._data[self._pos + self.capacity - 1])
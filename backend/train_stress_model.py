@@ -16,6 +16,10 @@ Usage:
 Optional:
   python backend/train_stress_model.py --data-file data/dataset.parquet --model lightgbm
 
+Training also writes stress_rf_forest.npz, the forest flattened for the server's
+numpy runtime (forest_runtime.py). To re-export an existing model without retraining:
+  python backend/train_stress_model.py --export-forest backend/models/stress_rf.joblib
+
 (This script currently only implements RandomForest; LightGBM can be added later.)
 """
 from __future__ import annotations
@@ -30,7 +34,9 @@ import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score, f1_score, balanced_accuracy_score
 from sklearn.model_selection import GroupKFold
-from joblib import dump
+from joblib import dump, load
+
+from forest_runtime import save_forest
 
 CALM_LABELS = {"calm", "baseline"}
 STRESSED_LABELS = {"stressed", "stress", "task"}
@@ -38,7 +44,7 @@ STRESSED_LABELS = {"stressed", "stress", "task"}
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Train stress classifier")
-    p.add_argument("--data-file", required=True,
+    p.add_argument("--data-file",
                    help="Labeled dataset (parquet or csv)")
     p.add_argument("--out-dir", default="backend/models",
                    help="Output directory for model + metadata")
@@ -46,7 +52,22 @@ def parse_args() -> argparse.Namespace:
                    help="Minimum label_confidence to include")
     p.add_argument("--n-estimators", type=int, default=400)
     p.add_argument("--random-state", type=int, default=42)
-    return p.parse_args()
+    p.add_argument("--export-forest", metavar="JOBLIB",
+                   help="Only write the flat forest export for an existing model (next to it), no training")
+    args = p.parse_args()
+    if not args.data_file and not args.export_forest:
+        p.error("--data-file is required")
+    return args
+
+
+def export_forest(model_path: Path, model=None) -> Path:
+    """Write <stem>_forest.npz next to the joblib model for forest_runtime.FlatForest."""
+    model = model if model is not None else load(model_path)
+    out = model_path.with_name(f"{model_path.stem}_forest.npz")
+    arrays = save_forest(model, str(out), source=str(model_path))
+    nodes = len(arrays["feature"])
+    print(f"Exported flat forest: {len(arrays['roots'])} trees, {nodes} nodes -> {out}")
+    return out
 
 
 def load_dataset(path: str) -> pd.DataFrame:
@@ -92,6 +113,9 @@ def select_features(df: pd.DataFrame) -> List[str]:
 
 def main():
     args = parse_args()
+    if args.export_forest:
+        export_forest(Path(args.export_forest))
+        return
     df = load_dataset(args.data_file)
 
     if "label" not in df.columns or "label_confidence" not in df.columns:
@@ -175,6 +199,7 @@ def main():
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     dump(rf, out_dir / "stress_rf.joblib")
+    export_forest(out_dir / "stress_rf.joblib", rf)
 
     meta = {
         "features": features,
@@ -0,0 +1,125 @@
+"""Columnar per-window frame buffer for ``MLDataAggregator``.
+
+Every per-frame value the window aggregation reads sits in one preallocated
+float64 matrix with a column per feature, stored column-major so each column
+is a contiguous slice. ``append`` turns a frame dict into a single row write,
+and aggregation reduces column slices instead of rebuilding lists from dicts.
+
+Presence masks are columns too. A frame counts for a modality exactly when the
+dict-based aggregation collected it:
+
+- ``face`` (facial and eye features): ``has_face`` and non-empty ``ml_features``;
+- ``pose`` (posture features): ``has_pose`` and non-empty ``ml_features``;
+- ``breathing``: non-empty breathing features, and the tracker calibrated or a bpm above 0.
+
+Missing values take the defaults those ``.get`` calls used. ``facial_keys`` and
+``posture_keys`` are bitmasks of the columns present in the frame's dict, in
+column order (``FeatureExtractor``'s key order), since movement intensity only
+looks at the keys of a window's first frame.
+
+Like the ``deque`` it replaces, the buffer keeps the newest ``capacity`` frames.
+Given ``stats`` (a ``window_stats.WindowStats``), it also feeds each row to
+them and clears them with the buffer.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from geometry_kernels import FACIAL_KEYS
+
+BREATHING_COLUMNS = ("bpm", "confidence", "variability")
+FACIAL_COLUMNS = (*FACIAL_KEYS, "jaw_width_deviation", "baseline_jaw_width")
+EYE_COLUMNS = ("left_eye_openness", "right_eye_openness", "eye_asymmetry", "avg_eye_openness")
+EYE_DEFAULTS = (1.0, 1.0, 0.0, 1.0)
+POSTURE_COLUMNS = ("shoulder_height_avg", "shoulder_asymmetry", "head_shoulder_distance", "shoulder_height_deviation",
+                   "baseline_shoulder_height", "left_shoulder_height", "right_shoulder_height")
+
+COLUMNS: Tuple[str, ...] = (
+    "timestamp", "face", "pose", "breathing", "facial_keys", "posture_keys",
+    *(f"breathing.{name}" for name in BREATHING_COLUMNS),
+    *(f"facial.{name}" for name in FACIAL_COLUMNS),
+    *(f"eye.{name}" for name in EYE_COLUMNS),
+    *(f"posture.{name}" for name in POSTURE_COLUMNS),
+)
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+_NO_BREATHING = (0.0,) * len(BREATHING_COLUMNS)
+_NO_FACE = (0.0,) * (len(FACIAL_COLUMNS) + len(EYE_COLUMNS))
+_NO_POSE = (0.0,) * len(POSTURE_COLUMNS)
+
+
+def _numeric_values(features: Dict[str, Any], columns: Tuple[str, ...]) -> Tuple[list, int]:
+    """The columns' values (0 when missing) and the bitmask of those present as numbers."""
+    values, keys = [], 0
+    for bit, name in enumerate(columns):
+        value = features.get(name, 0)
+        values.append(value)
+        if name in features and isinstance(value, (int, float)):
+            keys |= 1 << bit
+    return values, keys
+
+
+def present_columns(keys: int, columns: Tuple[str, ...]) -> Tuple[str, ...]:
+    """The column names set in a ``facial_keys``/``posture_keys`` bitmask."""
+    return tuple(name for bit, name in enumerate(columns) if keys >> bit & 1)
+
+
+class WindowColumns:
+    """The newest ``capacity`` frames, one row each, read back as per-column arrays (oldest first)."""
+
+    def __init__(self, capacity: int, stats: Optional[Any] = None):
+        self.capacity = int(capacity)
+        self.stats = stats
+        self._data = np.zeros((len(COLUMNS), self.capacity), dtype=np.float64)
+        self._next = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def clear(self) -> None:
+        self._next = 0
+        self._len = 0
+        if self.stats is not None:
+            self.stats.clear()
+
+    def append(self, frame: Dict[str, Any]) -> None:
+        ml_features = frame.get("ml_features", {})
+        has_face = bool(ml_features) and bool(frame.get("has_face", False))
+        has_pose = bool(ml_features) and bool(frame.get("has_pose", False))
+        bf = ml_features.get("breathing_features", {}) if ml_features else {}
+        has_breathing = bool(bf) and bool(frame.get("breathing", {}).get("calibrated", False) or bf.get("bpm", 0) > 0)
+        timestamp = frame.get("timestamp")
+
+        facial_keys = posture_keys = 0
+        row = [np.nan if timestamp is None else timestamp, has_face, has_pose, has_breathing, 0, 0]
+        row += [bf.get(name, 0) for name in BREATHING_COLUMNS] if has_breathing else _NO_BREATHING
+        if has_face:
+            facial, facial_keys = _numeric_values(ml_features.get("facial_features", {}), FACIAL_COLUMNS)
+            eye = ml_features.get("eye_features", {})
+            row += facial
+            row += [eye.get(name, default) for name, default in zip(EYE_COLUMNS, EYE_DEFAULTS)]
+        else:
+            row += _NO_FACE
+        if has_pose:
+            posture, posture_keys = _numeric_values(ml_features.get("posture_features", {}), POSTURE_COLUMNS)
+            row += posture
+        else:
+            row += _NO_POSE
+        row[4], row[5] = facial_keys, posture_keys
+
+        self._data[:, self._next] = row
+        if self.stats is not None:
+            self.stats.update(self._data[:, self._next])
+        self._next = (self._next + 1) % self.capacity
+        self._len = min(self._len + 1, self.capacity)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Every column over the buffered frames, oldest first (views unless the buffer has wrapped)."""
+        if self._len < self.capacity or self._next == 0:
+            data = self._data[:, :self._len]
+        else:
+            data = np.concatenate((self._data[:, self._next:], self._data[:, :self._next]), axis=1)
+        return {name: data[i] for i, name in enumerate(COLUMNS)}
@@ -0,0 +1,440 @@
+"""Streaming accumulators for ``MLDataAggregator``'s online window statistics.
+
+With ``WINDOW_STATS=online`` the aggregator feeds every buffered frame to a
+``WindowStats``, so closing a window reads finished statistics instead of
+reducing every frame. The work to close a window then stays the same however
+long the window is:
+
+- ``Moments``: Welford mean/variance, min/max and the least-squares slope
+  against sample index, for many channels at once;
+- ``CoMoments``: means and co-moments of a few paired series, for correlations;
+- ``QuantileSketch``: mergeable log-bucket histogram for medians,
+  percentiles and threshold counts that depend on the window's own values;
+- ``WindowStats``: the channels, counters, pairings and sketches the window
+  features read, built from ``WindowColumns`` rows.
+
+Rows are folded in ``BLOCK`` at a time: each block's moments are computed with
+numpy and merged into the running ones (Chan et al.'s pairwise update), which
+costs far less per frame than a per-row update in Python. Closing a window
+folds the at most ``BLOCK - 1`` rows still pending.
+
+Over the same frames, moments, slopes, correlations and fixed-threshold counts
+match the exact computation up to float rounding. Sketch-derived values are
+approximate (see ``QuantileSketch``), and so are the values derived from them:
+median and IQR, the BPM mode and spike count, jaw tension and low-openness
+episodes, and the smile/frown frequencies (median and MAD from the sketch).
+
+The frames are not always the same, though. The accumulators cover every frame
+since the last clear, while the exact buffer keeps only the newest
+``capacity``. They cannot drop the oldest rows afterwards: the correlations
+pair series by position, and the slopes, movement sums and the curvature's
+trailing mean depend on order.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from window_columns import COLUMN_INDEX, COLUMNS, FACIAL_COLUMNS, POSTURE_COLUMNS, present_columns
+
+BLOCK = 32
+
+# (name, source column, modality flag column, counts only values above 0)
+CHANNELS = (
+    ("bpm", "breathing.bpm", "breathing", True),
+    ("confidence", "breathing.confidence", "breathing", False),
+    ("variability", "breathing.variability", "breathing", False),
+    ("jaw_width", "facial.jaw_width", "face", True),
+    ("mouth_curvature", "facial.mouth_curvature", "face", False),
+    ("positive_mouth_curvature", "facial.mouth_curvature", "face", True),
+    ("eyebrow_height", "facial.eyebrow_height", "face", True),
+    ("eye_openness", "eye.left_eye_openness", "face", False),  # (left + right) / 2, set in _fold
+    ("eye_asymmetry", "eye.eye_asymmetry", "face", False),
+    ("eye_openness_difference", "eye.left_eye_openness", "face", False),  # |left - right|, set in _fold
+    ("shoulder_height", "posture.shoulder_height_avg", "pose", True),
+    ("shoulder_asymmetry", "posture.shoulder_asymmetry", "pose", False),
+    ("head_distance", "posture.head_shoulder_distance", "pose", True),
+)
+CHANNEL_INDEX = {name: i for i, (name, *_) in enumerate(CHANNELS)}
+# Fixed thresholds counted exactly: values below / above them, per channel
+BELOW = {"bpm": 12.0, "eyebrow_height": 0.3, "head_distance": 0.1}
+ABOVE = {"bpm": 20.0, "eye_asymmetry": 0.05, "shoulder_asymmetry": 0.03}
+
+_FLAGS = [COLUMN_INDEX[name] for name in ("breathing", "face", "pose")]
+_SOURCES = [COLUMN_INDEX[source] for _, source, _, _ in CHANNELS]
+_GROUPS = np.array([("breathing", "face", "pose").index(flag) for _, _, flag, _ in CHANNELS])
+_ANY_VALUE = np.array([not positive for *_, positive in CHANNELS])
+_BELOW = np.array([BELOW.get(name, np.nan) for name, *_ in CHANNELS])
+_ABOVE = np.array([ABOVE.get(name, np.nan) for name, *_ in CHANNELS])
+_EYE_OPENNESS, _EYE_DIFFERENCE = CHANNEL_INDEX["eye_openness"], CHANNEL_INDEX["eye_openness_difference"]
+_FACIAL = slice(COLUMN_INDEX[f"facial.{FACIAL_COLUMNS[0]}"], COLUMN_INDEX[f"facial.{FACIAL_COLUMNS[-1]}"] + 1)
+_POSTURE = slice(COLUMN_INDEX[f"posture.{POSTURE_COLUMNS[0]}"], COLUMN_INDEX[f"posture.{POSTURE_COLUMNS[-1]}"] + 1)
+
+
+class Moments:
+    """Count, mean, variance, min/max and slope against sample index of ``k`` channels, merged a batch at a time."""
+
+    def __init__(self, k: int):
+        self.n = np.zeros(k)
+        self.mean = np.zeros(k)
+        self._m2 = np.zeros(k)
+        self._cxy = np.zeros(k)  # co-moment of sample index and value
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    def update(self, x: np.ndarray, mask: np.ndarray) -> None:
+        """Add the samples ``x[:, i]`` where ``mask[:, i]`` to channel ``i``, in row order."""
+        nb = mask.sum(axis=0)
+        if not nb.any():
+            return
+        na, n = self.n, self.n + nb
+        safe_nb, safe_n = np.maximum(nb, 1), np.maximum(n, 1)
+        mean_b = np.where(mask, x, 0.0).sum(axis=0) / safe_nb
+        dev = np.where(mask, x - mean_b, 0.0)
+        # Sample indices continue from the running count; the batch's mean index is na + (nb - 1) / 2
+        index_dev = np.where(mask, np.cumsum(mask, axis=0) - 1 - (nb - 1) / 2.0, 0.0)
+        delta = mean_b - self.mean
+        weight = na * nb / safe_n
+        self.mean += delta * nb / safe_n
+        self._m2 += (dev * dev).sum(axis=0) + delta * delta * weight
+        # The batch's mean index sits n / 2 above the running one
+        self._cxy += (index_dev * dev).sum(axis=0) + (n / 2.0) * delta * weight
+        self.n = n
+        np.minimum(self.min, np.where(mask, x, np.inf).min(axis=0), out=self.min)
+        np.maximum(self.max, np.where(mask, x, -np.inf).max(axis=0), out=self.max)
+
+    def std(self) -> np.ndarray:
+        """Population standard deviation (``np.std``)."""
+        return np.sqrt(self._m2 / np.maximum(self.n, 1.0))
+
+    def slope(self) -> np.ndarray:
+        """Least-squares slope of value against sample index; 0 below 3 samples like ``_calculate_trend``."""
+        n = self.n
+        sxx = n * (n * n - 1.0) / 12.0
+        return np.divide(self._cxy, sxx, out=np.zeros_like(n), where=n >= 3)
+
+
+class CoMoments:
+    """Means and co-moment matrix of ``k`` series sampled together, merged a batch at a time."""
+
+    def __init__(self, k: int):
+        self.n = 0
+        self.mean = np.zeros(k)
+        self._c = np.zeros((k, k))
+
+    def update(self, x: np.ndarray) -> None:
+        """Add the rows of ``x`` (one sample of every series per row)."""
+        nb = len(x)
+        if not nb:
+            return
+        mean_b = x.mean(axis=0)
+        dev = x - mean_b
+        delta = mean_b - self.mean
+        n = self.n + nb
+        self._c += dev.T @ dev + np.outer(delta, delta) * (self.n * nb / n)
+        self.mean += delta * nb / n
+        self.n = n
+
+    def corrcoef(self) -> np.ndarray:
+        """Pearson correlations like ``np.corrcoef``: NaN where a series is constant."""
+        scale = np.sqrt(np.diag(self._c))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.clip(self._c / np.outer(scale, scale), -1.0, 1.0)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error ``accuracy`` (DDSketch-style log buckets).
+
+    A value lands in the bucket ``ceil(log_gamma |v|)`` for ``gamma = (1 + a) / (1 - a)``
+    and is read back as the bucket's midpoint, within ``a * |v|`` of it. Values closer to 0
+    than ``min_value`` share one bucket. Quantiles interpolate between ranks like
+    ``np.percentile``; counts against a threshold can miss the values sharing its bucket. Queries search a sorted table of the buckets, built
+    once after each change: its size is bounded by the value range, not the number of values.
+    """
+
+    __slots__ = ("accuracy", "min_value", "count", "zero", "_bins", "_log_gamma", "_gamma", "_table")
+
+    def __init__(self, accuracy: float = 0.002, min_value: float = 1e-9):
+        if not 0.0 < accuracy < 1.0:
+            raise ValueError(f"QuantileSketch accuracy must be in (0, 1), got {accuracy}")
+        self.accuracy = accuracy
+        self.min_value = min_value
+        self._gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.count = 0
+        self.zero = 0
+        self._bins: Dict[int, int] = {}  # 2 * bucket + 1 if negative -> count
+        self._table: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def add(self, values: np.ndarray) -> None:
+        """Add every value in ``values``."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        self._table = None
+        self.count += len(values)
+        magnitude = np.abs(values)
+        kept = magnitude > self.min_value
+        bins = 2 * np.ceil(np.log(magnitude[kept]) / self._log_gamma).astype(np.int64) + (values[kept] < 0)
+        self.zero += len(values) - len(bins)
+        counts = self._bins
+        for key in bins.tolist():
+            counts[key] = counts.get(key, 0) + 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Add ``other``'s values (same ``accuracy``), as if they had been added here."""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Can only merge QuantileSketches of the same accuracy")
+        self._table = None
+        self.count += other.count
+        self.zero += other.zero
+        for key, n in other._bins.items():
+            self._bins[key] = self._bins.get(key, 0) + n
+
+    def _buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Bucket values, ascending, and the number of values up to and including each."""
+        if self._table is None:
+            keys = np.fromiter(self._bins, dtype=np.int64, count=len(self._bins))
+            counts = np.fromiter(self._bins.values(), dtype=np.int64, count=len(self._bins))
+            values = np.where(keys & 1, -1.0, 1.0) * (2.0 / (self._gamma + 1.0)) * self._gamma ** (keys >> 1).astype(np.float64)
+            if self.zero:
+                values, counts = np.append(values, 0.0), np.append(counts, self.zero)
+            order = np.argsort(values)
+            self._table = values[order], np.cumsum(counts[order])
+        return self._table
+
+    @staticmethod
+    def _interpolate(values: np.ndarray, cumulative: np.ndarray, rank: float) -> float:
+        """The value at fractional ``rank`` (0-based) of sorted ``values``, interpolated like ``np.percentile``."""
+        lo = math.floor(rank)
+        i, j = np.searchsorted(cumulative, (lo, lo + 1), side="right").clip(max=len(values) - 1)
+        return float(values[i] + (rank - lo) * (values[j] - values[i]))
+
+    def quantile(self, q: float) -> float:
+        """Approximate ``q``-quantile (0 to 1); NaN when empty."""
+        if not self.count:
+            return float("nan")
+        values, cumulative = self._buckets()
+        return self._interpolate(values, cumulative, q * (self.count - 1))
+
+    def mad(self, center: float) -> float:
+        """Approximate median absolute deviation from ``center``; NaN when empty."""
+        if not self.count:
+            return float("nan")
+        values, cumulative = self._buckets()
+        deviation = np.abs(values - center)
+        order = np.argsort(deviation, kind="stable")
+        cumulative = np.cumsum(np.diff(cumulative, prepend=0)[order])
+        return self._interpolate(deviation[order], cumulative, 0.5 * (self.count - 1))
+
+    def count_below(self, threshold: float) -> int:
+        """Approximate number of values below ``threshold``."""
+        values, cumulative = self._buckets()
+        i = np.searchsorted(values, threshold, side="left")
+        return int(cumulative[i - 1]) if i else 0
+
+    def count_above(self, threshold: float) -> int:
+        """Approximate number of values above ``threshold``."""
+        values, cumulative = self._buckets()
+        i = np.searchsorted(values, threshold, side="right")
+        return self.count - (int(cumulative[i - 1]) if i else 0)
+
+
+class WindowStats:
+    """Everything the window features read, accumulated from ``WindowColumns`` rows.
+
+    ``update`` only stores the row; every ``BLOCK`` rows, and on ``flush``, they are
+    folded into the accumulators. Read the statistics after ``flush``.
+
+    Series the exact aggregation pairs by position (the i-th positive BPM with the
+    i-th positive jaw width and i-th eye openness; the i-th breathing frame with the
+    i-th face frame) are paired here as they arrive, holding back the unpaired tail.
+    """
+
+    def __init__(self, accuracy: float = 0.002):
+        self.accuracy = accuracy
+        self._block = np.empty((BLOCK, len(COLUMNS)))
+        self.clear()
+
+    def clear(self) -> None:
+        self.frames = 0
+        self._pending_rows = 0
+        self.timestamp_start = self.timestamp_end = float("nan")
+        self.counts = np.zeros(3)  # breathing, face, pose frames
+        self.moments = Moments(len(CHANNELS))
+        self.below = np.zeros(len(CHANNELS))
+        self.above = np.zeros(len(CHANNELS))
+        self.bpm_first: List[float] = []  # first two and last two positive BPMs, for the acceleration
+        self.bpm_last: List[float] = []
+        self.sketches = {name: QuantileSketch(self.accuracy) for name in ("bpm", "jaw_width", "eye_openness", "curvature")}
+        # Mouth curvature over jaw width, smoothed by a trailing mean of 5 (``_aggregate_facial``): the last 5 unsmoothed
+        self.recent_curvature = np.zeros(0)
+        self.facial_keys = self.posture_keys = 0
+        self.facial_movement = np.zeros(len(FACIAL_COLUMNS))
+        self.posture_movement = np.zeros(len(POSTURE_COLUMNS))
+        self._last_facial: Optional[np.ndarray] = None
+        self._last_posture: Optional[np.ndarray] = None
+        # behavioral_patterns: positive BPM, positive jaw width, eye openness
+        self._unpaired = (np.zeros(0), np.zeros(0), np.zeros(0))
+        self.patterns = CoMoments(3)
+        self.pattern_steps = Moments(3)
+        self._last_pattern: Optional[np.ndarray] = None
+        # stress_response_coordination: BPM per breathing frame, (jaw width, eye openness) per face frame
+        self._stress_unpaired = (np.zeros(0), np.zeros((0, 2)))
+        self.stress_frames = 0
+        self.coordinated_frames = 0
+
+    def update(self, row: np.ndarray) -> None:
+        """Add one frame, given as its ``WindowColumns`` row."""
+        self._block[self._pending_rows] = row
+        self._pending_rows += 1
+        self.frames += 1
+        if self._pending_rows == BLOCK:
+            self.flush()
+
+    def flush(self) -> None:
+        """Fold the stored rows into the accumulators."""
+        if self._pending_rows:
+            rows, self._pending_rows = self._block[:self._pending_rows], 0
+            self._fold(rows)
+
+    def _fold(self, rows: np.ndarray) -> None:
+        timestamps = rows[:, COLUMN_INDEX["timestamp"]]
+        if math.isnan(self.timestamp_start):
+            self.timestamp_start = float(timestamps[0])
+        self.timestamp_end = float(timestamps[-1])
+        flags = rows[:, _FLAGS] > 0
+        self.counts += flags.sum(axis=0)
+        breathing, face, pose = flags.T
+
+        x = rows[:, _SOURCES]
+        left, right = rows[:, COLUMN_INDEX["eye.left_eye_openness"]], rows[:, COLUMN_INDEX["eye.right_eye_openness"]]
+        x[:, _EYE_OPENNESS] = (left + right) / 2
+        x[:, _EYE_DIFFERENCE] = np.abs(left - right)
+        mask = flags[:, _GROUPS] & (_ANY_VALUE | (x > 0))
+        self.moments.update(x, mask)
+        self.below += (mask & (x < _BELOW)).sum(axis=0)
+        self.above += (mask & (x > _ABOVE)).sum(axis=0)
+
+        bpm_all = rows[breathing, COLUMN_INDEX["breathing.bpm"]]
+        bpm = bpm_all[bpm_all > 0]
+        if len(bpm):
+            self.sketches["bpm"].add(bpm)
+            self.bpm_first = (self.bpm_first + bpm[:2].tolist())[:2]
+            self.bpm_last = (self.bpm_last + bpm[-2:].tolist())[-2:]
+
+        face_rows = rows[face]
+        jaw_width = face_rows[:, COLUMN_INDEX["facial.jaw_width"]]
+        jaw_positive = jaw_width[jaw_width > 0]
+        eye_openness = x[face, _EYE_OPENNESS]
+        if len(face_rows):
+            self.sketches["eye_openness"].add(eye_openness)
+            self.sketches["jaw_width"].add(jaw_positive)
+            self._fold_curvature(face_rows[:, COLUMN_INDEX["facial.mouth_curvature"]], jaw_width)
+            if self._last_facial is None:
+                self.facial_keys = int(face_rows[0, COLUMN_INDEX["facial_keys"]])
+            self.facial_movement += self._movement(self._last_facial, face_rows[:, _FACIAL])
+            self._last_facial = face_rows[-1, _FACIAL].copy()
+        pose_rows = rows[pose]
+        if len(pose_rows):
+            if self._last_posture is None:
+                self.posture_keys = int(pose_rows[0, COLUMN_INDEX["posture_keys"]])
+            self.posture_movement += self._movement(self._last_posture, pose_rows[:, _POSTURE])
+            self._last_posture = pose_rows[-1, _POSTURE].copy()
+
+        self._pair_patterns(bpm, jaw_positive, eye_openness)
+        self._pair_stress(bpm_all, np.column_stack((jaw_width, face_rows[:, COLUMN_INDEX["eye.avg_eye_openness"]])))
+
+    def _fold_curvature(self, curvature: np.ndarray, jaw_width: np.ndarray) -> None:
+        norm_curv = np.divide(curvature, jaw_width + 1e-6, out=np.zeros(len(curvature)), where=jaw_width > 0)
+        history = np.concatenate((self.recent_curvature[-4:], norm_curv))
+        sums = np.concatenate(([0.0], np.cumsum(history)))
+        end = np.arange(len(history) - len(norm_curv), len(history)) + 1
+        start = np.maximum(0, end - 5)
+        self.sketches["curvature"].add((sums[end] - sums[start]) / (end - start))
+        self.recent_curvature = history[-5:]
+
+    @staticmethod
+    def _movement(last: Optional[np.ndarray], values: np.ndarray) -> np.ndarray:
+        """Summed absolute frame-to-frame change per column, continuing from the previous block's last row."""
+        if last is not None:
+            values = np.vstack((last, values))
+        return np.abs(np.diff(values, axis=0)).sum(axis=0)
+
+    def _pair_patterns(self, bpm: np.ndarray, jaw_width: np.ndarray, eye_openness: np.ndarray) -> None:
+        series = [np.concatenate((unpaired, new)) for unpaired, new in zip(self._unpaired, (bpm, jaw_width, eye_openness))]
+        n = min(len(s) for s in series)
+        self._unpaired = tuple(s[n:] for s in series)
+        if not n:
+            return
+        patterns = np.column_stack([s[:n] for s in series])
+        self.patterns.update(patterns)
+        steps = np.diff(patterns if self._last_pattern is None else np.vstack((self._last_pattern, patterns)), axis=0)
+        self.pattern_steps.update(steps, np.ones(steps.shape, dtype=bool))
+        self._last_pattern = patterns[-1]
+
+    def _pair_stress(self, bpm: np.ndarray, face: np.ndarray) -> None:
+        bpm = np.concatenate((self._stress_unpaired[0], bpm))
+        face = np.concatenate((self._stress_unpaired[1], face))
+        n = min(len(bpm), len(face))
+        self._stress_unpaired = (bpm[n:], face[n:])
+        stress = (bpm[:n] > 24).astype(int) + (face[:n, 0] < 0.08) + (face[:n, 1] < 0.02)
+        self.stress_frames += n
+        self.coordinated_frames += int(np.count_nonzero(stress >= 2))
+
+    def count(self, channel: str) -> int:
+        return int(self.moments.n[CHANNEL_INDEX[channel]])
+
+    def mean(self, channel: str) -> float:
+        return self.moments.mean[CHANNEL_INDEX[channel]]
+
+    def std(self, channel: str) -> float:
+        return self.moments.std()[CHANNEL_INDEX[channel]]
+
+    def slope(self, channel: str) -> float:
+        return self.moments.slope()[CHANNEL_INDEX[channel]]
+
+    def min(self, channel: str) -> float:
+        return self.moments.min[CHANNEL_INDEX[channel]]
+
+    def max(self, channel: str) -> float:
+        return self.moments.max[CHANNEL_INDEX[channel]]
+
+    def count_below(self, channel: str) -> int:
+        """Values below the channel's ``BELOW`` threshold."""
+        return int(self.below[CHANNEL_INDEX[channel]])
+
+    def count_above(self, channel: str) -> int:
+        """Values above the channel's ``ABOVE`` threshold."""
+        return int(self.above[CHANNEL_INDEX[channel]])
+
+    def bpm_acceleration(self) -> float:
+        """Mean second difference of the positive BPMs: it telescopes to the two ends."""
+        n = self.count("bpm")
+        if n < 3:
+            return 0.0
+        (a, b), (y, z) = self.bpm_first, self.bpm_last
+        return ((z - y) - (b - a)) / (n - 2)
+
+    def bpm_mode(self) -> float:
+        """Left edge of the fullest of 10 equal bins between the min and max BPM, like ``_calculate_mode``."""
+        sketch = self.sketches["bpm"]
+        lo, hi = self.min("bpm"), self.max("bpm")
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges = np.linspace(lo, hi, 11)
+        below = [sketch.count_below(edge) for edge in edges[1:-1]] + [sketch.count]
+        return edges[int(np.argmax(np.diff(below, prepend=0)))]
+
+    def movement_intensity(self, modality: str) -> float:
+        """Summed frame-to-frame change per feature of the modality's first frame ("facial" or "posture")."""
+        if modality == "facial":
+            frames, keys, columns, movement = self.counts[1], self.facial_keys, FACIAL_COLUMNS, self.facial_movement
+        else:
+            frames, keys, columns, movement = self.counts[2], self.posture_keys, POSTURE_COLUMNS, self.posture_movement
+        present = present_columns(keys, columns)
+        if frames < 2 or not present:
+            return 0.0
+        return float(sum(movement[columns.index(name)] for name in present)) / len(present)